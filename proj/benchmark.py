@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+import numpy as np
+from decode import Decoder
+from encode import Encoder
+from utils.DNAFountain import DNAFountain
+from utils.glass import Glass, correct_message
+from utils.misc import process_raw_input
+from utils import codec
+from utils import scr_rept as sr
+
+# settings of the benchmarked codes: the course project setting (main.py) and two larger payloads
+CONFIGS = {
+    "sf4": dict(chunk_size=4, rs=2, gc=0.05, max_homopolymer=3, delta=0.001, c_dist=0.025),
+    "c32": dict(chunk_size=32, rs=4, gc=0.1, max_homopolymer=4, delta=0.05, c_dist=0.1),
+    "c128": dict(chunk_size=128, rs=8, gc=0.2, max_homopolymer=4, delta=0.05, c_dist=0.1),
+}
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+# results of a default run, committed so every run is compared with it; refresh it with --output when a change
+# is meant to make a stage slower, or when the benchmarks move to another machine
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+def parse_size(text: str) -> int:
+    """
+    number of bytes of a size like 4K, 256M or 1000
+    """
+    text = text.upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def timed(func: Callable[[], Any], repeat: int) -> float:
+    """
+    the best wall time of repeat calls
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_input(directory: str, size: int) -> str:
+    path = os.path.join(directory, "input_{}.bin".format(size))
+    rng = np.random.default_rng(size)
+    with open(path, "wb") as file:
+        # written in slices so hundreds of MB never sit in memory
+        for start in range(0, size, 1 << 24):
+            file.write(rng.integers(0, 256, min(1 << 24, size - start), dtype=np.uint8).tobytes())
+    return path
+
+
+def bench_stages(
+    path: str, config: Dict[str, Any], samples: int, repeat: int, max_peel_chunks: int
+) -> Dict[str, Dict[str, float]]:
+    """
+    time every stage of the encoder and the decoder on the file for one setting
+    :return
+    stage -> seconds and number of items of the best run; type: dict
+    """
+    fountain_args = dict(config, alpha=0.1)
+    glass_args = dict(
+        rs=config["rs"],
+        c_dist=config["c_dist"],
+        delta=config["delta"],
+        gc=config["gc"],
+        max_homopolymer=config["max_homopolymer"],
+        max_hamming=config["rs"],
+        chunk_size=config["chunk_size"],
+    )
+    results: Dict[str, Dict[str, float]] = dict()
+
+    def record(stage: str, func: Callable[[], Any], items: int) -> None:
+        results[stage] = dict(seconds=timed(func, repeat), items=items)
+
+    record("process_raw_input", lambda: process_raw_input(path, config["chunk_size"]), 1)
+    fountain = DNAFountain(path, **fountain_args)
+    num_chunks = fountain.num_chunks
+
+    record("next_seeds", lambda: fountain.next_seeds(samples), samples)
+    record("droplet", lambda: fountain.droplets(samples), samples)
+    droplets = fountain.droplets(samples)
+
+    def to_dna():
+        for droplet in droplets:
+            droplet.dna = None
+            droplet.to_dna()
+
+    record("to_dna", to_dna, samples)
+    record(
+        "screen_repeat",
+        lambda: [sr.screen_repeat(d, config["max_homopolymer"], config["gc"]) for d in droplets],
+        samples,
+    )
+    record("screen_batch", lambda: fountain.screen_batch(fountain.droplets(samples)), samples)
+
+    messages = [d.to_message() for d in droplets]
+    if config["rs"] > 0:
+        plain = [m[: len(m) - config["rs"]] for m in messages]
+        record("rs_encode", lambda: [fountain.rs_obj.encode(m) for m in plain], samples)
+        # one corrupted byte per read, so every read goes through the full RS decoder
+        noisy = [list(m) for m in messages]
+        for data in noisy:
+            data[len(data) // 2] ^= 0x5A
+        record(
+            "rs_decode",
+            lambda: [correct_message(fountain.rs_obj, data, config["rs"]) for data in noisy],
+            samples,
+        )
+
+    glass = Glass(num_chunks, **glass_args)
+    reads = [d.to_readable_dna() for d in droplets]
+    record("_dna_to_int_arr", lambda: [glass._dna_to_int_arr(dna) for dna in reads], samples)
+    record("reads_to_bytes", lambda: codec.reads_to_bytes(reads), samples)
+
+    if num_chunks <= max_peel_chunks:
+        # enough droplets for belief propagation to finish most of the time, the rest is left to solve()
+        pool = fountain.droplets(int(num_chunks * 1.3) + 64)
+        records = [(d.seed, d.data, sorted(d.num_chunks), True) for d in pool]
+
+        def peel():
+            glass = Glass(num_chunks, **glass_args)
+            for rec in records:
+                glass.add_record(*rec)
+                if glass.is_done():
+                    break
+            glass.solve()
+
+        record("peeling", peel, num_chunks)
+    return results
+
+
+def bench_decode_workers(
+    directory: str, path: str, config: Dict[str, Any], workers: List[int], repeat: int
+) -> Dict[str, Dict[str, float]]:
+    """
+    time whole decodes of an encoded copy of the file with every number of worker processes, and the CPU time of
+    the main process (peeling, which does not run in the workers): the decode cannot be faster than the latter
+    :return
+    stage -> seconds and number of lines decoded of the best run; type: dict
+    """
+    oligos = os.path.join(directory, "oligos.txt")
+    Encoder(path, oligos, oligos_per_chunk=5, **config).encode()
+    decoder_args = dict(
+        chunk_num=-(-os.path.getsize(path) // config["chunk_size"]),
+        header_size=4,
+        rs=config["rs"],
+        delta=config["delta"],
+        c_dist=config["c_dist"],
+        gc=config["gc"],
+        max_homopolymer=config["max_homopolymer"],
+        max_hamming=config["rs"],
+        chunk_size=config["chunk_size"],
+    )
+    results: Dict[str, Dict[str, float]] = dict()
+    for n in workers:
+        best = None
+        for _ in range(repeat):
+            decoder = Decoder(oligos, os.path.join(directory, "decoded"), workers=n, **decoder_args)
+            start, cpu = time.perf_counter(), time.process_time()
+            decoder.decode()
+            run = (time.perf_counter() - start, time.process_time() - cpu, decoder.line)
+            best = run if best is None or run[0] < best[0] else best
+        results["decode_workers_{}".format(n)] = dict(seconds=best[0], items=best[2])
+        results["decode_workers_{}_main_cpu".format(n)] = dict(seconds=best[1], items=best[2])
+    os.remove(oligos)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(
+    sizes: List[int],
+    configs: List[str],
+    samples: int,
+    repeat: int,
+    max_peel_chunks: int,
+    decode_workers: List[int] = (),
+) -> Dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = make_input(directory, size)
+            for name in configs:
+                stages = bench_stages(path, CONFIGS[name], samples, repeat, max_peel_chunks)
+                if decode_workers:
+                    stages.update(bench_decode_workers(directory, path, CONFIGS[name], decode_workers, repeat))
+                for stage, value in stages.items():
+                    results.append(
+                        dict(
+                            size=size,
+                            config=name,
+                            stage=stage,
+                            seconds=value["seconds"],
+                            items=value["items"],
+                            us_per_item=value["seconds"] / value["items"] * 1e6,
+                        )
+                    )
+                    print(
+                        "{:>12} {:>5} {:<18} {:>12.3f} us/item".format(
+                            size, name, stage, results[-1]["us_per_item"]
+                        )
+                    )
+                for n in decode_workers:
+                    serial = stages["decode_workers_{}".format(decode_workers[0])]["seconds"]
+                    print(
+                        "{:>12} {:>5} speedup with {} workers x{:.2f}, at most x{:.2f} (main process)".format(
+                            size,
+                            name,
+                            n,
+                            serial / stages["decode_workers_{}".format(n)]["seconds"],
+                            serial / stages["decode_workers_{}_main_cpu".format(n)]["seconds"],
+                        )
+                    )
+            # large inputs are not kept around for the next size
+            os.remove(path)
+    return dict(
+        meta=dict(
+            commit=git_commit(),
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            cpus=os.cpu_count(),
+            samples=samples,
+            repeat=repeat,
+        ),
+        results=results,
+    )
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_seconds: float = 0.05
+) -> List[Dict[str, Any]]:
+    """
+    the stages that got slower than the baseline by more than the tolerance (0.2 means 20%).
+    Stages the baseline ran in less than min_seconds are mostly timer noise, they are not compared.
+    """
+    base = {(r["size"], r["config"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        old = base.get((r["size"], r["config"], r["stage"]))
+        if old is None or old["seconds"] < min_seconds:
+            continue
+        ratio = r["us_per_item"] / old["us_per_item"]
+        if ratio > 1 + tolerance:
+            regressions.append(dict(r, baseline_us_per_item=old["us_per_item"], ratio=ratio))
+    return regressions
+
+
+def get_opts() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Benchmark the stages of the encoder and the decoder")
+    ap.add_argument("--sizes", nargs="+", default=["4K", "256K", "4M"], help="input sizes, e.g. 4K 1M 256M")
+    ap.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS), help="code settings")
+    ap.add_argument("--samples", default=4096, type=int, help="droplets / reads timed per stage")
+    ap.add_argument("--repeat", default=3, type=int, help="runs per stage, the best one is kept")
+    ap.add_argument("--max_peel_chunks", default=200000, type=int, help="skip peeling for larger inputs")
+    ap.add_argument(
+        "--decode_workers", nargs="*", default=[], type=int, help="also time whole decodes with these numbers of workers, e.g. 1 2 4"
+    )
+    ap.add_argument("--output", default=None, type=str, help="write the results as JSON")
+    ap.add_argument("--baseline", default=BASELINE, type=str, help="JSON results to compare with, 'none' to skip")
+    ap.add_argument("--tolerance", default=0.2, type=float, help="allowed slowdown against the baseline")
+    return ap.parse_args()
+
+
+def main():
+    args = get_opts()
+    report = run(
+        [parse_size(s) for s in args.sizes],
+        args.configs,
+        args.samples,
+        args.repeat,
+        args.max_peel_chunks,
+        args.decode_workers,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    if args.baseline != "none":
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        meta = baseline["meta"]
+        print(
+            "Baseline {}: commit {}, python {}, {} with {} cpus".format(
+                args.baseline, meta["commit"], meta["python"], meta["machine"], meta["cpus"]
+            )
+        )
+        regressions = compare(report, baseline, args.tolerance)
+        for r in regressions:
+            print(
+                "REGRESSION {size} {config} {stage}: {us_per_item:.3f} us/item, baseline {baseline_us_per_item:.3f} (x{ratio:.2f})".format(
+                    **r
+                )
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,24 @@
+import asyncio
+import contextlib
+import hashlib
+import itertools
 import logging
 import os
-from collections import defaultdict
+import sys
+from collections import deque
+from collections.abc import AsyncIterable
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Union
+import numpy as np
 from utils.glass import Glass
+from utils.segmented import BLOCK_ID_SIZE, SegmentedGlass
+from utils import archive, checkpoint, cluster, codec, merge, metrics, parallel, pool, reads, stream, verify
+
+# reads per task of a worker process
+WORKER_BATCH = 1 << 13
+# bytes hashed into a checkpoint for an input whose byte offset is not tracked (a pool, sequencer output, merged
+# or clustered reads), to tell a rewritten input file from the one it was saved for
+CHECKPOINT_PREFIX = 1 << 20
 
 
 class Decoder:
@@ -18,10 +35,25 @@ class Decoder:
         max_homopolymer=4,
         max_hamming=100,
         chunk_size=32,
+        batch_size=1024,
+        workers=1,
+        prng_cache: str = None,
+        block_chunks: int = None,
+        checkpoint_file: str = None,
+        checkpoint_every: int = 100000,
+        oligo_len: int = None,
+        min_quality: float = None,
+        cluster_window: int = None,
+        input_file2: str = None,
+        metrics_file: str = None,
+        metrics_format="json",
+        metrics_every: float = None,
+        profile_interval: float = None,
+        checksum_file: str = None,
     ):
         """
-        input_file: file to decode; type = str
-        output_file: output file; type = str
+        input_file: file to decode, "-" for reads on stdin, one per line; type = str
+        output_file: output file, "-" for stdout; type = str
         chunk_num: the total number of chunks in the file; type = int
         header_size: number of bytes for the header; type = int
         rs: number of bytes for rs codes; type = int
@@ -31,12 +63,39 @@ class Decoder:
         max_homopolymer: the largest number of nt in a homopolymer; type = int
         max_hamming: How many differences between sequenced DNA and corrected DNA to tolerate; type = int
         chunk_size: The number of bytes of the data payload in each DNA string; type = int
+        batch_size: number of lines converted to bytes at once; type = int
+        workers: number of processes parsing and error correcting batches of reads; type = int
+        prng_cache: directory of the on-disk seed -> neighbours cache, so repeated decodes of a pool skip the PRNG; type = str
+        block_chunks: the block size the file was segmented with by the encoder, None for a single fountain; type = int
+        checkpoint_file: file the decoding state is saved to, and resumed from if it exists; type = str
+        checkpoint_every: number of lines between two checkpoints; type = int
+        oligo_len: number of nt FASTQ/FASTA reads are trimmed to, None for the length the encoder writes; type = int
+        min_quality: the lowest mean Phred quality of a FASTQ read to decode, None to decode all reads; type = float
+        cluster_window: cluster this many reads at a time and decode one consensus per cluster, None to decode every read; type = int
+        input_file2: R2 FASTQ file of paired-end reads, merged with the R1 reads of input_file; type = str
+        metrics_file: file the counters, histograms and timers of the run are written to, None to disable them.
+            With workers > 1 the per-read rejection reasons are counted in the workers and not exported; type = str
+        metrics_format: "json" or "prometheus"; type = str
+        metrics_every: seconds between two writes of the metrics during the run, None to write them only at the end; type = float
+        profile_interval: seconds between two samples of the sampling profiler, None to disable it; type = float
+        checksum_file: .npy file of the CRC32 of every solved chunk, updated during the decode
+            so it can be checked against the original file with verify.verify_checksums; type = str
         """
         logging.basicConfig(level=logging.DEBUG)
-        if not os.path.exists(input_file):
-            logging.error("{input_file} file not found")
+        if input_file != stream.STDIO and not os.path.exists(input_file):
+            logging.error(f"{input_file} file not found")
+            exit(1)
+        if output_file == stream.STDIO and block_chunks is not None:
+            logging.error("finished blocks are written at their offset, not to stdout")
+            exit(1)
+        if checksum_file is not None and block_chunks is not None:
+            logging.error("chunk checksums are not kept for a segmented file")
+            exit(1)
+        if input_file2 is not None and not os.path.exists(input_file2):
+            logging.error(f"{input_file2} file not found")
             exit(1)
         self.input_file = input_file
+        self.input_file2 = input_file2
         self.output_file = output_file
         self.chunk_num = chunk_num
         self.header_size = header_size
@@ -47,8 +106,27 @@ class Decoder:
         self.max_homopolymer = max_homopolymer
         self.max_hamming = max_hamming
         self.chunk_size = chunk_size
-        self.glass = Glass(
-            self.chunk_num,
+        self.batch_size = batch_size
+        self.workers = workers
+        self.block_chunks = block_chunks
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_every = checkpoint_every
+        # set by stream() and astream(), which do not checkpoint
+        self.streaming = False
+        # lines of a plain text input read but not added to the glass yet, None for other inputs
+        self.raw_lines = None
+        if oligo_len is None:
+            # block id, seed, payload and RS symbols, 4 nt per byte (as DNAFountain.oligo_l)
+            block_l = 0 if block_chunks is None else BLOCK_ID_SIZE
+            oligo_len = (block_l + header_size + chunk_size + rs) * 4
+        self.oligo_len = oligo_len
+        self.min_quality = min_quality
+        self.cluster_window = cluster_window
+        self.metrics_args = dict(
+            path=metrics_file, fmt=metrics_format, interval=metrics_every, profile_interval=profile_interval
+        )
+        self.glass_args = dict(
+            num_chunks=self.chunk_num,
             header_size=self.header_size,
             rs=self.rs,
             c_dist=self.c_dist,
@@ -56,44 +134,493 @@ class Decoder:
             gc=self.gc,
             max_homopolymer=max_homopolymer,
             max_hamming=max_hamming,
+            prng_cache=prng_cache,
+            chunk_size=self.chunk_size,
         )
+        if block_chunks is None:
+            self.glass = Glass(**self.glass_args)
+        else:
+            # finished blocks are written to the output file while the others are still decoding
+            self.glass = SegmentedGlass(
+                block_chunks=block_chunks, output_file=output_file, **self.glass_args
+            )
+        self.checksums = None if checksum_file is None else verify.ChecksumWriter(checksum_file, chunk_num)
 
-    def decode(self) -> None:
-        line = 0
-        errors = 0
-        seen_seeds = defaultdict(int)
-        with open(self.input_file, "r") as file:
+    def _plain_text(self) -> bool:
+        """
+        whether the input is a text file of one read per line, decoded line by line: the byte offset of the last
+        line added to the glass is then known, and a resume seeks to it
+        """
+        return (
+            self.input_file != stream.STDIO
+            and self.input_file2 is None
+            and self.cluster_window is None
+            and not pool.is_pool(self.input_file)
+            and not reads.is_sequencer_output(self.input_file)
+        )
+
+    def _open_input(self):
+        """
+        the input file, as a text file of one read per line, a binary oligo pool,
+        or sequencer output (FASTQ/FASTA, plain or gzip) streamed with trimming and quality filtering.
+        A plain text file is opened in binary mode when its byte offset is tracked (_text_reads).
+        """
+        if self.input_file == stream.STDIO:
+            # stdin stays open for the caller
+            return contextlib.nullcontext(sys.stdin)
+        if self.input_file2 is not None:
+            # the inserts are about one oligo long, longer or shorter overlaps are not tried
+            return merge.MergedStream(
+                self.input_file,
+                self.input_file2,
+                self.oligo_len,
+                self.min_quality,
+                insert_slack=self.oligo_len // 4,
+            )
+        if pool.is_pool(self.input_file):
+            return pool.PoolReader(self.input_file)
+        if reads.is_sequencer_output(self.input_file):
+            return reads.ReadStream(self.input_file, self.oligo_len, self.min_quality)
+        return open(self.input_file, "r" if self.raw_lines is None else "rb")
+
+    def _reads(self, file) -> Iterator[str]:
+        for dna in file:
+            dna = dna.rstrip("\n")
+            if len(dna) == 0:
+                break
+            yield dna
+
+    def _text_reads(self, file) -> Iterator[str]:
+        """
+        the reads of a plain text file opened in binary mode; every line is kept in raw_lines
+        until _add_records adds its record, which moves the byte offset of the checkpoint past it
+        """
+        for raw in file:
+            dna = raw.decode("ascii", "replace").rstrip("\r\n")
+            if len(dna) == 0:
+                break
+            self.raw_lines.append(raw)
+            yield dna
+
+    def _read_batches(self, file, skip: int = 0, batch_size: int = None) -> Iterator:
+        """
+        Yield the reads after the first skip ones, batch_size (self.batch_size if None) at a time:
+        lists of DNA strings from a text file, uint8 matrices of packed oligos from a pool.
+        """
+        batch_size = batch_size or self.batch_size
+        if isinstance(file, pool.PoolReader):
+            yield from file.batches(batch_size, skip)
+            logging.info("Finished reading input file!")
+            return
+        reads = self._reads(file) if self.raw_lines is None else self._text_reads(file)
+        if self.cluster_window is not None:
+            # only one consensus sequence per cluster of copies of an oligo is parsed
+            reads = cluster.consensus_stream(reads, self.cluster_window)
+        # the skipped reads are read, but not parsed
+        deque(itertools.islice(reads, skip), maxlen=0)
+        batch = []
+        for dna in reads:
+            batch.append(dna)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+        logging.info("Finished reading input file!")
+
+    def _records(self, file, skip: int = 0) -> Iterator[Optional[tuple]]:
+        """
+        Yield one Glass.add_record record per line, or None for rejected reads, in input order.
+        """
+        if self.workers > 1:
+            yield from self._parallel_records(file, skip)
+            return
+        for batch in self._read_batches(file, skip):
+            with metrics.timer("parse_batch_seconds"):
+                records = self.glass.parse_batch(codec.to_messages(batch))
+            yield from records
+
+    def _parallel_records(self, file, skip: int = 0) -> Iterator[Optional[tuple]]:
+        """
+        Parsing, RS correction and neighbour lookup run on batches of reads in worker processes,
+        only peeling stays in this process. The records come back packed in flat arrays, and the batches are
+        at least WORKER_BATCH reads, so the transfers stay small next to the work. Reading stops as soon as
+        the consumer stops.
+        """
+        batches = self._read_batches(file, skip, max(self.batch_size, WORKER_BATCH))
+        executor = ProcessPoolExecutor(
+            self.workers,
+            initializer=parallel.init_decoder,
+            initargs=(self.glass_args, self.block_chunks),
+        )
+        pending = deque()
+        try:
             while True:
-                dna = file.readline().rstrip("\n")
-                if len(dna) == 0:
-                    logging.info("Finished reading input file!")
+                # keep every worker busy while the oldest batch is consumed
+                for batch in itertools.islice(batches, 2 * self.workers - len(pending)):
+                    pending.append(executor.submit(parallel.decode_reads, batch))
+                if len(pending) == 0:
                     break
+                yield from parallel.unpack_records(pending.popleft().result())
+        finally:
+            # once the file is recovered, the batches still being parsed are not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _resume(self) -> int:
+        """
+        Restore the glass from the checkpoint file, if there is one.
+        :return
+        number of lines of the input file that are already in the checkpoint; type: int
+        """
+        if self.checkpoint_file is None or not os.path.exists(self.checkpoint_file):
+            return 0
+        state = checkpoint.load(self.checkpoint_file)
+        self.glass.restore(checkpoint.prefixed(state, "glass/"))
+        # the reads of another input file, or of the same file rewritten since, are all new;
+        # reads appended to the input file since are read after the ones in the checkpoint
+        digest = self._checked_prefix(state)
+        if digest is None:
+            logging.warning("%s is not the input file of %s, no line is skipped", self.input_file, self.checkpoint_file)
+            lines = 0
+        else:
+            lines = int(state["lines"])
+            if self.raw_lines is not None:
+                self.offset = int(state["input_file_offset"])
+                self.digest = digest
+        logging.info(
+            "Resumed from {}. {} chunks done. Skipping {} lines.".format(
+                self.checkpoint_file, self.glass.chunks_done(), lines
+            )
+        )
+        return lines
+
+    def _input_paths(self) -> List[tuple]:
+        paths = (("input_file", self.input_file), ("input_file2", self.input_file2))
+        return [(name, path) for name, path in paths if path is not None]
+
+    def _checked_prefix(self, state: dict):
+        """
+        Check that the input files still start with the bytes hashed into the checkpoint, they may be longer.
+        :return
+        hashlib object of the bytes of the input file in the checkpoint, None if the input files are not
+        the ones the checkpoint was saved for
+        """
+        if self.input_file == stream.STDIO or ("input_file2" in state) != (self.input_file2 is not None):
+            return None
+        digest = None
+        for name, path in self._input_paths():
+            if name + "_digest" not in state or str(state[name]) != os.path.abspath(path):
+                return None
+            start = int(state[name + "_start"])
+            offset = int(state[name + "_offset"])
+            if os.path.getsize(path) < offset:
+                return None
+            prefix = verify.file_hash(path, offset - start, start)
+            if prefix.hexdigest() != str(state[name + "_digest"]):
+                return None
+            if digest is None:
+                digest = prefix
+        return digest
+
+    def _input_identity(self) -> dict:
+        """
+        path of every input file, and the digest of its bytes [start, offset): the bytes of the lines in the glass
+        for a plain text file, else the first CHECKPOINT_PREFIX bytes (of the records of a pool, its header changes
+        when oligos are appended)
+        """
+        identity = {}
+        for name, path in self._input_paths():
+            if name == "input_file" and self.raw_lines is not None:
+                start, offset, digest = 0, self.offset, self.digest.hexdigest()
+            else:
+                start = pool.HEADER_SIZE if pool.is_pool(path) else 0
+                offset = min(os.path.getsize(path), start + CHECKPOINT_PREFIX)
+                digest = verify.file_hash(path, offset - start, start).hexdigest()
+            identity[name] = os.path.abspath(path)
+            identity[name + "_start"] = start
+            identity[name + "_offset"] = offset
+            identity[name + "_digest"] = digest
+        return identity
+
+    def _checkpoint(self, line: int) -> None:
+        if self.checkpoint_file is None or self.streaming:
+            return
+        state = {"glass/" + name: a for name, a in self.glass.state().items()}
+        state.update((name, np.array(value)) for name, value in self._input_identity().items())
+        state["lines"] = np.array(line, dtype=np.int64)
+        checkpoint.save(self.checkpoint_file, state)
+
+    def _update_gauges(self, line: int, errors: int) -> None:
+        metrics.set_gauge("lines_read", line)
+        metrics.set_gauge("reads_rejected", errors)
+        metrics.set_gauge("chunks_solved", self.glass.chunks_done())
+        metrics.set_gauge("pending_droplets", self.glass.pending_droplets())
+        metrics.set_gauge("arena_bytes", self.glass.memory_bytes())
+
+    def decode(self) -> None:
+        with metrics.session(**self.metrics_args), metrics.timer("decode_seconds"):
+            self._decode()
+
+    def _decode(self) -> None:
+        if self._plain_text():
+            self.raw_lines = deque()
+            # bytes of the lines in the glass, and their hash
+            self.offset = 0
+            self.digest = hashlib.sha256()
+        self.line = self._resume()
+        self.errors = 0
+        with self._open_input() as file:
+            # the lines already in the checkpoint are not parsed again, nor read again from a plain text file
+            skip = self.line
+            if self.raw_lines is not None:
+                file.seek(self.offset)
+                skip = 0
+            self._add_records(self._records(file, skip))
+            self._finish()
 
-                line += 1
-                seed, data = self.glass.add_dna(dna)
-                # Exclude the sequence with error, which is founded by RS code
-                if seed == -1:
-                    errors += 1
-                else:
-                    seen_seeds[seed] += 1
-
-                if line % 1000 == 0:
-                    logging.info(
-                        "After reading {} lines. {} chunks done. {} rejections.".format(
-                            line, self.glass.chunks_done(), errors
-                        )
+        if self.block_chunks is not None:
+            logging.info("{} blocks written.".format(self.glass.blocks_done()))
+            return
+        data = memoryview(self.glass.flatten_chunks())
+        # write the chunk matrix buffer directly, without building a bytes copy
+        with metrics.timer("write_output_seconds"):
+            if self.output_file == stream.STDIO:
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+                return
+            with open(self.output_file, "wb") as file:
+                file.write(data)
+
+    def _add_records(self, records: Iterable[Optional[tuple]]) -> None:
+        """
+        Add the records to the glass until it is done, counting lines and rejections.
+        """
+        for record in records:
+            self.line += 1
+            if self.raw_lines is not None:
+                raw = self.raw_lines.popleft()
+                self.offset += len(raw)
+                self.digest.update(raw)
+            seed = -1 if record is None else self.glass.add_record(*record)
+            # Exclude the sequence with error, which is founded by RS code
+            if seed == -1:
+                self.errors += 1
+
+            if self.line % 1000 == 0:
+                if metrics.ENABLED:
+                    self._update_gauges(self.line, self.errors)
+                if self.checksums is not None:
+                    self.checksums.update(self.glass)
+                logging.info(
+                    "After reading {} lines. {} chunks done. {} rejections.".format(
+                        self.line, self.glass.chunks_done(), self.errors
                     )
-                if self.glass.is_done():
-                    logging.info(
-                        "Done! Totally {} lines are read. {} chunks done. {} rejections.".format(
-                            line, self.glass.chunks_done(), errors
-                        )
+                )
+            if self.line % self.checkpoint_every == 0:
+                with metrics.timer("checkpoint_seconds"):
+                    self._checkpoint(self.line)
+            if self.glass.is_done():
+                logging.info(
+                    "Done! Totally {} lines are read. {} chunks done. {} rejections.".format(
+                        self.line, self.glass.chunks_done(), self.errors
                     )
-                    break
-            if not self.glass.is_done():
-                logging.error("Could not decode all file...")
+                )
+                return
+
+    def _finish(self) -> None:
+        """
+        Solve what belief propagation left over GF(2), save the state, and exit if the file is not recovered.
+        """
+        if not self.glass.is_done():
+            logging.info(
+                "Belief propagation stalled at {} chunks. Solving the remaining droplets over GF(2)...".format(
+                    self.glass.chunks_done()
+                )
+            )
+            self.glass.solve()
+        self.glass.save_cache()
+        self._checkpoint(self.line)
+        if self.checksums is not None:
+            self.checksums.update(self.glass)
+        if metrics.ENABLED:
+            self._update_gauges(self.line, self.errors)
+        if not self.glass.is_done():
+            logging.error("Could not decode all file...")
+            exit(1)
+
+    def _start_stream(self) -> None:
+        if self.block_chunks is not None:
+            # finished blocks go to the output file, the chunks are not kept
+            raise ValueError("a segmented file is decoded with decode()")
+        if self.checkpoint_file is not None:
+            # the lines of an iterable cannot be skipped on a resume, so its state is not saved either
+            logging.info("Streaming decode: %s is neither resumed from nor written", self.checkpoint_file)
+        self.streaming = True
+        self.line = 0
+        self.errors = 0
+        # number of chunks at the front of the file already streamed
+        self.streamed = 0
+
+    def _feed(self, batch: List[str]) -> bytes:
+        """
+        Decode a batch of reads.
+        :return
+        the chunks solved at the front of the file since the last call, as bytes; type: bytes
+        """
+        if not self.glass.is_done():
+            self._add_records(self.glass.parse_batch(codec.to_messages(batch)))
+        return self._solved_prefix()
+
+    def _solved_prefix(self) -> bytes:
+        start = self.streamed
+        solved = self.glass.solved
+        while self.streamed < self.chunk_num and solved[self.streamed]:
+            self.streamed += 1
+        if self.streamed == start:
+            return b""
+        return self.glass.chunks[start : self.streamed].tobytes()
+
+    def _end_stream(self) -> bytes:
+        self._finish()
+        return self._solved_prefix()
+
+    def stream(self, reads: Iterable[str] = None) -> Iterator[bytes]:
+        """
+        Decode reads from any iterable of DNA strings (a list, a generator, a file of one read per line),
+        or from the input file when None, and yield the file in order as soon as the chunks at its front are solved:
+        a consumer can write the start of the file while later chunks are still missing. The last chunk is zero padded.
+        Reads are parsed in this process batch_size at a time, and no more are pulled once the file is recovered.
+        """
+        if reads is None:
+            with self._open_input() as file:
+                yield from self.stream(file.reads() if isinstance(file, pool.PoolReader) else file)
+            return
+        self._start_stream()
+        for batch in stream.batches(self._reads(reads), self.batch_size):
+            data = self._feed(batch)
+            if data:
+                yield data
+            if self.glass.is_done():
+                break
+        data = self._end_stream()
+        if data:
+            yield data
+
+    async def astream(self, reads: Union[Iterable[str], AsyncIterable]) -> AsyncIterator[bytes]:
+        """
+        stream() for an iterable or an async iterable of reads. Every batch is decoded in a worker thread,
+        so the event loop keeps running; the next batch is only pulled from the source once the previous one
+        is decoded and its chunks were taken by the consumer.
+        """
+        loop = asyncio.get_running_loop()
+        self._start_stream()
+        async for batch in stream.abatches(reads, self.batch_size):
+            batch = [dna.rstrip("\n") for dna in batch]
+            data = await loop.run_in_executor(None, self._feed, batch)
+            if data:
+                yield data
+            if self.glass.is_done():
+                break
+        data = await loop.run_in_executor(None, self._end_stream)
+        if data:
+            yield data
+
+    def decode_reads(self, reads: Iterable[str]) -> bytes:
+        """
+        the file recovered from an iterable of reads, zero padded to whole chunks
+        """
+        return b"".join(self.stream(reads))
+
+    async def adecode_reads(self, reads: Union[Iterable[str], AsyncIterable]) -> bytes:
+        return b"".join([data async for data in self.astream(reads)])
+
+
+class ArchiveDecoder(Decoder):
+    """
+    Restore some files of an archive pool (Encoder with input_files). The manifest is decoded first,
+    then only the reads of the requested objects are error corrected and peeled: the object id of every
+    read is checked on its raw header before RS correction, so the cost grows with the restored files,
+    plus one cheap scan of the pool.
+    """
+
+    def __init__(
+        self,
+        input_file: str,
+        output_dir: str,
+        objects: List[str] = None,
+        manifest_chunks: int = None,
+        header_size=4,
+        rs=0,
+        chunk_size=32,
+        oligo_len: int = None,
+        **decoder_args,
+    ):
+        """
+        output_dir: directory the restored files are written to; type = str
+        objects: names of the files to restore, None for all of them; type = list
+        manifest_chunks: number of chunks of the manifest, None to read it from the pool header; type = int
+        decoder_args: Decoder parameters; checkpoints and worker processes are not used
+        """
+        if manifest_chunks is None:
+            if not pool.is_pool(input_file):
+                logging.error("manifest_chunks is needed to decode a text archive")
                 exit(1)
+            with pool.PoolReader(input_file) as reader:
+                manifest_chunks = reader.header.K
+        if oligo_len is None:
+            oligo_len = (archive.BLOCK_ID_SIZE + header_size + chunk_size + rs) * 4
+        super().__init__(
+            input_file,
+            output_dir,
+            chunk_num=manifest_chunks,
+            header_size=header_size,
+            rs=rs,
+            chunk_size=chunk_size,
+            oligo_len=oligo_len,
+            **decoder_args,
+        )
+        self.objects = objects
+        self.manifest_chunks = manifest_chunks
+        self.glass_args.pop("num_chunks")
 
-        out_str = bytes(self.glass.flatten_chunks())
-        with open(self.output_file, "wb") as file:
-            file.write(out_str)
+    def _decode_objects(self, glass: "archive.ArchiveGlass") -> None:
+        line = 0
+        with self._open_input() as file:
+            for batch in self._read_batches(file):
+                line += len(batch)
+                for record in glass.parse_batch(codec.to_messages(archive.select(batch, glass.wanted()))):
+                    if record is not None:
+                        glass.add_record(*record)
+                    if glass.is_done():
+                        break
+                if glass.is_done():
+                    break
+        if not glass.is_done():
+            glass.solve()
+        logging.info("{} lines read. {} chunks done.".format(line, glass.chunks_done()))
+        if not glass.is_done():
+            logging.error("Could not decode all objects...")
+            exit(1)
+
+    def decode(self) -> None:
+        with metrics.session(**self.metrics_args), metrics.timer("decode_seconds"):
+            glass = archive.ArchiveGlass({archive.MANIFEST_ID: self.manifest_chunks}, **self.glass_args)
+            self._decode_objects(glass)
+            entries = archive.parse_manifest(glass.finished[archive.MANIFEST_ID].tobytes())
+            if self.objects is not None:
+                missing = set(self.objects) - {entry["name"] for entry in entries}
+                if missing:
+                    logging.error("not in the archive: %s", ", ".join(sorted(missing)))
+                    exit(1)
+                entries = [entry for entry in entries if entry["name"] in self.objects]
+            os.makedirs(self.output_file, exist_ok=True)
+            # the names come from the pool, they must not leave the output directory
+            paths = {e["id"]: os.path.join(self.output_file, os.path.basename(e["name"])) for e in entries}
+            wanted = {e["id"]: e["num_chunks"] for e in entries if e["num_chunks"] > 0}
+            for entry in entries:
+                if entry["num_chunks"] == 0:
+                    open(paths[entry["id"]], "wb").close()
+            if wanted:
+                sizes = {e["id"]: e["size"] for e in entries}
+                self._decode_objects(archive.ArchiveGlass(wanted, paths, sizes, **self.glass_args))
+            logging.info("{} files restored to {}.".format(len(entries), self.output_file))
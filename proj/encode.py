@@ -1,4 +1,14 @@
+import contextlib
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import numpy as np
 from utils.DNAFountain import DNAFountain
+from utils.archive import archive_fountains
+from utils.segmented import block_fountains
+from utils import LFSR, metrics, parallel, pool, stream
 import logging, tqdm
 
 
@@ -15,10 +25,22 @@ class Encoder:
         c_dist=0.1,
         alpha=0.01,
         final: int = None,
+        batch_size=1024,
+        workers=1,
+        block_chunks: int = None,
+        lfsr_state: int = None,
+        seed_index: int = None,
+        output_format="text",
+        metrics_file: str = None,
+        metrics_format="json",
+        metrics_every: float = None,
+        profile_interval: float = None,
+        input_files: List[str] = None,
+        oligos_per_chunk: float = None,
     ):
         """
-        input_file: file to encode; type = str
-        output_file: file to have DNA oligos written in; type = str
+        input_file: file to encode, "-" to read it from stdin; type = str
+        output_file: file to have DNA oligos written in, "-" for stdout (text format); type = str
         chunk_size: number of information bytes per message; type = int
         max_homopolymer: the largest number of nt in a homopolymer; type = int
         gc: the fraction of gc content above/below 0.5 (example:0.1 means 0.4-0.6); type = restricted_float
@@ -27,14 +49,60 @@ class Encoder:
         c_dist: degree distribution tuning parameter; type = float
         final: maximal number of oligos; type = int
         alpha: number of more fragments to generate on top of frst k (example: 0.1 will generate 10 percent more fragments); type = float
+        batch_size: number of droplets created per batch; type = int
+        workers: number of processes screening droplets, each batch of seeds goes to one process; type = int
+        block_chunks: split the file into independent blocks of at most this many chunks, None for a single fountain; type = int
+        lfsr_state: top-up an existing pool: continue after this lfsr state and append final new oligos to output_file.
+            With blocks or archive objects every fountain continues from it, so it must be the state the last encode
+            logged, that of its furthest block; type = int
+        seed_index: top-up an existing pool: continue after this many lfsr steps and append final new oligos to output_file,
+            with blocks or archive objects the logged seed_index of the furthest block; type = int
+        output_format: "text" for one oligo per line, "pool" for the 2-bit packed binary pool format; type = str
+        metrics_file: file the counters, histograms and timers of the run are written to, None to disable them; type = str
+        metrics_format: "json" or "prometheus"; type = str
+        metrics_every: seconds between two writes of the metrics during the run, None to write them only at the end; type = float
+        profile_interval: seconds between two samples of the sampling profiler, None to disable it; type = float
+        input_files: archive mode: encode these files (input_file is ignored) as objects of one pool, with a manifest; type = list
+        oligos_per_chunk: final as a multiple of the number of chunks, counted once the input is read
+            (so stdin and a file of the same bytes give the same pool); type = float
         """
         logging.basicConfig(level=logging.DEBUG)
+        self.input_file = input_file
         self.output_file = output_file
+        self.batch_size = batch_size
+        self.workers = workers
+        self.block_chunks = block_chunks
+        self.input_files = input_files
+        self.top_up = lfsr_state is not None or seed_index is not None
+        self.output_format = output_format
+        self.metrics_args = dict(
+            path=metrics_file, fmt=metrics_format, interval=metrics_every, profile_interval=profile_interval
+        )
+        if output_format not in ("text", "pool"):
+            logging.error("unknown output format %s", output_format)
+            exit(1)
         if gc < 0.0 or gc > 1.0:
             logging.error("%s not in range [0.0, 1.0]", self.gc)
             exit(1)
-        self.dna_fountain = DNAFountain(
-            input_file=input_file,
+        if input_file == stream.STDIO and (workers > 1 or block_chunks is not None or input_files is not None):
+            logging.error("stdin is only encoded as a single fountain in this process")
+            exit(1)
+        if output_file == stream.STDIO and output_format != "text":
+            logging.error("only the text format is written to stdout")
+            exit(1)
+        if self.top_up and (block_chunks is not None or input_files is not None):
+            self._check_top_up(lfsr_state, seed_index)
+        chunks = None
+        if input_file == stream.STDIO:
+            # a pipe cannot be memory mapped, it is read into memory
+            chunks = stream.read_chunks(sys.stdin.buffer, chunk_size)
+        if oligos_per_chunk is not None:
+            if final is not None or input_files is not None:
+                logging.error("oligos_per_chunk replaces final, for a single input file")
+                exit(1)
+            num_chunks = len(chunks) if chunks is not None else -(-os.path.getsize(input_file) // chunk_size)
+            final = int(num_chunks * oligos_per_chunk)
+        self.fountain_args = dict(
             chunk_size=chunk_size,
             rs=rs,
             max_homopolymer=max_homopolymer,
@@ -43,9 +111,150 @@ class Encoder:
             c_dist=c_dist,
             alpha=alpha,
             final=final,
+            lfsr_state=lfsr_state,
+            seed_index=seed_index,
+        )
+        if input_files is not None:
+            # object 0 is the manifest, every file is an object with its id in the oligo headers
+            self.fountains = archive_fountains(input_files, self.fountain_args)
+        elif chunks is not None:
+            self.fountains = [DNAFountain(None, data_array=chunks, **self.fountain_args)]
+        elif block_chunks is None:
+            self.fountains = [DNAFountain(input_file=input_file, **self.fountain_args)]
+        else:
+            # every block is an independent fountain with the block id in its oligo headers
+            self.fountains = block_fountains(input_file, block_chunks, self.fountain_args)
+        self.dna_fountain = self.fountains[0]
+
+    def _check_top_up(self, lfsr_state: Optional[int], seed_index: Optional[int]) -> None:
+        """
+        Every block of a top-up continues from the same state. The seeds after the furthest block's last one are new
+        to all the blocks, but from an earlier state the blocks that went further would use some of their seeds again.
+        A pool records the furthest state in its header, a text file does not.
+        """
+        state = lfsr_state
+        if state is None:
+            state = LFSR.lfsr_jump(LFSR.lfsr32s(), LFSR.lfsr32p(), seed_index)
+        if self.output_format == "pool" and os.path.exists(self.output_file):
+            with pool.PoolReader(self.output_file) as reader:
+                furthest = reader.header.lfsr_state
+            if state != furthest:
+                logging.error(
+                    "The blocks of %s were left at lfsr state %d, not %d: top up from the state of the furthest block",
+                    self.output_file,
+                    furthest,
+                    state,
+                )
+                exit(1)
+            return
+        logging.warning(
+            "Every block continues from lfsr state %d: it must be the state the last encode logged for its furthest block, "
+            "or blocks that went further repeat seeds",
+            state,
+        )
+
+    def _oligos(self) -> Iterator[Tuple[Optional[int], int, str]]:
+        """
+        Yield (block, seed, DNA) of the droplets passing the screen, block by block in seed order,
+        until final oligos are generated for every block.
+        """
+        if self.workers > 1:
+            yield from self._parallel_oligos()
+            return
+        for fountain in self.fountains:
+            while fountain.good < fountain.final:
+                batch = fountain.droplets(self.batch_size)
+                limit = fountain.final - fountain.good
+                for droplet in fountain.screen_batch(batch, limit):
+                    yield fountain.block, droplet.seed, droplet.to_readable_dna()
+
+    def _parallel_oligos(self) -> Iterator[Tuple[Optional[int], int, str]]:
+        """
+        Same output as the serial path: the main process jumps the lfsr over consecutive seed ranges and
+        hands out their start states, the workers compute the seeds and screen them against the memory mapped input file, and the results are merged in seed order.
+        """
+        with ProcessPoolExecutor(
+            self.workers,
+            initializer=parallel.init_encoder,
+            initargs=(self.input_file, self.fountain_args, self.block_chunks, self.input_files),
+        ) as executor:
+            for fountain in self.fountains:
+                pending = deque()
+                while fountain.good < fountain.final:
+                    # keep every worker busy while the oldest batch is merged
+                    while len(pending) < 2 * self.workers:
+                        # the lfsr jumps over the batch, the worker computes its seeds
+                        state = fountain.skip_seeds(self.batch_size)
+                        pending.append(
+                            executor.submit(parallel.encode_seeds, state, self.batch_size, fountain.block)
+                        )
+                    accepted, reasons = pending.popleft().result()
+                    examined = self.batch_size
+                    need = fountain.final - fountain.good
+                    if len(accepted) >= need:
+                        # as in screen_batch, the droplets after the last oligo needed count as never created:
+                        # the lfsr goes back to its seed, the batches still in flight are dropped
+                        examined = int(np.flatnonzero(reasons == 0)[need - 1]) + 1
+                        accepted = accepted[:need]
+                        fountain.rewind((len(pending) + 1) * self.batch_size - examined, accepted[-1][0])
+                    fountain.tries += examined
+                    fountain.count_rejections(reasons[:examined])
+                    if metrics.ENABLED:
+                        # the workers' own metrics stay in the workers, their totals are counted here
+                        metrics.inc("droplets_total", examined)
+                        metrics.inc("oligos_accepted_total", len(accepted))
+                    for seed, dna in accepted:
+                        fountain.good += 1
+                        yield fountain.block, seed, dna
+                for future in pending:
+                    future.cancel()
+
+    def oligos(self) -> Iterator[str]:
+        """
+        The oligos encode() writes, in the same order, generated as they are consumed.
+        """
+        used_bc: set[Tuple[Optional[int], int]] = set()
+        for block, seed, dna in self._oligos():
+            if (block, seed) in used_bc:
+                logging.error("Seed %d has been seen before\nDone", seed)
+                exit(1)
+            used_bc.add((block, seed))
+            yield dna
+
+    def aoligos(self) -> AsyncIterator[str]:
+        """
+        oligos() as an async generator: batches of oligos are generated in a worker thread, the next one
+        only once the consumer has taken the current one
+        """
+        return stream.offload(self.oligos(), self.batch_size)
+
+    def _open_output(self):
+        """
+        the output file, opened for appending in a top-up
+        """
+        if self.output_file == stream.STDIO:
+            # stdout stays open for the caller
+            return contextlib.nullcontext(sys.stdout)
+        if self.output_format == "text":
+            return open(self.output_file, "a" if self.top_up else "w")
+        header = pool.PoolHeader(
+            chunk_size=self.fountain_args["chunk_size"],
+            rs=self.fountain_args["rs"],
+            # an archive is decoded from its manifest, the only size the decoder has to know
+            K=self.dna_fountain.num_chunks if self.input_files is not None else sum(f.num_chunks for f in self.fountains),
+            delta=self.fountain_args["delta"],
+            c=self.fountain_args["c_dist"],
+            lfsr_state=self.dna_fountain.seed,
+            oligo_len=self.dna_fountain.oligo_l,
+            seed_offset=self.dna_fountain.block_header_l,
         )
+        return pool.PoolWriter(self.output_file, header, append=self.top_up)
 
     def encode(self):
+        with metrics.session(**self.metrics_args), metrics.timer("encode_seconds"):
+            self._encode()
+
+    def _encode(self):
         debug_info = self.dna_fountain.PRNG.debug()
         logging.info(
             "Upper bounds on packets for decoding is {} (x{}) with {} probability\n".format(
@@ -53,28 +262,48 @@ class Encoder:
             )
         )
 
-        with open(self.output_file, "w") as out, tqdm.tqdm(
-            total=self.dna_fountain.final, desc="Valid oligos"
+        with self._open_output() as out, tqdm.tqdm(
+            total=sum(f.final for f in self.fountains), desc="Valid oligos"
         ) as pbar:
-            used_bc: set[int] = set()
-            while self.dna_fountain.good < self.dna_fountain.final:
-                droplet = self.dna_fountain.droplet()
-
-                if self.dna_fountain.screen(droplet):
-                    out.write("{}\n".format(droplet.to_readable_dna()))
-
-                    if droplet.seed in used_bc:
-                        logging.error(
-                            "Seed %d has been seen before\nDone", droplet.seed
-                        )
-                        exit(1)
-
-                    used_bc.add(droplet.seed)
-                    pbar.update()
+            batch = []
+            for dna in self.oligos():
+                if self.output_format == "pool":
+                    # pack and write the oligos batch_size at a time
+                    batch.append(dna)
+                    if len(batch) == self.batch_size:
+                        out.write_reads(batch)
+                        batch = []
+                else:
+                    out.write("{}\n".format(dna))
+                pbar.update()
+            # all blocks follow the same lfsr sequence, the furthest state is new to every block
+            last = max(self.fountains, key=lambda f: f.steps)
+            if self.output_format == "pool":
+                out.write_reads(batch)
+                out.close(lfsr_state=last.seed)
 
+            good = sum(f.good for f in self.fountains)
+            tries = sum(f.tries for f in self.fountains)
             logging.info(
                 "Finished. Generated %d packets out of %d tries (%.3f)",
-                self.dna_fountain.good,
-                self.dna_fountain.tries,
-                (self.dna_fountain.good + 0.0) / self.dna_fountain.tries,
+                good,
+                tries,
+                (good + 0.0) / tries,
+            )
+            logging.info(
+                "Rejections by constraint: %s",
+                ", ".join(
+                    "{} {}".format(name, sum(f.rejections[name] for f in self.fountains))
+                    for name in self.dna_fountain.rejections
+                ),
+            )
+            if self.input_files is not None:
+                logging.info(
+                    "Archive of %d files. Decode with manifest_chunks=%d",
+                    len(self.input_files),
+                    self.dna_fountain.num_chunks,
+                )
+            # where a later top-up of this pool has to continue
+            logging.info(
+                "Top up with lfsr_state=%d seed_index=%s", last.seed, last.seed_index
             )
@@ -2,9 +2,11 @@ import argparse
 import configparser
 import os
 import math
+import sys
 from decode import Decoder
 from encode import Encoder
-from utils.misc import check_integrity
+from utils.stream import STDIO
+from utils.verify import verify
 
 
 def get_opts(init_config: str = "./configs/default.ini"):
@@ -13,22 +15,37 @@ def get_opts(init_config: str = "./configs/default.ini"):
 
     ap = argparse.ArgumentParser()
     ap.add_argument(
-        "--encode_file", default="./encode/50-SF.txt", type=str, help="input file path"
+        "--encode_file", default="./encode/50-SF.txt", type=str, help="input file path, - for stdin/stdout"
     )
     ap.add_argument(
-        "--decode_file", default="./decode/50-SF.jpg", type=str, help="output file path"
+        "--decode_file", default="./decode/50-SF.jpg", type=str, help="output file path, - for stdout"
     )
     ap.add_argument(
         "--origin_file",
         default="./origin/神奈川冲浪.jpg",
         type=str,
-        help="original file path",
+        help="original file path, - for stdin",
+    )
+    ap.add_argument(
+        "--mode",
+        default="both",
+        choices=["both", "encode", "decode"],
+        help="encode origin_file to encode_file, decode encode_file to decode_file, or both and check the result",
+    )
+    ap.add_argument(
+        "--chunk_num",
+        default=None,
+        type=int,
+        help="number of chunks of the encoded file, when origin_file is not there to count them",
     )
     args = ap.parse_args()
 
     cp["DEFAULT"]["encode_file"] = args.encode_file
     cp["DEFAULT"]["decode_file"] = args.decode_file
     cp["DEFAULT"]["origin_file"] = args.origin_file
+    cp["DEFAULT"]["mode"] = args.mode
+    if args.chunk_num is not None:
+        cp["DEFAULT"]["chunk_num"] = str(args.chunk_num)
 
     return cp
 
@@ -38,14 +55,33 @@ def main():
     origin_file = config["DEFAULT"]["origin_file"]
     encode_file = config["DEFAULT"]["encode_file"]
     decode_file = config["DEFAULT"]["decode_file"]
+    mode = config["DEFAULT"].get("mode", fallback="both")
     need_encode = {"True": True, "False": False}[config["DEFAULT"]["need_encode"]]
+    # optional: split the file into independently decodable blocks of this many chunks
+    block_chunks = config["DEFAULT"].getint("block_chunks", fallback=None)
+    # optional: save the decoding state there, and resume from it when more reads are added
+    checkpoint_file = config["DEFAULT"].get("checkpoint_file", fallback=None)
+    # optional: write the CRC32 of every chunk there as it is solved
+    checksum_file = config["DEFAULT"].get("checksum_file", fallback=None)
+    # status goes to stderr when stdout carries the oligos or the decoded file
+    status = sys.stderr if STDIO in (encode_file, decode_file) else sys.stdout
+    if mode == "both" and encode_file == STDIO:
+        print("The oligos cannot be piped from the encoder to the decoder, use --mode", file=sys.stderr)
+        exit(1)
 
-    source_size = os.path.getsize(origin_file)
     chunk_size = 4
-    chunk_num = math.ceil(source_size / chunk_size)
+    source_size = None
+    if origin_file != STDIO and os.path.exists(origin_file):
+        source_size = os.path.getsize(origin_file)
+    chunk_num = config["DEFAULT"].getint("chunk_num", fallback=None)
+    if chunk_num is None and source_size is not None:
+        chunk_num = math.ceil(source_size / chunk_size)
+    if chunk_num is None and mode != "encode":
+        print("--chunk_num is needed to decode without the original file", file=sys.stderr)
+        exit(1)
 
-    if need_encode:
-        print("Encoding...")
+    if need_encode and mode != "decode":
+        print("Encoding...", file=status)
         Encoder(
             input_file=origin_file,
             output_file=encode_file,
@@ -55,14 +91,19 @@ def main():
             gc=0.05,
             delta=0.001,
             c_dist=0.025,
-            final=chunk_num * 5,
+            # counted once the input is read, the size of stdin is not known before
+            oligos_per_chunk=5,
+            block_chunks=block_chunks,
         ).encode()
+    if mode == "encode":
+        return
 
-    print("Decoding...")
-    Decoder(
+    print("Decoding...", file=status)
+    decoder = Decoder(
         input_file=encode_file,
         output_file=decode_file,
         chunk_num=chunk_num,
+        chunk_size=chunk_size,
         header_size=4,
         rs=2,
         delta=0.001,
@@ -70,19 +111,37 @@ def main():
         gc=0.05,
         max_homopolymer=3,
         max_hamming=0,
-    ).decode()
+        block_chunks=block_chunks,
+        checkpoint_file=checkpoint_file,
+        checksum_file=checksum_file,
+    )
+    if decode_file == STDIO:
+        # the front of the file is written as soon as it is solved, cut to the original size if it is known
+        left = chunk_num * chunk_size if source_size is None else source_size
+        for data in decoder.stream():
+            sys.stdout.buffer.write(data[:left])
+            sys.stdout.buffer.flush()
+            left -= min(left, len(data))
+    else:
+        decoder.decode()
 
     print(
         "Complete! With origin file: {}, encoded file: {}, recover file: {}".format(
             origin_file, encode_file, decode_file
-        )
+        ),
+        file=status,
     )
+    if mode == "decode" or STDIO in (origin_file, decode_file):
+        return
 
-    try:
-        print("Checking integrity of output image...")
-        check_integrity(origin_file, decode_file)
-    except:
-        print("Error occurred when trying to compare origin picture to output picture.")
+    print("Checking integrity of output file...")
+    result = verify(origin_file, decode_file, chunk_size)
+    if not result["same"]:
+        print(
+            "The output file differs in {} byte ranges, wrong chunks: {}".format(
+                len(result["ranges"]), result["chunks"][:20]
+            )
+        )
         exit(1)
 
 
@@ -0,0 +1,182 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from encode import Encoder
+from utils.channel import Channel, init_trials, run_trial
+from utils.misc import process_raw_input
+from utils import pool
+
+
+def load_oligos(path: str) -> Tuple[List[str], Optional[pool.PoolHeader]]:
+    """
+    the oligos of an encoded file (one per line, or a binary pool) and the pool header if there is one
+    """
+    if pool.is_pool(path):
+        with pool.PoolReader(path) as reader:
+            return list(reader.reads()), reader.header
+    return list(pool.read_text(path)), None
+
+
+def encoded_pools(args: argparse.Namespace, directory: str) -> Iterator[Tuple[Dict[str, Any], List[str], Dict[str, Any]]]:
+    """
+    Yield (encoding parameters, oligos, Glass arguments) of every pool to simulate: the given pool,
+    or the input file encoded with every combination of the rs / alpha / delta / c_dist grids.
+    The input file chunks are kept in the encoding parameters as "expected", to check the decoded file.
+    """
+    if args.pool is not None:
+        oligos, header = load_oligos(args.pool)
+        if header is not None:
+            setting = dict(chunk_size=header.chunk_size, rs=header.rs, delta=header.delta, c_dist=header.c, num_chunks=header.K)
+        else:
+            setting = dict(chunk_size=args.chunk_size, rs=args.rs[0], delta=args.delta[0], c_dist=args.c_dist[0], num_chunks=args.chunk_num)
+        setting["pool"] = args.pool
+        yield setting, oligos, glass_args(args, setting)
+        return
+    store, _ = process_raw_input(args.input, args.chunk_size)
+    num_chunks = len(store)
+    # segmented glasses do not keep the finished blocks, only whole files are checked
+    expected = store[np.arange(num_chunks)] if args.block_chunks is None else None
+    for rs, alpha, delta, c_dist in itertools.product(args.rs, args.alpha, args.delta, args.c_dist):
+        path = os.path.join(directory, "pool.bin")
+        Encoder(
+            input_file=args.input,
+            output_file=path,
+            chunk_size=args.chunk_size,
+            max_homopolymer=args.max_homopolymer,
+            gc=args.gc,
+            rs=rs,
+            delta=delta,
+            c_dist=c_dist,
+            alpha=alpha,
+            final=int(num_chunks * (1 + alpha)) + 1,
+            batch_size=args.batch_size,
+            block_chunks=args.block_chunks,
+            output_format="pool",
+        ).encode()
+        oligos, _ = load_oligos(path)
+        setting = dict(chunk_size=args.chunk_size, rs=rs, alpha=alpha, delta=delta, c_dist=c_dist, num_chunks=num_chunks)
+        setting["expected"] = expected
+        yield setting, oligos, glass_args(args, setting)
+
+
+def glass_args(args: argparse.Namespace, setting: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(
+        num_chunks=setting["num_chunks"],
+        header_size=4,
+        rs=setting["rs"],
+        c_dist=setting["c_dist"],
+        delta=setting["delta"],
+        gc=args.gc,
+        max_homopolymer=args.max_homopolymer,
+        max_hamming=args.max_hamming,
+        chunk_size=setting["chunk_size"],
+    )
+
+
+def summarize(reads_needed: List[Optional[int]], num_chunks: int, coverages: List[float]) -> Dict[str, Any]:
+    """
+    decode success probability at every coverage (reads per chunk), and quantiles of the reads needed
+    """
+    needed = np.array([np.inf if r is None else r for r in reads_needed], dtype=float)
+    success = {str(c): float(np.mean(needed <= c * num_chunks)) for c in coverages}
+    finite = needed[np.isfinite(needed)]
+    quantiles = dict()
+    if len(finite) == len(needed):
+        quantiles = {"p{}".format(q): float(np.percentile(finite, q)) for q in (10, 50, 90)}
+    return dict(reads_needed=reads_needed, success=success, reads_needed_quantiles=quantiles)
+
+
+def run(args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    channels = [
+        dict(substitution=s, insertion=i, deletion=d, dropout=o, dispersion=v)
+        for s, i, d, o, v in itertools.product(args.sub, args.ins, args.dels, args.dropout, args.dispersion)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        for setting, oligos, trial_glass_args in encoded_pools(args, directory):
+            expected = setting.pop("expected", None)
+            num_chunks = setting["num_chunks"]
+            max_reads = int(max(args.coverage) * num_chunks)
+            seeds = [args.seed + t for t in range(args.trials)]
+            executor = None
+            if args.workers > 1:
+                # every worker keeps the pool and the degree distribution for all of its trials
+                executor = ProcessPoolExecutor(
+                    args.workers, initializer=init_trials, initargs=(oligos, trial_glass_args, args.block_chunks, expected)
+                )
+            else:
+                init_trials(oligos, trial_glass_args, args.block_chunks, expected)
+            try:
+                for channel_args in channels:
+                    channel = Channel(**channel_args)
+                    if executor is None:
+                        reads_needed = [run_trial(channel, max_reads, seed) for seed in seeds]
+                    else:
+                        reads_needed = list(
+                            executor.map(run_trial, itertools.repeat(channel), itertools.repeat(max_reads), seeds)
+                        )
+                    result = dict(setting, oligos=len(oligos), channel=channel_args, trials=args.trials)
+                    result.update(summarize(reads_needed, num_chunks, args.coverage))
+                    yield result
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+
+def get_opts() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(
+        description="Monte Carlo decode trials of an encoded pool through a noisy channel"
+    )
+    source = ap.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pool", type=str, help="encoded file (one oligo per line, or a binary pool)")
+    source.add_argument("--input", type=str, help="file to encode with every combination of the encoding grids")
+    ap.add_argument("--chunk_size", default=4, type=int)
+    ap.add_argument("--chunk_num", default=None, type=int, help="number of chunks of a text --pool")
+    ap.add_argument("--rs", nargs="+", default=[2], type=int)
+    ap.add_argument("--alpha", nargs="+", default=[0.5], type=float)
+    ap.add_argument("--delta", nargs="+", default=[0.001], type=float)
+    ap.add_argument("--c_dist", nargs="+", default=[0.025], type=float)
+    ap.add_argument("--gc", default=0.05, type=float)
+    ap.add_argument("--max_homopolymer", default=3, type=int)
+    ap.add_argument("--max_hamming", default=0, type=int, help="larger values let the RS decoder miscorrect reads")
+    ap.add_argument("--block_chunks", default=None, type=int)
+    ap.add_argument("--batch_size", default=1024, type=int)
+    ap.add_argument("--sub", nargs="+", default=[0.0], type=float, help="substitution rates per nt")
+    ap.add_argument("--ins", nargs="+", default=[0.0], type=float, help="insertion rates per nt")
+    ap.add_argument("--dels", nargs="+", default=[0.0], type=float, help="deletion rates per nt")
+    ap.add_argument("--dropout", nargs="+", default=[0.0], type=float, help="fractions of lost oligos")
+    ap.add_argument("--dispersion", nargs="+", default=[0.0], type=float, help="variance / mean^2 of the coverage")
+    ap.add_argument(
+        "--coverage", nargs="+", default=[1.0, 1.25, 1.5, 2.0, 3.0], type=float,
+        help="reads per chunk at which the success probability is reported, the largest one bounds the trials",
+    )
+    ap.add_argument("--trials", default=20, type=int)
+    ap.add_argument("--workers", default=os.cpu_count(), type=int)
+    ap.add_argument("--seed", default=0, type=int)
+    ap.add_argument("--output", default=None, type=str, help="append one JSON line per setting")
+    return ap.parse_args()
+
+
+def main():
+    args = get_opts()
+    if args.pool is not None and not pool.is_pool(args.pool) and args.chunk_num is None:
+        raise SystemExit("--chunk_num is needed for a text --pool")
+    logging.disable(logging.INFO)
+    for result in run(args):
+        print(
+            "rs={rs} delta={delta} c_dist={c_dist} channel={channel}: success {success}, reads needed {reads_needed_quantiles}".format(
+                **result
+            )
+        )
+        if args.output:
+            with open(args.output, "a") as file:
+                file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# the modules are imported the way main.py imports them, from the proj directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# code of the small test files: 4 byte chunks, 2 RS bytes
+CODE_ARGS = dict(chunk_size=4, rs=2, max_homopolymer=3, gc=0.05, delta=0.001, c_dist=0.025)
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """
+    a 202 byte file, 51 chunks with the last one padded
+    """
+    path = tmp_path / "origin"
+    path.write_bytes(np.random.default_rng(1).integers(0, 256, 202, dtype=np.uint8).tobytes())
+    return path
+
+
+@pytest.fixture
+def oligos(tmp_path, origin):
+    """
+    text file of 2000 oligos encoding origin
+    """
+    from encode import Encoder
+
+    path = tmp_path / "oligos.txt"
+    Encoder(str(origin), str(path), final=2000, **CODE_ARGS).encode()
+    return path
+
+
+def decoder_args(**args):
+    return dict(chunk_num=51, header_size=4, max_hamming=0, **CODE_ARGS, **args)
@@ -0,0 +1,37 @@
+import pytest
+from decode import ArchiveDecoder
+from encode import Encoder
+
+ARGS = dict(chunk_size=16, rs=2, max_homopolymer=3, gc=0.1, delta=0.05, c_dist=0.1)
+DECODER_ARGS = dict(header_size=4, rs=2, chunk_size=16, delta=0.05, c_dist=0.1, gc=0.1, max_homopolymer=3, max_hamming=0)
+
+
+@pytest.fixture
+def archive(tmp_path, origin):
+    files = tmp_path / "files"
+    files.mkdir()
+    (files / "origin").write_bytes(origin.read_bytes())
+    (files / "text.txt").write_bytes(b"fountain codes in DNA\n" * 20)
+    (files / "empty.dat").write_bytes(b"")
+    path = tmp_path / "archive.pool"
+    inputs = [str(files / name) for name in ("origin", "text.txt", "empty.dat")]
+    Encoder(None, str(path), alpha=1, input_files=inputs, output_format="pool", **ARGS).encode()
+    return files, path
+
+
+def test_archive_round_trip(tmp_path, archive):
+    files, path = archive
+    output = tmp_path / "restored"
+    ArchiveDecoder(str(path), str(output), **DECODER_ARGS).decode()
+    for name in ("origin", "text.txt", "empty.dat"):
+        assert (output / name).read_bytes() == (files / name).read_bytes()
+
+
+def test_archive_selective_decode(tmp_path, archive):
+    files, path = archive
+    output = tmp_path / "restored"
+    ArchiveDecoder(str(path), str(output), objects=["text.txt"], **DECODER_ARGS).decode()
+    assert sorted(p.name for p in output.iterdir()) == ["text.txt"]
+    assert (output / "text.txt").read_bytes() == (files / "text.txt").read_bytes()
+    with pytest.raises(SystemExit):
+        ArchiveDecoder(str(path), str(output), objects=["missing"], **DECODER_ARGS).decode()
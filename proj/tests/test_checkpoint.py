@@ -0,0 +1,40 @@
+import logging
+import pytest
+from conftest import decoder_args
+from decode import Decoder
+
+
+def decode(oligos, output, checkpoint_file):
+    Decoder(str(oligos), str(output), checkpoint_file=str(checkpoint_file), checkpoint_every=10, **decoder_args()).decode()
+
+
+def test_resume_after_append(tmp_path, origin, oligos, caplog):
+    lines = oligos.read_text().splitlines(keepends=True)
+    partial = tmp_path / "partial.txt"
+    partial.write_text("".join(lines[:40]))
+    output = tmp_path / "decoded"
+    checkpoint_file = tmp_path / "checkpoint.npz"
+    with pytest.raises(SystemExit):
+        decode(partial, output, checkpoint_file)
+    # the reads appended since the checkpoint are read after the ones in it
+    with open(partial, "a") as file:
+        file.writelines(lines[40:])
+    with caplog.at_level(logging.INFO):
+        decode(partial, output, checkpoint_file)
+    assert "Skipping 40 lines" in caplog.text
+    assert output.read_bytes()[:202] == origin.read_bytes()
+
+
+def test_rewritten_input_is_not_skipped(tmp_path, oligos, caplog):
+    lines = oligos.read_text().splitlines(keepends=True)
+    partial = tmp_path / "partial.txt"
+    partial.write_text("".join(lines[:40]))
+    output = tmp_path / "decoded"
+    checkpoint_file = tmp_path / "checkpoint.npz"
+    with pytest.raises(SystemExit):
+        decode(partial, output, checkpoint_file)
+    partial.write_text("".join(lines[1:]))
+    with caplog.at_level(logging.INFO):
+        decode(partial, output, checkpoint_file)
+    assert "no line is skipped" in caplog.text
+    assert "Skipping 0 lines" in caplog.text
@@ -0,0 +1,45 @@
+import numpy as np
+from conftest import decoder_args
+from decode import Decoder
+from utils import cluster
+
+
+def noisy_copies(oligos, copies, errors, rng):
+    """
+    copies of every oligo with errors substitutions each, and an N in every other copy, shuffled
+    """
+    reads = []
+    for dna in oligos:
+        for copy in range(copies):
+            read = list(dna)
+            for i in rng.choice(len(read), errors, replace=False):
+                read[i] = "ACGT"[("ACGT".index(read[i]) + rng.integers(1, 4)) % 4]
+            if copy % 2:
+                read[rng.integers(len(read))] = "N"
+            reads.append("".join(read))
+    return [reads[i] for i in rng.permutation(len(reads))]
+
+
+def test_consensus_recovers_the_oligos():
+    rng = np.random.default_rng(2)
+    oligos = ["".join(rng.choice(list("ACGT"), 100)) for _ in range(30)]
+    reads = noisy_copies(oligos, 7, 2, rng)
+    labels = cluster.cluster(reads)
+    assert len(np.unique(labels)) == 30
+    assert sorted(cluster.consensus(reads, labels)) == sorted(oligos)
+
+
+def test_erased_position_stays_unknown():
+    labels = np.zeros(2, dtype=np.int64)
+    assert cluster.consensus(["ACNT", "ACNT"], labels) == ["ACNT"]
+    # an N does not outvote the nt of another copy
+    assert cluster.consensus(["ACGT", "ANGT"], labels) == ["ACGT"]
+
+
+def test_decode_clustered_reads(tmp_path, origin, oligos):
+    rng = np.random.default_rng(3)
+    reads = tmp_path / "reads.txt"
+    reads.write_text("".join(dna + "\n" for dna in noisy_copies(oligos.read_text().splitlines(), 3, 1, rng)))
+    output = tmp_path / "decoded"
+    Decoder(str(reads), str(output), cluster_window=1 << 16, **decoder_args()).decode()
+    assert output.read_bytes()[:202] == origin.read_bytes()
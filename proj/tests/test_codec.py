@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from utils import codec
+
+
+def test_bytes_dna_round_trip():
+    messages = np.random.default_rng(0).integers(0, 256, (50, 9), dtype=np.uint8)
+    reads = codec.batch_bytes_to_dna(messages)
+    assert reads[0] == codec.bytes_to_dna(messages[0])
+    data, valid = codec.batch_dna_to_bytes(reads)
+    assert valid.all()
+    assert np.array_equal(data, messages)
+
+
+def test_digit_alphabet():
+    messages = np.array([[0x1B, 0xE4]], dtype=np.uint8)
+    assert codec.batch_bytes_to_dna(messages, codec.DIGITS) == ["01233210"]
+    assert codec.dna_to_bytes("01233210") == [0x1B, 0xE4]
+
+
+def test_invalid_reads():
+    _, valid = codec.batch_dna_to_bytes(["ACGT", "ACNT", "acgt"])
+    assert valid.tolist() == [True, False, True]
+    assert codec.reads_to_bytes(["ACGT", "ACNT"]) == [[0x1B], None]
+    with pytest.raises(ValueError):
+        codec.dna_to_bytes("ACGN")
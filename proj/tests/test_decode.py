@@ -0,0 +1,19 @@
+from reedsolo import RSCodec
+from conftest import decoder_args
+from decode import Decoder
+from utils.glass import clean_flags
+
+
+def test_clean_flags():
+    rs = RSCodec(2)
+    good = list(rs.encode(bytes([1, 2, 3, 4])))
+    bad = good[:-1] + [good[-1] ^ 1]
+    assert clean_flags(rs, [good, bad, None, good[:-1]]) == [True, False, None, None]
+
+
+def test_stream_round_trip(tmp_path, origin, oligos):
+    decoder = Decoder(str(oligos), str(tmp_path / "decoded"), **decoder_args())
+    with open(oligos) as reads:
+        decoded = b"".join(decoder.stream(reads))
+    # the last chunk is zero padded
+    assert decoded == origin.read_bytes() + bytes(2)
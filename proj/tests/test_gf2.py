@@ -0,0 +1,19 @@
+import numpy as np
+from utils import gf2
+
+
+def test_stalled_system():
+    # no equation has a single column, peeling alone stalls at once
+    values = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.uint8)
+    rows = [[0, 1], [1, 2], [0, 1, 2]]
+    payloads = np.array([np.bitwise_xor.reduce(values[row]) for row in rows])
+    solved, got = gf2.inactivation_solve(rows, payloads, 3)
+    assert solved.any()
+    assert np.array_equal(got[solved], values[solved])
+
+
+def test_underdetermined_system():
+    values = np.array([[1, 2], [3, 4]], dtype=np.uint8)
+    payloads = np.array([values[0] ^ values[1]] * 2)
+    solved, _ = gf2.inactivation_solve([[0, 1], [0, 1]], payloads, 2)
+    assert not solved.any()
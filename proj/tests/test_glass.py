@@ -0,0 +1,20 @@
+import numpy as np
+from utils.droplet import Droplet
+from utils.glass import Glass
+
+
+def test_add_droplet_and_view():
+    chunks = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.uint8)
+    glass = Glass(num_chunks=3, chunk_size=2)
+    glass.add_droplet(Droplet(chunks[0] ^ chunks[1], 7, [0, 1]))
+    view = glass.droplet(0)
+    assert view.degree == 2
+    assert view.lone_chunk is None
+    assert view.data.tolist() == (chunks[0] ^ chunks[1]).tolist()
+    glass.add_droplet(Droplet(chunks[1] ^ chunks[2], 8, [1, 2]))
+    assert not glass.is_done()
+    # a droplet of degree 1 solves chunk 2, then the others peel down to one neighbour each
+    glass.add_droplet(Droplet(chunks[2], 9, [2]))
+    assert glass.is_done()
+    assert np.array_equal(glass.chunks, chunks)
+    assert glass.pending_droplets() == 0
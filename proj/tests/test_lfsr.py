@@ -0,0 +1,33 @@
+import itertools
+import numpy as np
+from utils.LFSR import LFSREngine, lfsr, lfsr32p, lfsr32s, lfsr_jump
+
+
+def seeds(state, n):
+    return list(itertools.islice(lfsr(state, lfsr32p()), n))
+
+
+def test_next_batch_matches_generator():
+    engine = LFSREngine(lfsr32s(), block=64)
+    # batches shorter than, equal to and longer than a table block
+    got = np.concatenate([engine.next_batch(n) for n in (1, 63, 64, 200)])
+    assert got.tolist() == seeds(lfsr32s(), 328)
+    assert engine.state == seeds(lfsr32s(), 328)[-1]
+
+
+def test_next_matches_generator():
+    engine = LFSREngine(lfsr32s())
+    assert list(itertools.islice(engine, 50)) == seeds(lfsr32s(), 50)
+
+
+def test_jump_matches_generator():
+    for n in (0, 1, 5, 64, 65, 1000, 4097):
+        expected = seeds(lfsr32s(), n)[-1] if n else lfsr32s()
+        assert LFSREngine(lfsr32s(), block=64).jump(n) == expected
+        assert lfsr_jump(lfsr32s(), lfsr32p(), n) == expected
+
+
+def test_jump_then_batch():
+    engine = LFSREngine(lfsr32s())
+    engine.jump(3000)
+    assert engine.next_batch(10).tolist() == seeds(lfsr32s(), 3010)[3000:]
@@ -0,0 +1,41 @@
+import gzip
+from conftest import decoder_args
+from decode import Decoder
+from utils import merge
+
+ADAPTER1 = "AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC"
+ADAPTER2 = "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT"
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def pair(dna, length):
+    """
+    R1 and R2 of a pair sequencing an insert, length nt each, read through into the adapters
+    """
+    r1 = (dna + ADAPTER1)[:length]
+    r2 = (dna.translate(COMPLEMENT)[::-1] + ADAPTER2)[:length]
+    return r1, r2
+
+
+def test_merge_batch():
+    dna = "ACGTTGCAACGGTACCATGGCATTACGCGATCGATGCAT"
+    r1, r2 = pair(dna, 60)
+    # a low quality error in R1 is outvoted by the high quality base of R2
+    r1 = r1[:5] + "A" + r1[6:]
+    q1 = "I" * 5 + "#" + "I" * 54
+    merged = merge.merge_batch([(r1.encode(), q1.encode())], [(r2.encode(), b"I" * 60)])
+    assert merged[0][0] == dna
+    # reads that do not overlap are not merged
+    assert merge.merge_batch([(b"A" * 30, b"I" * 30)], [(b"A" * 30, b"I" * 30)]) == [("", b"")]
+
+
+def test_decode_merged_pairs(tmp_path, origin, oligos):
+    files = [tmp_path / "R1.fq.gz", tmp_path / "R2.fq.gz"]
+    with gzip.open(files[0], "wt") as f1, gzip.open(files[1], "wt") as f2:
+        for i, dna in enumerate(oligos.read_text().splitlines()):
+            r1, r2 = pair(dna, 60)
+            f1.write("@p{}/1\n{}\n+\n{}\n".format(i, r1, "I" * len(r1)))
+            f2.write("@p{}/2\n{}\n+\n{}\n".format(i, r2, "I" * len(r2)))
+    output = tmp_path / "decoded"
+    Decoder(str(files[0]), str(output), input_file2=str(files[1]), **decoder_args()).decode()
+    assert output.read_bytes()[:202] == origin.read_bytes()
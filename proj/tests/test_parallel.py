@@ -0,0 +1,36 @@
+import pytest
+from conftest import CODE_ARGS, decoder_args
+from decode import Decoder
+from encode import Encoder
+from utils import parallel
+
+
+@pytest.mark.parametrize("output_format", ["text", "pool"])
+def test_parallel_encode_matches_serial(tmp_path, origin, output_format):
+    outputs = []
+    for workers in (1, 2):
+        path = tmp_path / "oligos{}.{}".format(workers, output_format)
+        Encoder(
+            str(origin), str(path), final=2000, batch_size=128, workers=workers, output_format=output_format, **CODE_ARGS
+        ).encode()
+        outputs.append(path.read_bytes())
+    assert outputs[0] == outputs[1]
+
+
+def test_pack_records_round_trip():
+    records = [(7, [1, 2], [0, 3], True), None, (9, bytes([3, 4]), [2], False), None]
+    assert list(parallel.unpack_records(parallel.pack_records(records))) == [
+        (7, bytes([1, 2]), [0, 3], True),
+        None,
+        (9, bytes([3, 4]), [2], False),
+        None,
+    ]
+    # segmented records start with the block id
+    assert list(parallel.unpack_records(parallel.pack_records([(1, 7, [5], [4], True)]))) == [(1, 7, bytes([5]), [4], True)]
+    assert list(parallel.unpack_records(parallel.pack_records([None, None]))) == [None, None]
+
+
+def test_parallel_decode(tmp_path, origin, oligos):
+    output = tmp_path / "decoded"
+    Decoder(str(oligos), str(output), workers=2, **decoder_args()).decode()
+    assert output.read_bytes()[:202] == origin.read_bytes()
@@ -0,0 +1,32 @@
+from conftest import CODE_ARGS, decoder_args
+from decode import Decoder
+from encode import Encoder
+from utils import pool
+
+
+def test_pool_round_trip(tmp_path, origin, oligos):
+    path = tmp_path / "oligos.pool"
+    Encoder(str(origin), str(path), final=2000, output_format="pool", **CODE_ARGS).encode()
+    reads = oligos.read_text().splitlines()
+    with pool.PoolReader(str(path)) as reader:
+        assert reader.header.K == 51
+        assert list(reader.reads()) == reads
+        # the seed index finds every record by its seed
+        seeds = pool.seeds_of(reader.records, reader.header.seed_offset)
+        for record in (0, 1234, 1999):
+            assert record in reader.find(int(seeds[record]))
+    text = tmp_path / "pool.txt"
+    pool.pool_to_text(str(path), str(text))
+    assert text.read_text().splitlines() == reads
+    again = tmp_path / "again.pool"
+    assert pool.text_to_pool(str(text), str(again), pool.PoolHeader(4, 2, 51, 0.001, 0.025, 0, 0)) == 2000
+    with pool.PoolReader(str(again)) as reader:
+        assert list(reader.reads()) == reads
+
+
+def test_decode_pool(tmp_path, origin):
+    path = tmp_path / "oligos.pool"
+    Encoder(str(origin), str(path), final=2000, output_format="pool", **CODE_ARGS).encode()
+    output = tmp_path / "decoded"
+    Decoder(str(path), str(output), **decoder_args()).decode()
+    assert output.read_bytes()[:202] == origin.read_bytes()
@@ -0,0 +1,12 @@
+from utils.robust_solution import BATCH_GENERATORS, PRNG
+
+
+def test_batch_matches_each_seed(tmp_path):
+    seeds = list(range(BATCH_GENERATORS + 100)) + [2**32 - 1]
+    for K in (51, 5000):
+        expected = [PRNG(K, 0.001, 0.025).get_src_blocks_wrap(seed) for seed in seeds]
+        assert list(zip(*PRNG(K, 0.001, 0.025).get_src_blocks_batch(seeds))) == expected
+        # with some of the seeds already in the cache
+        prng = PRNG(K, 0.001, 0.025, cache_dir=str(tmp_path))
+        prng.get_src_blocks_wrap(5)
+        assert list(zip(*prng.get_src_blocks_batch(seeds))) == expected
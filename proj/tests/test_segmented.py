@@ -0,0 +1,22 @@
+import pytest
+from conftest import CODE_ARGS, decoder_args
+from decode import Decoder
+from encode import Encoder
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_segmented_round_trip(tmp_path, origin, workers):
+    oligos = tmp_path / "blocks.txt"
+    Encoder(str(origin), str(oligos), final=2000, block_chunks=20, workers=workers, **CODE_ARGS).encode()
+    output = tmp_path / "decoded"
+    Decoder(str(oligos), str(output), block_chunks=20, workers=workers, **decoder_args()).decode()
+    assert output.read_bytes()[:202] == origin.read_bytes()
+
+
+def test_segmented_parallel_encode_matches_serial(tmp_path, origin):
+    outputs = []
+    for workers in (1, 2):
+        path = tmp_path / "blocks{}.txt".format(workers)
+        Encoder(str(origin), str(path), final=2000, block_chunks=20, workers=workers, **CODE_ARGS).encode()
+        outputs.append(path.read_bytes())
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,48 @@
+import logging
+import re
+import numpy as np
+import pytest
+from conftest import CODE_ARGS
+from encode import Encoder
+from utils import pool
+
+
+def test_pool_top_up_continues_the_seeds(tmp_path, origin):
+    whole = tmp_path / "whole.pool"
+    Encoder(str(origin), str(whole), final=2000, output_format="pool", **CODE_ARGS).encode()
+    topped = tmp_path / "topped.pool"
+    Encoder(str(origin), str(topped), final=1000, output_format="pool", **CODE_ARGS).encode()
+    with pool.PoolReader(str(topped)) as reader:
+        state = reader.header.lfsr_state
+    Encoder(str(origin), str(topped), final=1000, lfsr_state=state, output_format="pool", **CODE_ARGS).encode()
+    with pool.PoolReader(str(whole)) as a, pool.PoolReader(str(topped)) as b:
+        assert list(a.reads()) == list(b.reads())
+        assert a.header.lfsr_state == b.header.lfsr_state
+
+
+def test_text_top_up_from_seed_index(tmp_path, origin, caplog):
+    whole = tmp_path / "whole.txt"
+    Encoder(str(origin), str(whole), final=2000, **CODE_ARGS).encode()
+    topped = tmp_path / "topped.txt"
+    with caplog.at_level(logging.INFO):
+        Encoder(str(origin), str(topped), final=1000, **CODE_ARGS).encode()
+    seed_index = int(re.findall(r"seed_index=(\d+)", caplog.text)[-1])
+    Encoder(str(origin), str(topped), final=1000, seed_index=seed_index, **CODE_ARGS).encode()
+    assert topped.read_text() == whole.read_text()
+
+
+def test_segmented_top_up_from_another_state(tmp_path, origin):
+    path = tmp_path / "blocks.pool"
+    args = dict(block_chunks=20, output_format="pool", **CODE_ARGS)
+    Encoder(str(origin), str(path), final=1000, **args).encode()
+    with pool.PoolReader(str(path)) as reader:
+        state = reader.header.lfsr_state
+        num_records = len(reader)
+    # the state of a block that did not go as far as the furthest one would repeat its seeds
+    with pytest.raises(SystemExit):
+        Encoder(str(origin), str(path), final=100, lfsr_state=state ^ 1, **args).encode()
+    Encoder(str(origin), str(path), final=100, lfsr_state=state, **args).encode()
+    with pool.PoolReader(str(path)) as reader:
+        assert len(reader) > num_records
+        # no block wrote the same oligo twice
+        assert len(np.unique(reader.records, axis=0)) == len(reader)
@@ -0,0 +1,38 @@
+from utils import verify
+
+
+def write(path, data):
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+def test_zero_padding_is_not_a_difference(tmp_path):
+    origin = write(tmp_path / "origin", range(10))
+    decoded = write(tmp_path / "decoded", list(range(10)) + [0, 0])
+    assert verify.verify(origin, decoded, chunk_size=4)["same"]
+    # without the chunk size the padding is compared too
+    assert not verify.verify(origin, decoded)["same"]
+
+
+def test_nonzero_padding_is_a_difference(tmp_path):
+    origin = write(tmp_path / "origin", range(10))
+    decoded = write(tmp_path / "decoded", list(range(10)) + [0, 1])
+    assert verify.verify(origin, decoded, chunk_size=4)["ranges"] == [(10, 12)]
+
+
+def test_ranges_and_chunks(tmp_path):
+    data = list(range(20))
+    origin = write(tmp_path / "origin", data)
+    data[1] = data[2] = data[9] = 255
+    decoded = write(tmp_path / "decoded", data)
+    # blocks of 4 bytes: runs across blocks are merged
+    assert verify.diff_ranges(origin, decoded, block_size=4) == [(1, 3), (9, 10)]
+    result = verify.verify(origin, decoded, chunk_size=4, block_size=4)
+    assert not result["same"]
+    assert result["ranges"] == [(1, 3), (9, 10)]
+    assert result["chunks"] == [0, 2]
+
+
+def test_ranges_to_chunks():
+    assert verify.ranges_to_chunks([], 4).tolist() == []
+    assert verify.ranges_to_chunks([(3, 5), (16, 17)], 4).tolist() == [0, 1, 4]
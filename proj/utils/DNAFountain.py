@@ -1,11 +1,33 @@
 from typing import List, Tuple
 from .misc import process_raw_input
 from .robust_solution import PRNG
-from .droplet import Droplet
+from .droplet import BLOCK_MASK, Droplet
 from . import LFSR
 from . import scr_rept as sr
+from . import codec
+from . import metrics
 from reedsolo import RSCodec
-import operator, math
+import numpy as np
+import itertools, struct
+
+
+def xor_chunks(data_array: np.ndarray, neighbours: List[List[int]]) -> np.ndarray:
+    """
+    XOR the chunks of every neighbour list in one pass.
+    :param
+    data_array: chunk matrix of shape (num_chunks, chunk_size); type: np.ndarray or ChunkStore
+    neighbours: one non-empty list of chunk numbers per droplet; type: list
+
+    :return
+    payloads: matrix of shape (len(neighbours), chunk_size); type: np.ndarray
+    """
+    degrees = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+    offsets = np.zeros(len(neighbours), dtype=np.int64)
+    np.cumsum(degrees[:-1], out=offsets[1:])
+    flat = np.fromiter(
+        itertools.chain.from_iterable(neighbours), dtype=np.int64, count=degrees.sum()
+    )
+    return np.bitwise_xor.reduceat(data_array[flat], offsets, axis=0)
 
 
 class DNAFountain:
@@ -20,8 +42,17 @@ class DNAFountain:
         max_homopolymer=3,
         gc=0.05,
         final: int = None,
+        data_array: np.ndarray = None,
+        block: int = None,
+        lfsr_state: int = None,
+        seed_index: int = None,
     ):
         """
+        input_file: file to encode, ignored when data_array is given
+        data_array: an already loaded (num_chunks, chunk_size) chunk matrix or ChunkStore
+        block: id of the block when the file is segmented, written in the header of every oligo
+        lfsr_state: top-up: continue after this lfsr state, the last seed of an earlier encode
+        seed_index: top-up: continue after this many lfsr steps, jumped ahead in O(log seed_index)
         alpha: the redundency level
         final: maximal number of oligos; type = int
         chunk_size: in bytes
@@ -33,10 +64,15 @@ class DNAFountain:
         """
 
         # things realted to data:
-        data_array, data_len = process_raw_input(input_file, chunk_size)
+        if data_array is None:
+            data_array, _ = process_raw_input(input_file, chunk_size)
+        # chunk store indexable as a (num_chunks, chunk_size) matrix, so that payloads of many droplets are XORed at once
         self.data_array = data_array
         self.chunk_size = chunk_size
-        self.num_chunks = int(math.ceil(data_len / float(chunk_size)))
+        self.num_chunks = len(self.data_array)
+        self.block = block
+        # number of bytes of the block id header in front of the seed
+        self.block_header_l = 0 if block is None else struct.calcsize("!H")
         self.alpha = alpha
         self.final = (
             final if final is not None else int(self.num_chunks * (1 + self.alpha)) + 1
@@ -44,10 +80,21 @@ class DNAFountain:
 
         # things related to random mnumber generator:
         # starting an lfsr with a certain state and a polynomial for 32bits.
-        self.lfsr = LFSR.lfsr_s_p()
         # calculate the length of lsfr in bits
         self.lfsr_l = len("{:b}".format(LFSR.lfsr32p())) - 1
-        self.seed = next(self.lfsr)
+        # number of lfsr steps deployed, counted from the initial state when it is known
+        self.start_index = seed_index
+        self.steps = 0
+        if lfsr_state is None and seed_index is None:
+            self.lfsr = LFSR.LFSREngine(LFSR.lfsr32s(), LFSR.lfsr32p())
+            self.start_index = 0
+            self.seed = self._next_seed()
+        else:
+            # the lfsr does not repeat a state within its period, so the seeds after the last one of an earlier encode are all new
+            self.lfsr = LFSR.LFSREngine(LFSR.lfsr32s() if lfsr_state is None else lfsr_state, LFSR.lfsr32p())
+            if lfsr_state is None:
+                self.lfsr.jump(seed_index)
+            self.seed = self.lfsr.state
 
         # creating the solition distribution object
         self.PRNG = PRNG(K=self.num_chunks, delta=delta, c=c_dist)
@@ -62,8 +109,12 @@ class DNAFountain:
         self.max_homopolymer = max_homopolymer
         self.tries: int = 0  # number of times we tried to create a droplet
         self.good: int = 0  # droplets that were screened successfully
-        # number of nucleotides in an oligo
-        self.oligo_l = (self.chunk_size * 8 + self.lfsr_l + self.rs * 8) / 4
+        # number of droplets violating each constraint in screen_batch
+        self.rejections = {name: 0 for name in sr.REASONS.values()}
+        # number of nucleotides in an oligo (2 bits per nucleotide)
+        self.oligo_l = (
+            self.chunk_size * 8 + self.lfsr_l + self.rs * 8 + self.block_header_l * 8
+        ) // 2
 
     def _rand_chunk_nums(self) -> Tuple[int, List[int]]:
         """
@@ -71,21 +122,28 @@ class DNAFountain:
         It updates the lfsr to generates a new seed.
         This function creates a fresh seed for the droplet and primes the solition inverse cdf sampler
         """
-        self.seed = next(self.lfsr)  # deploy one round of lfsr, and read the register.
+        self.seed = self._next_seed()  # deploy one round of lfsr, and read the register.
         self.PRNG.set_seed(self.seed)  # update the seed with the register
         degree, ix_samples = self.PRNG.get_src_blocks_wrap()
         return degree, ix_samples  # return a list of segments.
 
+    def _next_seed(self) -> int:
+        self.steps += 1
+        return next(self.lfsr)
+
+    @property
+    def seed_index(self) -> int:
+        """
+        number of lfsr steps from the initial state to the current seed, None if the encode started from an lfsr state
+        """
+        return None if self.start_index is None else self.start_index + self.steps
+
     def droplet(self) -> Droplet:
         # creating a droplet.
-        data = None
         # creating a random list of segments.
         degree, num_chunks = self._rand_chunk_nums()
-        for num in num_chunks:  # iterating over each segment
-            if data is None:  # first round. data payload is empty.
-                data = self.data_array[num]  # just copy the segment to the payload.
-            else:  # more rounds. Starting xoring the new segments with the payload.
-                data = list(map(operator.xor, data, self.data_array[num]))
+        # xoring all the segments into the payload.
+        data = np.bitwise_xor.reduce(self.data_array[num_chunks], axis=0)
         self.tries += 1  # upadte counter.
 
         return Droplet(
@@ -95,10 +153,151 @@ class DNAFountain:
             rs_obj=self.rs_obj,
             num_chunks=num_chunks,
             degree=degree,
+            block=self.block,
         )
 
+    def next_seeds(self, n: int) -> List[int]:
+        """
+        Deploy n rounds of the lfsr and return the seeds.
+        """
+        seeds = self.lfsr.next_batch(n).tolist()
+        self.steps += n
+        self.seed = seeds[-1]
+        return seeds
+
+    def skip_seeds(self, n: int) -> int:
+        """
+        Deploy n rounds of the lfsr without computing the seeds, for a worker to compute them.
+        :return
+        the lfsr state the n seeds follow, they are LFSR.LFSREngine(state).next_batch(n); type: int
+        """
+        state = self.lfsr.state
+        self.seed = self.lfsr.jump(n)
+        self.steps += n
+        return state
+
+    def droplets(self, n: int) -> List[Droplet]:
+        """
+        Create n droplets from the next n seeds of the lfsr.
+        The payloads are identical to calling droplet() n times, but are XORed in a single batch.
+        """
+        return self.droplets_from_seeds(self.next_seeds(n))
+
+    def droplets_from_seeds(self, seeds: List[int]) -> List[Droplet]:
+        """
+        Create one droplet for every given seed, without touching the lfsr.
+        """
+        degrees, samples = self.PRNG.get_src_blocks_batch(seeds)
+        payloads = xor_chunks(self.data_array, samples)
+        self.tries += len(seeds)
+        if metrics.ENABLED:
+            metrics.inc("droplets_total", len(seeds))
+            for degree in degrees:
+                metrics.observe("droplet_degree", degree)
+
+        return [
+            Droplet(
+                data=data,
+                seed=seed,
+                rs=self.rs,
+                rs_obj=self.rs_obj,
+                num_chunks=num_chunks,
+                degree=degree,
+                block=self.block,
+            )
+            for data, seed, num_chunks, degree in zip(payloads, seeds, samples, degrees)
+        ]
+
     def screen(self, droplet) -> bool:
-        if sr.screen_repeat(droplet, self.max_homopolymer, self.gc):
+        reason = sr.screen_reason(droplet, self.max_homopolymer, self.gc)
+        if reason == 0:
             self.good += 1
             return True
+        self.count_rejections(np.array([reason]))
         return False
+
+    def screen_batch(self, droplets: List[Droplet], limit: int = None) -> List[Droplet]:
+        """
+        Screen a batch of droplets with the same constraints as screen(), and return the ones that passed in order.
+        limit: maximal number of droplets to accept; type = int
+        Once limit droplets passed, the rest of the batch counts as never created, as if the droplets were made one
+        at a time: they are taken off tries and the rejection counts, and the lfsr is rewound to the last droplet
+        examined when the batch holds its latest seeds.
+        """
+        if len(droplets) == 0:
+            return []
+        reasons, passed_dna = self.screen_reasons(droplets)
+        passed = np.flatnonzero(reasons == 0)
+        examined = len(droplets)
+        if limit is not None and 0 < limit <= len(passed):
+            passed = passed[:limit]
+            passed_dna = passed_dna[:limit]
+            examined = int(passed[-1]) + 1
+            unused = len(droplets) - examined
+            self.tries -= unused
+            if unused and droplets[-1].seed == self.seed:
+                self.rewind(unused, droplets[examined - 1].seed)
+        self.count_rejections(reasons[:examined])
+
+        accepted = []
+        for i, dna in zip(passed.tolist(), passed_dna):
+            droplets[i].dna = dna
+            accepted.append(droplets[i])
+        self.good += len(accepted)
+        if metrics.ENABLED:
+            metrics.inc("oligos_accepted_total", len(accepted))
+        return accepted
+
+    def screen_reasons(self, droplets: List[Droplet]) -> Tuple[np.ndarray, List[str]]:
+        """
+        The screen of screen_batch without any counting. Droplets whose seed and payload already violate
+        a constraint are rejected before their RS parity is computed.
+        :return
+        reasons: sr.REASONS flags of every droplet, 0 for the ones that passed; type: np.ndarray
+        dna: the oligos of the droplets that passed, in order; type: list
+        """
+        # block id and seed (big endian) followed by the payload, as 2-bit symbols
+        seeds = np.array([d.seed for d in droplets], dtype=np.uint32)
+        if self.block is None:
+            header = np.zeros((len(droplets), 0), dtype=np.uint8)
+        else:
+            header = (self.block ^ (seeds & BLOCK_MASK)).astype(">u2").view(np.uint8)
+            header = header.reshape(len(droplets), -1)
+        seeds = seeds.astype(">u4").view(np.uint8)
+        payloads = np.array([d.data for d in droplets], dtype=np.uint8)
+        prefix_bytes = np.concatenate(
+            [header, seeds.reshape(len(droplets), 4), payloads], axis=1
+        )
+        prefix = codec.bytes_to_symbols(prefix_bytes)
+
+        reasons = sr.screen_prefix(prefix, self.oligo_l, self.max_homopolymer, self.gc)
+        survivors = np.flatnonzero(reasons == 0)
+        if len(survivors) > 0 and self.rs > 0:
+            parity = b"".join(
+                bytes(self.rs_obj.encode(prefix_bytes[i].tobytes())[-self.rs :])
+                for i in survivors
+            )
+            parity = np.frombuffer(parity, dtype=np.uint8).reshape(len(survivors), -1)
+            symbols = np.concatenate([prefix[survivors], codec.bytes_to_symbols(parity)], axis=1)
+        else:
+            symbols = prefix[survivors]
+        reasons[survivors] = sr.screen_batch(symbols, self.max_homopolymer, self.gc)
+        return reasons, codec.symbols_to_dna(symbols[reasons[survivors] == 0], codec.DIGITS)
+
+    def count_rejections(self, reasons: np.ndarray) -> None:
+        """
+        add the screen_reasons flags of the examined droplets to the rejection counts
+        """
+        for flag, name in sr.REASONS.items():
+            count = int(np.count_nonzero(reasons & flag))
+            self.rejections[name] += count
+            if metrics.ENABLED:
+                metrics.inc("screen_rejections_total", count, reason=name)
+
+    def rewind(self, n: int, seed: int) -> None:
+        """
+        Take back the last n lfsr steps, their seeds were not used. seed is the seed before them.
+        """
+        self.lfsr.state = seed
+        self.seed = seed
+        self.steps -= n
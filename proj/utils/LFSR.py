@@ -1,3 +1,8 @@
+import functools
+from typing import List
+import numpy as np
+
+
 def lfsr(state: int, mask: int):
     """
     Galois lfsr:
@@ -31,3 +36,167 @@ def lfsr32s() -> int:
 
 def lfsr_s_p():
     return lfsr(lfsr32s(), lfsr32p())
+
+
+def _mulmod(a: int, b: int, mask: int) -> int:
+    """
+    product of two polynomials over GF(2) modulo the lfsr polynomial, as bit strings
+    """
+    nbits = mask.bit_length() - 1
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+        if a >> nbits:
+            a ^= mask
+    return result
+
+
+def lfsr_jump(state: int, mask: int, n: int) -> int:
+    """
+    state of the Galois lfsr after n steps, in O(log n) multiplications.
+    One step multiplies the state by x modulo the polynomial, so n steps multiply it by x^n.
+    """
+    power, x = 1, 2
+    while n:
+        if n & 1:
+            power = _mulmod(power, x, mask)
+        x = _mulmod(x, x, mask)
+        n >>= 1
+    return _mulmod(state, power, mask)
+
+
+# seeds computed per lookup by LFSREngine, the size of its step table
+ENGINE_BLOCK = 1024
+
+
+def _step(states: np.ndarray, mask: int) -> np.ndarray:
+    """
+    one step of the Galois lfsr on an array of states
+    """
+    nbits = mask.bit_length() - 1
+    states = states << 1
+    return np.where(states >> nbits, states ^ mask, states)
+
+
+@functools.lru_cache(maxsize=None)
+def _step_table(mask: int, block: int) -> np.ndarray:
+    """
+    Byte lookup table of the step matrices A^1 .. A^block of the lfsr (A is one step, a 32x32 matrix over GF(2)):
+    table[k, p, v] is the state k + 1 steps after the state v << 8p, so the state k + 1 steps after any state s
+    is the XOR of table[k, p, byte p of s] over its 4 bytes.
+    """
+    nbits = mask.bit_length() - 1
+    # columns of A^(k+1): the basis states e_j after k + 1 steps
+    columns = np.empty((block, nbits), dtype=np.uint64)
+    states = np.uint64(1) << np.arange(nbits, dtype=np.uint64)
+    for k in range(block):
+        states = _step(states, mask)
+        columns[k] = states
+    columns = np.pad(columns, ((0, 0), (0, 32 - nbits))).astype(np.uint32).reshape(block, 4, 8)
+    table = np.zeros((block, 4, 256), dtype=np.uint32)
+    for v in range(1, 256):
+        low = v & -v
+        table[:, :, v] = table[:, :, v ^ low] ^ columns[:, :, low.bit_length() - 1]
+    return table
+
+
+def _apply(matrix: List[int], state: int) -> int:
+    """
+    product of a GF(2) matrix, given by its columns as bit strings, and a state
+    """
+    result = 0
+    j = 0
+    while state:
+        if state & 1:
+            result ^= matrix[j]
+        state >>= 1
+        j += 1
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _jump_matrices(mask: int) -> List[List[int]]:
+    """
+    columns of A^(2^i) for i < 64, every one the square of the previous one
+    """
+    nbits = mask.bit_length() - 1
+    matrix = [int(column) for column in _step(np.uint64(1) << np.arange(nbits, dtype=np.uint64), mask)]
+    matrices = [matrix]
+    for _ in range(63):
+        matrix = [_apply(matrix, column) for column in matrix]
+        matrices.append(matrix)
+    return matrices
+
+
+class LFSREngine:
+    """
+    The Galois lfsr of lfsr() for registers of up to 32 bits, emitting its seeds in uint32 batches: a batch of up to
+    ENGINE_BLOCK seeds is 4 lookups in the precomputed step table. The register jumps ahead n steps with
+    O(log n) GF(2) matrix products. next() yields the same seeds as the generator, one at a time.
+    """
+
+    def __init__(self, state: int, mask: int = None, block: int = ENGINE_BLOCK):
+        """
+        state: the register, the first seed is the state one step after it; type = int
+        mask: the lfsr polynomial, lfsr32p() if None; type = int
+        block: number of seeds per table lookup; type = int
+        """
+        self.mask = lfsr32p() if mask is None else mask
+        self.nbits = self.mask.bit_length() - 1
+        if self.nbits > 32:
+            raise ValueError("the lfsr engine runs registers of up to 32 bits, not {}".format(self.nbits))
+        self.state = state
+        self.block = block
+        self.table = _step_table(self.mask, block)
+
+    def __iter__(self) -> "LFSREngine":
+        return self
+
+    def __next__(self) -> int:
+        self.state <<= 1
+        if self.state >> self.nbits:
+            self.state ^= self.mask
+        return self.state
+
+    def next_batch(self, n: int) -> np.ndarray:
+        """
+        the next n seeds, as n next() calls
+        """
+        seeds = np.empty(n, dtype=np.uint32)
+        table = self.table
+        for start in range(0, n, self.block):
+            m = min(self.block, n - start)
+            s = self.state
+            seeds[start : start + m] = (
+                table[:m, 0, s & 0xFF]
+                ^ table[:m, 1, (s >> 8) & 0xFF]
+                ^ table[:m, 2, (s >> 16) & 0xFF]
+                ^ table[:m, 3, s >> 24]
+            )
+            self.state = int(seeds[start + m - 1])
+        return seeds
+
+    def jump(self, n: int) -> int:
+        """
+        move the register n steps ahead without computing the seeds in between, and return the new state
+        """
+        if 0 < n <= self.block:
+            s = self.state
+            table = self.table[n - 1]
+            self.state = int(
+                table[0, s & 0xFF] ^ table[1, (s >> 8) & 0xFF] ^ table[2, (s >> 16) & 0xFF] ^ table[3, s >> 24]
+            )
+            return self.state
+        for matrix in _jump_matrices(self.mask):
+            if n == 0:
+                break
+            if n & 1:
+                self.state = _apply(matrix, self.state)
+            n >>= 1
+        if n:
+            # beyond 2^64 steps, the rest is jumped through the polynomial
+            self.state = lfsr_jump(self.state, self.mask, n << 64)
+        return self.state
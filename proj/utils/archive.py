@@ -0,0 +1,152 @@
+import json
+import os
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from .DNAFountain import DNAFountain
+from .droplet import BLOCK_MASK
+from .misc import process_raw_input
+from .segmented import BLOCK_ID_SIZE, SegmentedGlass
+from . import codec
+
+# Archive pool: every object (file) is an independent fountain code with its object id in the block id
+# header of its oligos (whitened by the seed, as in a segmented file). Object 0 is the manifest, a JSON
+# description of the other objects, so a decoder that knows only the manifest size can find any file.
+MANIFEST_ID = 0
+# small codes need a larger overhead, and nothing can be restored without the manifest
+MANIFEST_OVERHEAD = 4
+MANIFEST_EXTRA = 32
+# number of nt of the object id and the seed at the start of every oligo
+ID_NT = (BLOCK_ID_SIZE + 4) * 4
+
+
+def build_manifest(input_files: List[str], chunk_size: int) -> Tuple[bytes, List[Dict[str, Any]]]:
+    """
+    the manifest of an archive of the files, and its entries: object id, name, size and number of chunks of every file
+    """
+    if len(input_files) >= 1 << (8 * BLOCK_ID_SIZE):
+        raise ValueError("{} files do not fit in the object id".format(len(input_files)))
+    entries = []
+    for object_id, path in enumerate(input_files, start=MANIFEST_ID + 1):
+        size = os.path.getsize(path)
+        entries.append(dict(id=object_id, name=os.path.basename(path), size=size, num_chunks=-(-size // chunk_size)))
+    manifest = json.dumps(dict(chunk_size=chunk_size, objects=entries), separators=(",", ":")).encode("utf-8")
+    return manifest, entries
+
+
+def manifest_chunks(manifest: bytes, chunk_size: int) -> np.ndarray:
+    """
+    the manifest as a zero padded (num_chunks, chunk_size) chunk matrix
+    """
+    num_chunks = -(-len(manifest) // chunk_size)
+    chunks = np.zeros((num_chunks, chunk_size), dtype=np.uint8)
+    chunks.reshape(-1)[: len(manifest)] = np.frombuffer(manifest, dtype=np.uint8)
+    return chunks
+
+
+def parse_manifest(data: bytes) -> List[Dict[str, Any]]:
+    return json.loads(bytes(data).rstrip(b"\0").decode("utf-8"))["objects"]
+
+
+def archive_fountains(input_files: List[str], fountain_args: Dict[str, Any]) -> List[DNAFountain]:
+    """
+    one DNAFountain per object: the manifest first, then every non-empty file.
+    A given final number of oligos is shared between the files in proportion to their size.
+    Every object starts from the same lfsr_state / seed_index: for a top-up, that of the furthest object (Encoder logs it).
+    """
+    chunk_size = fountain_args["chunk_size"]
+    manifest, entries = build_manifest(input_files, chunk_size)
+    chunks = manifest_chunks(manifest, chunk_size)
+    args = dict(fountain_args, final=MANIFEST_OVERHEAD * len(chunks) + MANIFEST_EXTRA)
+    fountains = [DNAFountain(None, data_array=chunks, block=MANIFEST_ID, **args)]
+    final = fountain_args.get("final")
+    total = sum(entry["num_chunks"] for entry in entries)
+    for path, entry in zip(input_files, entries):
+        if entry["num_chunks"] == 0:
+            # empty files are restored from the manifest alone
+            continue
+        args = dict(fountain_args)
+        if final is not None:
+            args["final"] = -(-final * entry["num_chunks"] // total)
+        store, _ = process_raw_input(path, chunk_size)
+        fountains.append(DNAFountain(None, data_array=store, block=entry["id"], **args))
+    return fountains
+
+
+def object_ids(batch) -> np.ndarray:
+    """
+    Object id of every read of a batch (DNA strings, or packed pool records), read from the raw header
+    without RS correction, -1 for reads that are too short or not DNA. Reads with an error in the header
+    may get a wrong id, it is checked again after correction.
+    """
+    if isinstance(batch, np.ndarray):
+        head = batch[:, : BLOCK_ID_SIZE + 4].astype(np.int64)
+        valid = np.ones(len(batch), dtype=bool)
+    else:
+        head, valid = codec.batch_dna_to_bytes([dna[:ID_NT].ljust(ID_NT, "N") for dna in batch])
+        head = head.astype(np.int64)
+    header = (head[:, 0] << 8) | head[:, 1]
+    # the low 16 bits of the big endian seed are its last two bytes
+    seed_low = (head[:, BLOCK_ID_SIZE + 2] << 8) | head[:, BLOCK_ID_SIZE + 3]
+    ids = (header ^ seed_low) & BLOCK_MASK
+    ids[~valid] = -1
+    return ids
+
+
+def select(batch, wanted: np.ndarray):
+    """
+    the reads of a batch whose object id is in wanted
+    """
+    if len(batch) == 0:
+        return batch
+    keep = np.isin(object_ids(batch), wanted)
+    if isinstance(batch, np.ndarray):
+        return batch[keep]
+    return [dna for dna, k in zip(batch, keep.tolist()) if k]
+
+
+class ArchiveGlass(SegmentedGlass):
+    """
+    Decoder state of some objects of an archive: a SegmentedGlass whose blocks are the objects, every one with
+    its own number of chunks. Objects that are not requested are marked done from the start, so their reads are
+    dropped after RS correction (most of them before, by select). A finished object is written to its own file,
+    or kept in memory without a path.
+    """
+
+    def __init__(
+        self,
+        objects: Dict[int, int],
+        paths: Dict[int, str] = None,
+        sizes: Dict[int, int] = None,
+        **glass_args,
+    ):
+        """
+        objects: object id -> number of chunks of the requested objects; type = dict
+        paths: object id -> output file, objects without one are kept in finished; type = dict
+        sizes: object id -> number of bytes the output file is cut to (the chunks are zero padded); type = dict
+        glass_args: Glass parameters, but num_chunks
+        """
+        total = sum(objects.values())
+        super().__init__(num_chunks=total, block_chunks=max(1, total), **glass_args)
+        size = max(objects) + 1
+        self.ranges = [(0, objects.get(object_id, 0)) for object_id in range(size)]
+        self.done = np.ones(size, dtype=bool)
+        self.done[list(objects)] = False
+        self.paths = paths or dict()
+        self.sizes = sizes or dict()
+        # chunks of the finished objects without a path
+        self.finished: Dict[int, np.ndarray] = dict()
+
+    def wanted(self) -> np.ndarray:
+        return np.flatnonzero(~self.done)
+
+    def _finish(self, block: int) -> None:
+        glass = self.blocks.pop(block)
+        glass.save_cache()
+        self.done[block] = True
+        path = self.paths.get(block)
+        if path is None:
+            self.finished[block] = glass.flatten_chunks()
+            return
+        data = glass.flatten_chunks()
+        with open(path, "wb") as file:
+            file.write(memoryview(data[: self.sizes.get(block, len(data))]))
@@ -0,0 +1,151 @@
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+from .glass import Glass
+from .robust_solution import PRNG
+from .segmented import SegmentedGlass
+from . import codec
+
+_NT_BYTES = np.frombuffer(codec.NT.encode("ascii"), dtype=np.uint8)
+
+
+class Channel:
+    """
+    Synthesis, storage and sequencing noise: every read picks an oligo by its abundance, then every nt of
+    the read is independently substituted, deleted or followed by an inserted random nt.
+    Abundances follow a gamma distribution (negative binomial read counts) and a fraction of the oligos drops out.
+    """
+
+    def __init__(
+        self,
+        substitution: float = 0.0,
+        insertion: float = 0.0,
+        deletion: float = 0.0,
+        dropout: float = 0.0,
+        dispersion: float = 0.0,
+    ):
+        """
+        substitution, insertion, deletion: per nt error rates; type = float
+        dropout: fraction of oligos that are lost (never read); type = float
+        dispersion: variance / mean^2 of the oligo abundances, 0 for uniform coverage; type = float
+        """
+        self.substitution = substitution
+        self.insertion = insertion
+        self.deletion = deletion
+        self.dropout = dropout
+        self.dispersion = dispersion
+
+    def abundances(self, num_oligos: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        probability of every oligo to be read
+        """
+        if self.dispersion > 0:
+            weights = rng.gamma(1.0 / self.dispersion, self.dispersion, num_oligos)
+        else:
+            weights = np.ones(num_oligos)
+        weights[rng.random(num_oligos) < self.dropout] = 0.0
+        total = weights.sum()
+        if total == 0:
+            raise ValueError("every oligo dropped out")
+        return weights / total
+
+    def corrupt(self, symbols: np.ndarray, rng: np.random.Generator) -> List[str]:
+        """
+        apply the nt errors to a (n, L) matrix of 2-bit symbols
+        :return
+        reads: noisy DNA strings, of L nt give or take the indels; type: list
+        """
+        n, width = symbols.shape
+        symbols = symbols.copy()
+        u = rng.random((n, width))
+        deleted = u < self.deletion
+        substituted = (u >= self.deletion) & (u < self.deletion + self.substitution)
+        # a substitution moves to one of the 3 other nt
+        symbols[substituted] = (symbols[substituted] + rng.integers(1, 4, int(substituted.sum()), dtype=np.uint8)) & 3
+        inserted = (rng.random((n, width)) < self.insertion) & ~deleted
+        # every nt is written 0 (deleted), 1 or 2 (followed by an insertion) times
+        counts = (1 - deleted.astype(np.int64) + inserted).reshape(-1)
+        out = np.repeat(symbols.reshape(-1), counts)
+        ends = np.cumsum(counts)
+        extra = ends[inserted.reshape(-1)] - 1
+        out[extra] = rng.integers(0, 4, len(extra), dtype=np.uint8)
+        # split the stream of nt into the reads
+        bounds = np.zeros(n + 1, dtype=np.int64)
+        bounds[1:] = ends[width - 1 :: width] if width else 0
+        text = _NT_BYTES[out].tobytes().decode("ascii")
+        bounds = bounds.tolist()
+        return [text[bounds[i] : bounds[i + 1]] for i in range(n)]
+
+    def reads(self, symbols: np.ndarray, rng: np.random.Generator, batch_size: int = 4096) -> Iterator[List[str]]:
+        """
+        endless stream of batches of noisy reads of the oligos of a (num_oligos, L) symbol matrix
+        """
+        weights = self.abundances(len(symbols), rng)
+        while True:
+            picked = rng.choice(len(symbols), size=batch_size, p=weights)
+            yield self.corrupt(symbols[picked], rng)
+
+
+# per worker process state, set up once by the pool initializer
+_symbols: np.ndarray = None
+_glass_args: Dict[str, Any] = None
+_block_chunks: Optional[int] = None
+_prng: Optional[PRNG] = None
+_expected: Optional[np.ndarray] = None
+
+
+def init_trials(
+    oligos: List[str], glass_args: Dict[str, Any], block_chunks: int = None, expected: np.ndarray = None
+) -> None:
+    """
+    expected: the (num_chunks, chunk_size) chunks of the encoded file, so that RS miscorrections that
+    still let the decoder finish count as failures, None to trust the decoder; type = np.ndarray
+    """
+    global _symbols, _glass_args, _block_chunks, _prng, _expected
+    _symbols, valid = codec.dna_to_symbols(oligos)
+    _symbols = _symbols[valid]
+    _glass_args = glass_args
+    _block_chunks = block_chunks
+    _expected = expected
+    # the degree distribution is computed once and shared by the glasses of all the trials
+    _prng = None
+    if block_chunks is None:
+        _prng = PRNG(K=glass_args["num_chunks"], delta=glass_args["delta"], c=glass_args["c_dist"])
+
+
+def run_trial(channel: Channel, max_reads: int, seed: int, batch_size: int = None) -> Optional[int]:
+    """
+    Decode noisy reads of the pool until the file is recovered, in a worker process.
+    Belief propagation runs on every read, the GF(2) solver after every batch once there are enough droplets.
+    :return
+    number of reads it took, at batch_size granularity once the GF(2) solver is needed,
+    or None if max_reads reads were not enough; type: int
+    """
+    rng = np.random.default_rng(seed)
+    num_chunks = _glass_args["num_chunks"]
+    if _block_chunks is None:
+        glass = Glass(prng=_prng, **_glass_args)
+    else:
+        glass = SegmentedGlass(block_chunks=_block_chunks, **_glass_args)
+    if batch_size is None:
+        batch_size = max(64, num_chunks // 50)
+    used = 0
+    accepted = 0
+    for batch in channel.reads(_symbols, rng, batch_size):
+        for record in glass.parse_batch(codec.to_messages(batch)):
+            used += 1
+            if record is not None and glass.add_record(*record) != -1:
+                accepted += 1
+            if glass.is_done():
+                return _checked(glass, used)
+        if accepted >= num_chunks:
+            glass.solve()
+            if glass.is_done():
+                return _checked(glass, used)
+        if used >= max_reads:
+            return None
+
+
+def _checked(glass: Glass, used: int) -> Optional[int]:
+    if _expected is not None and not np.array_equal(glass.chunks, _expected):
+        return None
+    return used
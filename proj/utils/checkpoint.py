@@ -0,0 +1,26 @@
+import os
+from typing import Dict
+import numpy as np
+
+
+def save(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """
+    write the arrays of a decoding state to a compressed npz file.
+    It is written to a temporary file first, so an interrupted save never corrupts the last checkpoint.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def prefixed(arrays: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    """
+    the arrays whose name starts with prefix, with the prefix removed
+    """
+    return {name[len(prefix) :]: a for name, a in arrays.items() if name.startswith(prefix)}
@@ -0,0 +1,207 @@
+from typing import Iterable, Iterator, List
+import numpy as np
+from . import codec
+
+# symbol of an N (or any other character than A, C, G, T) in a read, and of the padding after its end:
+# it matches no nt, so it casts no vote in a consensus
+ERASURE = 4
+
+
+def kmer_values(symbols: np.ndarray, k: int) -> np.ndarray:
+    """
+    every k-mer of a (n, L) matrix of 2-bit symbols as an integer, shape (n, L - k + 1)
+    """
+    n, width = symbols.shape
+    values = np.zeros((n, width - k + 1), dtype=np.uint64)
+    for j in range(k):
+        values <<= np.uint64(2)
+        values |= symbols[:, j : width - k + 1 + j].astype(np.uint64)
+    return values
+
+
+def minhash(symbols: np.ndarray, k: int, num_hashes: int, seed: int = 0) -> np.ndarray:
+    """
+    MinHash signature of the k-mer set of every read: the smallest value of each of num_hashes
+    multiply-shift hash functions over the k-mers of the read, shape (n, num_hashes)
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, size=num_hashes, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=num_hashes, dtype=np.uint64)
+    kmers = kmer_values(symbols, k)
+    signature = np.empty((len(symbols), num_hashes), dtype=np.uint64)
+    for h in range(num_hashes):
+        # uint64 arithmetic wraps around, the high bits are the hash
+        signature[:, h] = ((kmers * a[h] + b[h]) >> np.uint64(32)).min(axis=1)
+    return signature
+
+
+def _erased_symbols(reads: List[str]) -> np.ndarray:
+    """
+    (n, L) matrix of the 2-bit symbols of reads of the same length, ERASURE for the characters that are not nt
+    """
+    width = len(reads[0]) if len(reads) > 0 else 0
+    raw = np.frombuffer("".join(reads).encode("ascii", "replace"), dtype=np.uint8)
+    symbols = codec.ASCII_TO_SYM[raw].reshape(len(reads), width)
+    symbols[symbols == codec.INVALID] = ERASURE
+    return symbols
+
+
+def _padded_symbols(reads: List[str]) -> np.ndarray:
+    """
+    (n, max length + 1) matrix of the 2-bit symbols of reads of any length, padded with ERASURE
+    """
+    lengths = np.fromiter((len(dna) for dna in reads), dtype=np.int64, count=len(reads))
+    symbols = np.full((len(reads), int(lengths.max(initial=0)) + 1), ERASURE, dtype=np.uint8)
+    for length in np.unique(lengths).tolist():
+        members = np.flatnonzero(lengths == length)
+        if length > 0:
+            symbols[members, :length] = _erased_symbols([reads[i] for i in members.tolist()])
+    return symbols
+
+
+def distance(symbols: np.ndarray, lengths: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Number of substitutions between the reads of every pair (a[i], b[i]), allowing one insertion or deletion:
+    the Hamming distance for reads of the same length, the smallest Hamming distance after deleting one nt
+    of the longer read for reads one nt apart. Pairs further apart in length get a distance larger than any read.
+    """
+    # a is the longer read of every pair
+    swap = lengths[a] < lengths[b]
+    a, b = np.where(swap, b, a), np.where(swap, a, b)
+    short = lengths[b]
+    width = symbols.shape[1] - 1
+    inside = np.arange(width) < short[:, None]
+    same = ((symbols[a, :width] != symbols[b, :width]) & inside).astype(np.int32)
+    result = same.sum(axis=1)
+    shifted = np.flatnonzero(lengths[a] == short + 1)
+    if len(shifted) > 0:
+        # deleting position i of the longer read: mismatches before i unshifted, from i on shifted by one
+        before = np.zeros((len(shifted), width + 1), dtype=np.int32)
+        np.cumsum(same[shifted], axis=1, out=before[:, 1:])
+        after_mismatch = (symbols[a[shifted], 1:] != symbols[b[shifted], :width]) & inside[shifted]
+        after = np.zeros((len(shifted), width + 1), dtype=np.int32)
+        after[:, :width] = np.cumsum(after_mismatch[:, ::-1], axis=1, dtype=np.int32)[:, ::-1]
+        result[shifted] = (before + after).min(axis=1)
+    result[np.abs(lengths[a] - short) > 1] = symbols.shape[1]
+    return result
+
+
+def cluster(
+    reads: List[str], k: int = 12, bands: int = 8, rows: int = 1, max_distance: float = 0.15
+) -> np.ndarray:
+    """
+    Cluster reads that are noisy copies of the same oligo. Locality sensitive hashing proposes the
+    candidates: reads agreeing on all the rows of a band of their MinHash signature share a bucket.
+    Every read is linked to the first read of each of its buckets if they are within max_distance,
+    and the clusters are the connected components of these links.
+    :param
+    reads: DNA strings, of different lengths or not; type: list
+    k: k-mer length in nt, at most 32; type: int
+    bands, rows: the signature has bands * rows hashes; type: int
+    max_distance: the largest distance of linked reads, as a fraction of the read length; type: float
+
+    :return
+    labels: cluster of every read, the smallest index of its members; type: np.ndarray
+    """
+    n = len(reads)
+    labels = np.arange(n)
+    if n == 0:
+        return labels
+    lengths = np.fromiter((len(dna) for dna in reads), dtype=np.int64, count=n)
+    symbols = _padded_symbols(reads)
+    signature = np.zeros((n, bands * rows), dtype=np.uint64)
+    # reads of every length are hashed with the same functions, so indel copies still share buckets
+    for length in np.unique(lengths).tolist():
+        members = np.flatnonzero(lengths == length)
+        if length < k:
+            # too short for a single k-mer: a cluster of its own
+            signature[members] = np.arange(n, n + len(members), dtype=np.uint64)[:, None]
+            continue
+        # an erased nt hashes as an A, the distance check below counts it as a mismatch
+        signature[members] = minhash(symbols[members, :length] & 3, k, bands * rows)
+
+    # links from every read to the first read of its bucket in every band
+    src, dst = [], []
+    for band in range(bands):
+        keys = np.ascontiguousarray(signature[:, band * rows : (band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, 8 * rows))).reshape(-1)
+        _, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+        leader = first[bucket.reshape(-1)]
+        linked = np.flatnonzero(leader != labels)
+        src.append(linked)
+        dst.append(leader[linked])
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    # the candidate links are checked in slices to bound the memory of the distance matrices
+    ok = np.zeros(len(src), dtype=bool)
+    step = 1 << 16
+    for i in range(0, len(src), step):
+        a, b = src[i : i + step], dst[i : i + step]
+        limit = max_distance * np.minimum(lengths[a], lengths[b])
+        ok[i : i + step] = distance(symbols, lengths, a, b) <= limit
+    src, dst = src[ok], dst[ok]
+
+    # label propagation: both ends of every link take the smaller label until nothing changes
+    while True:
+        before = labels
+        smaller = np.minimum(labels[src], labels[dst])
+        labels = labels.copy()
+        np.minimum.at(labels, src, smaller)
+        np.minimum.at(labels, dst, smaller)
+        # pointer jumping shortens chains of labels
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            return labels
+
+
+def consensus(reads: List[str], labels: np.ndarray) -> List[str]:
+    """
+    Per-position majority vote of every cluster, over its reads of the most common length
+    (reads with an insertion or a deletion do not line up with the others).
+    N and other characters that are not nt cast no vote; a position without any vote is an N in the consensus,
+    so the decoder rejects the sequence rather than decode an invented nt.
+    The consensus sequences are in the order of the first read of every cluster.
+    """
+    if len(reads) == 0:
+        return []
+    lengths = np.fromiter((len(dna) for dna in reads), dtype=np.int64, count=len(reads))
+    clusters, first = np.unique(labels, return_index=True)
+    cluster_of = np.searchsorted(clusters, labels)
+
+    # most common length of every cluster
+    pairs, counts = np.unique(np.stack([cluster_of, lengths]), axis=1, return_counts=True)
+    order = np.lexsort((-counts, pairs[0]))
+    first_pair = np.flatnonzero(np.r_[True, np.diff(pairs[0][order]) != 0])
+    mode_length = pairs[1][order][first_pair]
+
+    result: List[str] = [""] * len(clusters)
+    keep = lengths == mode_length[cluster_of]
+    for length in np.unique(mode_length).tolist():
+        members = np.flatnonzero(keep & (lengths == length))
+        members = members[np.argsort(cluster_of[members], kind="stable")]
+        symbols = _erased_symbols([reads[i] for i in members.tolist()])
+        onehot = (symbols[:, :, None] == np.arange(4, dtype=np.uint8)).astype(np.uint32)
+        groups = cluster_of[members]
+        starts = np.flatnonzero(np.r_[True, np.diff(groups) != 0])
+        votes = np.add.reduceat(onehot, starts, axis=0)
+        winners = votes.argmax(axis=2).astype(np.uint8)
+        winners[votes.max(axis=2) == 0] = ERASURE
+        dna = codec.symbols_to_dna(winners, codec.NT + "N")
+        for c, seq in zip(groups[starts].tolist(), dna):
+            result[c] = seq
+    return [result[c] for c in np.argsort(first, kind="stable").tolist()]
+
+
+def consensus_stream(reads: Iterable[str], window: int = 1 << 18, **kwargs) -> Iterator[str]:
+    """
+    Cluster the reads window reads at a time, and yield one consensus sequence per cluster.
+    Larger windows catch more copies of an oligo, at the price of memory.
+    kwargs: parameters of cluster
+    """
+    batch: List[str] = []
+    for dna in reads:
+        batch.append(dna)
+        if len(batch) == window:
+            yield from consensus(batch, cluster(batch, **kwargs))
+            batch = []
+    if batch:
+        yield from consensus(batch, cluster(batch, **kwargs))
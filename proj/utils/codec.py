@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# nucleotide alphabets, indexed by the 2-bit symbol
+NT = "ACGT"
+DIGITS = "0123"
+
+# byte -> 4 nt lookup tables, most significant bit pair first
+BYTE_TO_NT = ["".join(NT[(b >> s) & 3] for s in (6, 4, 2, 0)) for b in range(256)]
+BYTE_TO_DIGITS = ["".join(DIGITS[(b >> s) & 3] for s in (6, 4, 2, 0)) for b in range(256)]
+DIGITS_TO_NT = str.maketrans(DIGITS, NT)
+
+# ascii -> 2-bit symbol lookup table, 255 marks an invalid character
+INVALID = 255
+ASCII_TO_SYM = np.full(256, INVALID, dtype=np.uint8)
+for _sym, (_nt, _digit) in enumerate(zip(NT, DIGITS)):
+    ASCII_TO_SYM[ord(_nt)] = _sym
+    ASCII_TO_SYM[ord(_nt.lower())] = _sym
+    ASCII_TO_SYM[ord(_digit)] = _sym
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+def bytes_to_dna(message: Sequence[int], table: List[str] = BYTE_TO_NT) -> str:
+    """
+    convert a message to a DNA string with 4 nt per byte
+    :param
+    message: bytes of the message; type: bytes
+    table: BYTE_TO_NT for ACGT, BYTE_TO_DIGITS for 0123; type: list
+
+    :return
+    dna: DNA string; type: str
+    """
+    return "".join([table[b] for b in message])
+
+
+def bytes_to_symbols(messages: np.ndarray) -> np.ndarray:
+    """
+    unpack a (n, L) uint8 matrix of messages into a (n, 4L) matrix of 2-bit symbols
+    """
+    messages = np.asarray(messages, dtype=np.uint8)
+    symbols = (messages[..., None] >> _SHIFTS) & 3
+    return symbols.reshape(*messages.shape[:-1], messages.shape[-1] * 4)
+
+
+def symbols_to_dna(symbols: np.ndarray, alphabet: str = NT) -> List[str]:
+    """
+    convert a (n, L) matrix of 2-bit symbols to n DNA strings
+    """
+    chars = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)[symbols]
+    width = symbols.shape[1]
+    text = chars.tobytes().decode("ascii")
+    return [text[i : i + width] for i in range(0, len(text), width)]
+
+
+def batch_bytes_to_dna(messages: np.ndarray, alphabet: str = NT) -> List[str]:
+    """
+    convert a (n, L) uint8 matrix of messages to n DNA strings of 4L nt
+    """
+    return symbols_to_dna(bytes_to_symbols(messages), alphabet)
+
+
+def dna_to_symbols(reads: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    convert n DNA strings of the same length to a (n, L) matrix of 2-bit symbols
+    :return
+    symbols: symbol matrix, invalid characters are set to 0; type: np.ndarray
+    valid: whether each read only contains A, C, G, T (or 0, 1, 2, 3); type: np.ndarray
+    """
+    width = len(reads[0]) if len(reads) > 0 else 0
+    raw = np.frombuffer("".join(reads).encode("ascii", "replace"), dtype=np.uint8)
+    symbols = ASCII_TO_SYM[raw].reshape(len(reads), width)
+    invalid = symbols == INVALID
+    valid = ~invalid.any(axis=1)
+    symbols[invalid] = 0
+    return symbols, valid
+
+
+def symbols_to_bytes(symbols: np.ndarray) -> np.ndarray:
+    """
+    pack a (n, L) matrix of 2-bit symbols into bytes, 4 symbols per byte.
+    Like the bit string round trip it replaces, a trailing group of less than
+    4 symbols is packed into the low bits of a last byte.
+    """
+    n, width = symbols.shape
+    full = width // 4 * 4
+    symbols = symbols.astype(np.uint8)
+    packed = (symbols[:, :full].reshape(n, -1, 4) << _SHIFTS).sum(axis=2, dtype=np.uint8)
+    if full == width:
+        return packed
+    tail = symbols[:, full:]
+    shifts = np.arange(2 * (width - full - 1), -1, -2, dtype=np.uint8)
+    last = (tail << shifts).sum(axis=1, dtype=np.uint8)
+    return np.concatenate([packed, last[:, None]], axis=1)
+
+
+def batch_dna_to_bytes(reads: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    convert n DNA strings of the same length to a (n, ceil(L / 4)) uint8 matrix
+    :return
+    data: byte matrix; type: np.ndarray
+    valid: whether each read only contains valid characters; type: np.ndarray
+    """
+    symbols, valid = dna_to_symbols(reads)
+    return symbols_to_bytes(symbols), valid
+
+
+def dna_to_bytes(dna: str) -> List[int]:
+    """
+    convert one DNA string to a list of byte values, raise ValueError on invalid characters
+    """
+    data, valid = batch_dna_to_bytes([dna])
+    if not valid[0]:
+        raise ValueError("invalid character in DNA string {}".format(dna))
+    return data[0].tolist()
+
+
+def reads_to_bytes(reads: Sequence[str]) -> List[Optional[List[int]]]:
+    """
+    convert reads to lists of byte values, None for reads that are not DNA
+    """
+    if len(reads) == 0:
+        return []
+    # convert the whole batch at once when all reads have the same length
+    if all(len(dna) == len(reads[0]) for dna in reads):
+        data, valid = batch_dna_to_bytes(reads)
+        return [row if ok else None for row, ok in zip(data.tolist(), valid)]
+    # otherwise one conversion per read length (reads with indels)
+    groups: Dict[int, List[int]] = dict()
+    for i, dna in enumerate(reads):
+        groups.setdefault(len(dna), []).append(i)
+    messages: List[Optional[List[int]]] = [None] * len(reads)
+    for members in groups.values():
+        data, valid = batch_dna_to_bytes([reads[i] for i in members])
+        for i, row, ok in zip(members, data.tolist(), valid):
+            messages[i] = row if ok else None
+    return messages
+
+
+def to_messages(batch) -> List[Optional[List[int]]]:
+    """
+    messages of a batch of reads, or of a (n, L) uint8 matrix of packed oligos read from a pool
+    """
+    if isinstance(batch, np.ndarray):
+        return batch.tolist()
+    return reads_to_bytes(batch)
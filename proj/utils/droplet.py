@@ -1,47 +1,60 @@
 import struct
-from typing import List
+from typing import List, Sequence
 from reedsolo import RSCodec
+from . import codec
+
+# the block id is XORed with the low bits of the seed, otherwise the header of a block
+# would be the same nucleotides in every oligo (e.g. AAAAAAAA for block 0) and could never pass the screen
+BLOCK_MASK = 0xFFFF
+
+
+def block_header(block: int, seed: int) -> int:
+    """
+    value written in the header for a block id, and the block id of a header value (it is an involution)
+    """
+    return block ^ (seed & BLOCK_MASK)
 
 
 class Droplet:
+    __slots__ = ("data", "seed", "num_chunks", "rs", "rs_obj", "degree", "block", "dna")
+
     def __init__(
         self,
-        data: List[int],
+        data: Sequence[int],
         seed: int,
         num_chunks: List[int] = None,
         rs=0,
         rs_obj: RSCodec = None,
         degree: int = None,
+        block: int = None,
     ):
-        self.data: List[int] = data
+        """
+        block: id of the block of a segmented file, written (whitened by the seed) in the header before the seed
+        """
+        self.data: Sequence[int] = data
         self.seed = seed
         self.num_chunks = set(num_chunks)
         self.rs = rs
         self.rs_obj: RSCodec = rs_obj
         self.degree: int = degree
+        self.block: int = block
         self.dna: str = None
 
-    def to_dna(self) -> str:
-        if self.dna is not None:
-            return self.dna
-        seed_ord = [c for c in struct.pack("!I", self.seed)]
-        message = seed_ord + self.data
+    def to_message(self) -> bytes:
+        # data is either a list of ints or a row of the chunk matrix
+        message = struct.pack("!I", self.seed) + bytes(self.data)
+        if self.block is not None:
+            message = struct.pack("!H", block_header(self.block, self.seed)) + message
         if self.rs > 0:
             # adding RS symbols to the message
             message = self.rs_obj.encode(message)
-        # convert to a long sring of binary values
-        binary_data = "".join("{0:08b}".format(e) for e in message)
-        # convert binary array to a string of 0,1,2,3
-        self.dna = "".join(
-            str(int(binary_data[i : i + 2], 2)) for i in range(0, len(binary_data), 2)
-        )
+        return message
+
+    def to_dna(self) -> str:
+        if self.dna is None:
+            # convert every byte to 4 digits of 0,1,2,3
+            self.dna = codec.bytes_to_dna(self.to_message(), codec.BYTE_TO_DIGITS)
         return self.dna
 
     def to_readable_dna(self) -> str:
-        return (
-            self.to_dna()
-            .replace("0", "A")
-            .replace("1", "C")
-            .replace("2", "G")
-            .replace("3", "T")
-        )
+        return self.to_dna().translate(codec.DIGITS_TO_NT)
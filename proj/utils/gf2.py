@@ -0,0 +1,114 @@
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+def inactivation_solve(
+    rows: List[List[int]], payloads: np.ndarray, num_cols: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Solve the sparse GF(2) system left over when belief propagation stalls.
+    Peeling continues by inactivating the most connected unresolved column whenever
+    the ripple runs dry, with every equation tracking its combination of inactive
+    columns as a bit-packed python int. Only the small dense system over the inactive
+    columns is solved by gaussian elimination; once they are known, plain peeling
+    recovers every other column.
+    :param
+    rows: the residual column numbers of every equation; type: list
+    payloads: the right-hand side of every equation, shape (len(rows), chunk_size); type: np.ndarray
+    num_cols: the number of columns; type: int
+
+    :return
+    solved: which inactive columns could be determined; type: np.ndarray
+    values: the value of every determined column, shape (num_cols, chunk_size); type: np.ndarray
+    """
+    num_rows = len(rows)
+    payloads = payloads.copy()
+    degree = [len(r) for r in rows]
+    xor_ids = [0] * num_rows
+    coeff = [0] * num_rows
+    col_rows: List[List[int]] = [[] for _ in range(num_cols)]
+    for num, row in enumerate(rows):
+        for col in row:
+            xor_ids[num] ^= col
+            col_rows[col].append(num)
+
+    inactive: List[int] = []
+    equations: List[int] = []
+    resolved = np.zeros(num_cols, dtype=bool)
+    # columns touching the most equations are inactivated first
+    order = sorted(range(num_cols), key=lambda c: len(col_rows[c]), reverse=True)
+    order_ix = 0
+    ripple = [num for num in range(num_rows) if degree[num] == 1]
+
+    def release(col: int, src: int, bit: int) -> None:
+        # remove a resolved column from all the equations still connected to it
+        for other in col_rows[col]:
+            if degree[other] == 0 or other == src:
+                continue
+            if src >= 0:
+                payloads[other] ^= payloads[src]
+                coeff[other] ^= coeff[src]
+            else:
+                coeff[other] ^= bit
+            degree[other] -= 1
+            xor_ids[other] ^= col
+            if degree[other] == 1:
+                ripple.append(other)
+            elif degree[other] == 0:
+                equations.append(other)
+
+    while True:
+        while ripple:
+            num = ripple.pop()
+            if degree[num] != 1:
+                continue
+            col = xor_ids[num]
+            degree[num] = 0
+            resolved[col] = True
+            release(col, num, 0)
+
+        while order_ix < num_cols and (
+            resolved[order[order_ix]] or not col_rows[order[order_ix]]
+        ):
+            order_ix += 1
+        if order_ix == num_cols:
+            break
+        col = order[order_ix]
+        resolved[col] = True
+        release(col, -1, 1 << len(inactive))
+        inactive.append(col)
+
+    # gaussian elimination over the inactive columns; every pivot is the highest bit of its row
+    pivots: Dict[int, Tuple[int, np.ndarray]] = dict()
+    for num in equations:
+        q, rhs = coeff[num], payloads[num].copy()
+        while q:
+            bit = q.bit_length() - 1
+            if bit not in pivots:
+                pivots[bit] = (q, rhs)
+                break
+            q ^= pivots[bit][0]
+            rhs ^= pivots[bit][1]
+
+    # back substitution from the lowest pivot up
+    inactive_val: Dict[int, np.ndarray] = dict()
+    for bit in sorted(pivots):
+        q, rhs = pivots[bit]
+        rest = q ^ (1 << bit)
+        value = rhs.copy()
+        while rest:
+            low = rest & -rest
+            j = low.bit_length() - 1
+            if j not in inactive_val:
+                break
+            value ^= inactive_val[j]
+            rest ^= low
+        else:
+            inactive_val[bit] = value
+
+    solved = np.zeros(num_cols, dtype=bool)
+    values = np.zeros((num_cols, payloads.shape[1]), dtype=np.uint8)
+    for bit, value in inactive_val.items():
+        solved[inactive[bit]] = True
+        values[inactive[bit]] = value
+    return solved, values
@@ -1,11 +1,68 @@
-from collections import defaultdict
-from typing import List, Tuple
-from reedsolo import RSCodec
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from reedsolo import RSCodec, rs_calc_syndromes
 import numpy as np
-import operator
 from .robust_solution import PRNG
 from .droplet import Droplet
 from . import scr_rept as sr
+from . import gf2
+from . import codec
+from . import metrics
+from . import syndrome
+
+
+def correct_message(
+    rs_obj: RSCodec, data: List[int], max_hamming: int, clean: bool = None
+) -> Optional[List[int]]:
+    """
+    error correct a read and strip the RS symbols
+    clean: whether the syndromes of the read are known to be all zero, computed here when None
+    :return
+    data_corrected: the message, or None if it could not be corrected within max_hamming symbols; type: list
+    """
+    rs = rs_obj.nsym
+    if clean is None:
+        clean = rs == 0 or not any(rs_calc_syndromes(bytearray(data), rs))
+    if clean:
+        # fast path: error free reads need no correction
+        if metrics.ENABLED:
+            metrics.inc("reads_clean_total")
+        return data[: len(data) - rs]
+    try:
+        # evaluate the error correcting code
+        decoded, _, errata_pos = rs_obj.decode(data)
+    except:
+        # could not correct the code
+        if metrics.ENABLED:
+            metrics.inc("reads_rejected_total", reason="rs_failure")
+        return None
+    if metrics.ENABLED:
+        metrics.observe("rs_corrected_symbols", len(errata_pos))
+    # the number of corrected symbols is the hamming distance between raw input and expected raw input
+    if len(errata_pos) > max_hamming:
+        # too many errors to correct in decoding
+        if metrics.ENABLED:
+            metrics.inc("reads_rejected_total", reason="hamming")
+        return None
+    return list(decoded)
+
+
+def clean_flags(rs_obj: RSCodec, messages: List[Optional[List[int]]]) -> List[Optional[bool]]:
+    """
+    whether each read of a batch has all zero syndromes, computed at once for all the reads of the most common length.
+    Reads of other lengths and None entries get None.
+    """
+    lengths = [len(data) for data in messages if data is not None]
+    clean = [None] * len(messages)
+    if rs_obj.nsym > 0 and len(lengths) > 0:
+        # the most common length is the oligo length
+        width = max(set(lengths), key=lengths.count)
+        rows = [i for i, data in enumerate(messages) if data is not None and len(data) == width]
+        ok = syndrome.is_clean(np.array([messages[i] for i in rows], dtype=np.uint8), rs_obj)
+        for i, flag in zip(rows, ok.tolist()):
+            clean[i] = flag
+    return clean
 
 
 class Glass:
@@ -19,109 +76,406 @@ class Glass:
         gc=0.2,
         max_hamming=100,
         max_homopolymer=4,
+        prng_cache: str = None,
+        prng: PRNG = None,
+        chunk_size: int = None,
     ):
-        self.entries = list()
-        self.droplets: set[Droplet] = set()
+        """
+        prng: a PRNG for this degree distribution to share, instead of creating one
+        chunk_size: number of bytes of a payload, payloads of any other length are rejected;
+            None to take it from the first accepted payload
+        """
         self.num_chunks = num_chunks
-        self.chunks: List[List[int]] = [None] * num_chunks
+        # solved chunks, and the payloads of the droplet arena below
+        self.chunk_size = None
+        self.chunks: np.ndarray = None
+        self.payloads: np.ndarray = None
+        if chunk_size is not None:
+            self._alloc(chunk_size)
+        self.solved = np.zeros(num_chunks, dtype=bool)
+        self.num_solved = 0
         self.header_size = header_size
         self.rs = rs
         self.max_hamming = max_hamming
         self.max_homopolymer = max_homopolymer
         self.gc = gc
-        self.chunk_to_droplets = defaultdict(set)
-        self.done_segments = set()
         self.RSCodec = RSCodec(self.rs)
         self.seen_seeds = set()
-        self.PRNG = PRNG(K=self.num_chunks, delta=delta, c=c_dist)
+        self.PRNG = prng or PRNG(K=self.num_chunks, delta=delta, c=c_dist, cache_dir=prng_cache)
+
+        # droplet arena: one payload row, residual degree and xor of residual chunk numbers per droplet.
+        # when the residual degree drops to 1, the xor is the number of the last unsolved chunk.
+        self.degree = array("l")
+        self.xor_ids = array("l")
+        # chunk -> droplet edges as singly linked lists stored in flat arrays
+        self.head = array("l", [-1]) * num_chunks
+        self.edge_droplet = array("l")
+        self.edge_next = array("l")
+        # rows of droplets without unsolved neighbours, and chains of edges of solved chunks (linked by
+        # edge_next), reused before the arena grows: its size follows the pending droplets, not the reads
+        self.free_rows = array("l")
+        self.free_edge = -1
+        # droplets of residual degree 1 waiting to be peeled
+        self.ripple = deque()
 
     def _dna_to_int_arr(self, dna_str: str) -> List[int]:
-        num_str = (
-            dna_str.replace("A", "0")
-            .replace("C", "1")
-            .replace("G", "2")
-            .replace("T", "3")
-        )
-        s = "".join("{0:02b}".format(int(num_str[i])) for i in range(len(num_str)))
-        data = [int(s[t : t + 8], 2) for t in range(0, len(s), 8)]
-        return data
+        return codec.dna_to_bytes(dna_str)
 
     def add_dna(self, dna_str: str) -> Tuple[int, List[int]]:
-        data = self._dna_to_int_arr(dna_str)
-
         try:
-            # evaluate the error correcting code
-            data_corrected = list(self.RSCodec.decode(data)[0])
-        except:
-            # could not correct the code
+            data = self._dna_to_int_arr(dna_str)
+        except ValueError:
+            # not a DNA string
+            if metrics.ENABLED:
+                metrics.inc("reads_rejected_total", reason="not_dna")
             return -1, None
-        # encode the data again to evaluate the correctness of the decoding
-        # list() is to convert byte array to int
-        data_again = list(self.RSCodec.encode(data_corrected))
-        # measuring hamming distance between raw input and expected raw input
-        if np.count_nonzero(data != list(data_again)) > self.max_hamming:
-            # too many errors to correct in decoding
+        return self.add_data(data)
+
+    def add_data(self, data: List[int]) -> Tuple[int, List[int]]:
+        record = self.parse_data(data)
+        if record is None or self.add_record(*record) == -1:
             return -1, None
+        return record[0], data
+
+    def parse_data(
+        self, data: List[int], clean: bool = None
+    ) -> Optional[Tuple[int, List[int], List[int], bool]]:
+        """
+        The stateless part of add_data: error correction, header parsing, neighbour lookup and screening.
+        It can run in any process; the result is handed to add_record.
+        clean: whether the syndromes of the read are known to be all zero, computed here when None
+        :return
+        None if the read could not be corrected, else a record of
+        seed: seed of the droplet; type: int
+        payload: corrected payload; type: list
+        neighbours: chunk numbers of the droplet; type: list
+        screened: whether the droplet passed the screen; type: bool
+        """
+        data_corrected = correct_message(self.RSCodec, data, self.max_hamming, clean)
+        if data_corrected is None:
+            return None
+        return self.parse_message(data_corrected)
 
+    def parse_message(self, data_corrected: List[int]) -> Tuple[int, List[int], List[int], bool]:
+        """
+        header parsing, neighbour lookup and screening of an error corrected message
+        """
         seed_array = data_corrected[: self.header_size]
         seed = sum([int(x) * 256**i for i, x in enumerate(seed_array[::-1])])
         payload = data_corrected[self.header_size :]
 
-        # more error detection (filter seen seeds)
-        if seed in self.seen_seeds:
-            return -1, None
-        self.seen_seeds.add(seed)
-
         # create droplet from DNA
         self.PRNG.set_seed(seed)
         ix_samples = self.PRNG.get_src_blocks_wrap()[1]
         droplet = Droplet(payload, seed, ix_samples)
         # # more error detection (filter DNA that does not make sense)
-        if not sr.screen_repeat(droplet, self.max_homopolymer, self.gc):
-            return -1, None
-        self.add_droplet(droplet)
-        return seed, data
+        screened = sr.screen_repeat(droplet, self.max_homopolymer, self.gc)
+        return seed, payload, ix_samples, screened
+
+    def parse_batch(
+        self, messages: List[Optional[List[int]]]
+    ) -> List[Optional[Tuple[int, List[int], List[int], bool]]]:
+        """
+        parse_data for a batch of reads, with the syndromes of all the reads of the expected length computed at once.
+        None entries (reads that are not DNA) stay None.
+        """
+        return [
+            None if data is None else self.parse_data(data, flag)
+            for data, flag in zip(messages, clean_flags(self.RSCodec, messages))
+        ]
+
+    def add_record(
+        self, seed: int, payload: List[int], neighbours: List[int], screened: bool
+    ) -> int:
+        """
+        The stateful part of add_data: filter seen seeds and peel the droplet.
+        Return the seed, or -1 if the droplet was rejected.
+        """
+        # more error detection (filter seen seeds)
+        if seed in self.seen_seeds:
+            if metrics.ENABLED:
+                metrics.inc("reads_rejected_total", reason="duplicate_seed")
+            return -1
+        self.seen_seeds.add(seed)
+        if self.PRNG.cache is not None:
+            # records parsed by other processes still fill the cache of this one
+            self.PRNG.cache.put(seed, neighbours)
+        if not screened:
+            if metrics.ENABLED:
+                metrics.inc("reads_rejected_total", reason="screen")
+            return -1
+        if self.chunk_size is not None and len(payload) != self.chunk_size:
+            # a read with an indel that the RS decoder turned into a message of another length
+            if metrics.ENABLED:
+                metrics.inc("reads_rejected_total", reason="length")
+            return -1
+        # the payload goes straight to the arena, no Droplet object is kept
+        self._insert(payload, neighbours)
+        return seed
+
+    def _alloc(self, chunk_size: int) -> None:
+        self.chunk_size = chunk_size
+        self.chunks = np.zeros((self.num_chunks, chunk_size), dtype=np.uint8)
+        self.payloads = np.empty((1024, chunk_size), dtype=np.uint8)
+
+    def _new_droplet(self, data) -> int:
+        if isinstance(data, (bytes, bytearray)):
+            data = np.frombuffer(data, dtype=np.uint8)
+        if self.chunks is None:
+            self._alloc(len(data))
+        if self.free_rows:
+            num = self.free_rows.pop()
+            self.payloads[num] = data
+            return num
+        num = len(self.degree)
+        if num == len(self.payloads):
+            # double the arena to keep appends amortized O(1)
+            payloads = np.empty((2 * num, self.payloads.shape[1]), dtype=np.uint8)
+            payloads[:num] = self.payloads
+            self.payloads = payloads
+        self.payloads[num] = data
+        self.degree.append(0)
+        self.xor_ids.append(0)
+        return num
 
     def add_droplet(self, droplet: Droplet) -> None:
-        self.droplets.add(droplet)
-        for chunk_num in droplet.num_chunks:
-            # document for each chunk all connected droplets
-            self.chunk_to_droplets[chunk_num].add(droplet)
-        # one round of message passing
-        self.update_entry(droplet)
-
-    def update_entry(self, droplet: Droplet) -> None:
-        # removing solved segments from droplets
-        for chunk_num in droplet.num_chunks & self.done_segments:
-            # subtract (ie. xor) the value of the solved segment from the droplet.
-            droplet.data = list(map(operator.xor, droplet.data, self.chunks[chunk_num]))
-            # cut the edge between droplet and input segment.
-            droplet.num_chunks.remove(chunk_num)
-            # cut the edge between the input segment to the droplet
-            self.chunk_to_droplets[chunk_num].discard(droplet)
-
-        # solving segments when the droplet have exactly 1 segment
-        if len(droplet.num_chunks) == 1:
-            lone_chunk = droplet.num_chunks.pop()
-
-            # assign the droplet value to the input segment (=entry[0][0])
-            self.chunks[lone_chunk] = droplet.data
-            # add the lone_chunk to a data structure of done segments.
-            self.done_segments.add(lone_chunk)
-            # cut the edge between the droplet and input segment
-            self.droplets.discard(droplet)
-            # cut the edge between the input segment and the droplet
-            self.chunk_to_droplets[lone_chunk].discard(droplet)
-
-            # update other droplets
-            for other_droplet in self.chunk_to_droplets[lone_chunk].copy():
-                self.update_entry(other_droplet)
+        """
+        add a Droplet whose neighbours are already known, as add_record does for a parsed read
+        """
+        self._insert(droplet.data, droplet.num_chunks)
+
+    def _insert(self, data, chunk_nums) -> None:
+        num = self._new_droplet(data)
+        payload = self.payloads[num]
+        solved, head, edge_droplet, edge_next = self.solved, self.head, self.edge_droplet, self.edge_next
+        degree, xor_ids = 0, 0
+        for chunk_num in chunk_nums:
+            if solved[chunk_num]:
+                # subtract (ie. xor) the value of the solved segment from the droplet.
+                payload ^= self.chunks[chunk_num]
+                continue
+            degree += 1
+            xor_ids ^= chunk_num
+            # document for each chunk all connected droplets, in a free edge if there is one
+            edge = self.free_edge
+            if edge == -1:
+                edge = len(edge_droplet)
+                edge_droplet.append(num)
+                edge_next.append(head[chunk_num])
+            else:
+                self.free_edge = edge_next[edge]
+                edge_droplet[edge] = num
+                edge_next[edge] = head[chunk_num]
+            head[chunk_num] = edge
+        self.degree[num] = degree
+        self.xor_ids[num] = xor_ids
+        if degree == 0:
+            # nothing new in this droplet
+            self.free_rows.append(num)
+        elif degree == 1:
+            self.ripple.append(num)
+            self._peel()
+
+    def _peel(self) -> None:
+        """
+        Iterative belief propagation: solve the lone chunk of every droplet in the ripple,
+        then subtract the solved chunk from all droplets connected to it.
+        """
+        degree, xor_ids = self.degree, self.xor_ids
+        before = self.num_solved
+        while self.ripple:
+            num = self.ripple.popleft()
+            # the lone chunk may have been solved by another droplet in the meantime
+            if degree[num] != 1:
+                continue
+            degree[num] = 0
+            self._solve_chunk(xor_ids[num], self.payloads[num])
+            self.free_rows.append(num)
+        if metrics.ENABLED and self.num_solved > before:
+            # chunks solved by one droplet and the cascade it set off
+            metrics.observe("peeling_cascade_chunks", self.num_solved - before)
+
+    def _solve_chunk(self, chunk_num: int, value: np.ndarray) -> None:
+        degree, xor_ids = self.degree, self.xor_ids
+        edge_droplet, edge_next = self.edge_droplet, self.edge_next
+        chunk = self.chunks[chunk_num]
+        chunk[:] = value
+        self.solved[chunk_num] = True
+        self.num_solved += 1
+
+        # update other droplets and drop the edges of the solved chunk
+        first = edge = self.head[chunk_num]
+        self.head[chunk_num] = -1
+        last = -1
+        while edge != -1:
+            other = edge_droplet[edge]
+            if degree[other] > 0:
+                self.payloads[other] ^= chunk
+                degree[other] -= 1
+                xor_ids[other] ^= chunk_num
+                if degree[other] == 1:
+                    self.ripple.append(other)
+                elif degree[other] == 0:
+                    # a redundant droplet, all of its chunks are solved
+                    self.free_rows.append(other)
+            last = edge
+            edge = edge_next[edge]
+        if last != -1:
+            # the whole chain of edges of the chunk is free
+            edge_next[last] = self.free_edge
+            self.free_edge = first
+
+    def solve(self) -> int:
+        """
+        Fallback for when belief propagation runs out of degree-1 droplets:
+        solve the residual system of pending droplets over GF(2) with inactivation decoding.
+        Return the number of newly solved chunks.
+        """
+        if self.chunks is None or self.is_done():
+            return 0
+        cols, pending, rows = self._residual()
+        if not rows:
+            return 0
+
+        with metrics.timer("gf2_solve_seconds"):
+            solved, values = gf2.inactivation_solve(rows, self.payloads[pending], len(cols))
+        before = self.num_solved
+        for col in np.flatnonzero(solved).tolist():
+            if not self.solved[cols[col]]:
+                self._solve_chunk(cols[col], values[col])
+        self._peel()
+        return self.num_solved - before
+
+    def _residual(self) -> Tuple[List[int], List[int], List[List[int]]]:
+        """
+        residual graph: unsolved chunks that still have edges to pending droplets
+        :return
+        cols: chunk number of every column; type: list
+        pending: droplet number of every row; type: list
+        rows: columns of the residual neighbours of every row; type: list
+        """
+        cols: List[int] = []
+        row_of = dict()
+        rows: List[List[int]] = []
+        for chunk_num in np.flatnonzero(~self.solved).tolist():
+            edge = self.head[chunk_num]
+            col = len(cols)
+            while edge != -1:
+                num = self.edge_droplet[edge]
+                if self.degree[num] > 0:
+                    if num not in row_of:
+                        row_of[num] = len(rows)
+                        rows.append([])
+                    rows[row_of[num]].append(col)
+                edge = self.edge_next[edge]
+            cols.append(chunk_num)
+        return cols, list(row_of), rows
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        The decoding state as arrays: the solved chunks, the pending droplets with their
+        residual payloads and neighbour sets (in CSR form), and the seen seeds.
+        Droplets that no longer have unsolved neighbours are not kept.
+        """
+        chunk_size = 0 if self.chunks is None else self.chunks.shape[1]
+        cols, pending, rows = self._residual()
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=offsets[1:])
+        neighbours = np.fromiter(
+            (cols[col] for row in rows for col in row), dtype=np.int64, count=offsets[-1]
+        )
+        return dict(
+            num_chunks=np.array(self.num_chunks, dtype=np.int64),
+            solved=np.packbits(self.solved),
+            chunks=self.chunks[self.solved] if chunk_size else np.zeros((0, 0), np.uint8),
+            payloads=self.payloads[pending] if chunk_size else np.zeros((0, 0), np.uint8),
+            offsets=offsets,
+            neighbours=neighbours,
+            seen_seeds=np.array(sorted(self.seen_seeds), dtype=np.uint32),
+        )
+
+    def restore(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        Continue from a state() of a decode of the same file, in place of an empty Glass.
+        """
+        if int(state["num_chunks"]) != self.num_chunks:
+            raise ValueError(
+                "state of {} chunks, expected {}".format(int(state["num_chunks"]), self.num_chunks)
+            )
+        self.solved = np.unpackbits(state["solved"], count=self.num_chunks).astype(bool)
+        self.num_solved = int(np.count_nonzero(self.solved))
+        self.seen_seeds = set(state["seen_seeds"].tolist())
+        chunks, payloads = state["chunks"], state["payloads"]
+        chunk_size = max(chunks.shape[1], payloads.shape[1])
+        if chunk_size == 0:
+            return
+        if self.chunk_size is None:
+            self._alloc(chunk_size)
+        elif chunk_size != self.chunk_size:
+            raise ValueError("state of {} byte chunks, expected {}".format(chunk_size, self.chunk_size))
+        self.chunks[self.solved] = chunks
+        offsets, neighbours = state["offsets"].tolist(), state["neighbours"].tolist()
+        for payload, start, end in zip(payloads, offsets[:-1], offsets[1:]):
+            self._insert(payload, neighbours[start:end])
+
+    def save_cache(self) -> None:
+        self.PRNG.save_cache()
 
     def is_done(self) -> bool:
-        return self.num_chunks <= len(self.done_segments)
+        return self.num_chunks <= self.num_solved
 
     def chunks_done(self) -> int:
-        return len(self.done_segments)
+        return self.num_solved
+
+    def droplet(self, num: int) -> "DropletView":
+        """
+        view of droplet num of the arena, valid until its row is reused
+        """
+        return DropletView(self, num)
+
+    def memory_bytes(self) -> int:
+        """
+        bytes held by the chunk matrix and the droplet arena
+        """
+        arrays = (self.degree, self.xor_ids, self.head, self.edge_droplet, self.edge_next, self.free_rows)
+        size = sum(a.itemsize * len(a) for a in arrays) + self.solved.nbytes
+        if self.chunks is not None:
+            size += self.chunks.nbytes + self.payloads.nbytes
+        return size
+
+    def pending_droplets(self) -> int:
+        """
+        number of droplets that still have unsolved neighbours (the undecoded backlog)
+        """
+        return int(np.count_nonzero(np.frombuffer(self.degree, dtype=np.dtype("l"))))
+
+    def flatten_chunks(self) -> np.ndarray:
+        return self.chunks.reshape(-1)
+
+
+class DropletView:
+    """
+    A droplet of the arena of a Glass: its residual payload row and degree, without a per-droplet object
+    in the arena itself. The row is reused once the droplet has no unsolved neighbours left.
+    """
+
+    __slots__ = ("glass", "num")
+
+    def __init__(self, glass: Glass, num: int):
+        self.glass = glass
+        self.num = num
+
+    @property
+    def data(self) -> np.ndarray:
+        return self.glass.payloads[self.num]
+
+    @property
+    def degree(self) -> int:
+        return self.glass.degree[self.num]
 
-    def flatten_chunks(self) -> str:
-        return [ch for chunk in self.chunks for ch in chunk]
+    @property
+    def lone_chunk(self) -> Optional[int]:
+        """
+        the last unsolved neighbour of a droplet of degree 1
+        """
+        return self.glass.xor_ids[self.num] if self.degree == 1 else None
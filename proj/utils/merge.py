@@ -0,0 +1,204 @@
+import itertools
+import logging
+from typing import Iterator, List, Sequence, Tuple
+import numpy as np
+from . import codec
+from .reads import PHRED_OFFSET, fastq_records, open_binary
+
+# symbol of a missing base (padding, or N in a read)
+GAP = 4
+# highest merged quality, as PEAR caps it
+MAX_QUALITY = 41
+
+
+def _pad(seqs: Sequence[bytes], fill: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (n, max length) matrix of byte strings padded with fill, and their lengths
+    """
+    lengths = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    width = int(lengths.max(initial=0))
+    matrix = np.full((len(seqs), width), fill, dtype=np.uint8)
+    # row major assignment keeps the bytes of every read in order
+    matrix[np.arange(width) < lengths[:, None]] = np.frombuffer(b"".join(seqs), dtype=np.uint8)
+    return matrix, lengths
+
+
+def _gather(matrix: np.ndarray, index: np.ndarray, lengths: np.ndarray, fill: int) -> np.ndarray:
+    """
+    matrix[i, index[i, j]] where 0 <= index[i, j] < lengths[i], else fill
+    """
+    if matrix.shape[1] == 0:
+        return np.full(index.shape, fill, dtype=matrix.dtype)
+    valid = (index >= 0) & (index < lengths[:, None])
+    out = np.take_along_axis(matrix, np.clip(index, 0, matrix.shape[1] - 1), axis=1)
+    return np.where(valid, out, fill)
+
+
+def reverse_complement(symbols: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    reverse complement of every row of a (n, L) symbol matrix padded with GAP, within its own length
+    """
+    index = lengths[:, None] - 1 - np.arange(symbols.shape[1])
+    reverse = _gather(symbols, index, lengths, GAP)
+    # A <-> T and C <-> G are 3 - symbol
+    return np.where(reverse == GAP, GAP, 3 - reverse).astype(np.uint8)
+
+
+def merge_batch(
+    r1: Sequence[Tuple[bytes, bytes]],
+    r2: Sequence[Tuple[bytes, bytes]],
+    min_overlap: int = 10,
+    max_mismatch: float = 0.1,
+    insert_range: Tuple[int, int] = None,
+) -> List[Tuple[str, bytes]]:
+    """
+    Merge a batch of read pairs. R1 starts at the start of the insert and the reverse complement of R2
+    ends at its end, so for an insert length I the reverse complement of R2 starts at I - len(R2) in R1
+    (before R1 if the insert is shorter than R2, the rest is adapter). Every candidate I is scored for
+    all the pairs at once, with +1 per matching and -1 per mismatching base of the overlap.
+    In the overlap the base with the higher quality wins, like in PEAR.
+    :param
+    r1, r2: (sequence, quality) of the reads of every pair; type: list
+    min_overlap: the smallest overlap of the reads; type: int
+    max_mismatch: the largest fraction of mismatching bases of the overlap; type: float
+    insert_range: the smallest and largest insert length to try, None for all of them; type: tuple
+
+    :return
+    (merged sequence, merged quality) of every pair, ("", b"") for pairs without a valid overlap; type: list
+    """
+    n = len(r1)
+    if n == 0:
+        return []
+    seq1, len1 = _pad([s for s, _ in r1], ord("N"))
+    seq2, len2 = _pad([s for s, _ in r2], ord("N"))
+    qual1, _ = _pad([q for _, q in r1], PHRED_OFFSET)
+    qual2, _ = _pad([q for _, q in r2], PHRED_OFFSET)
+    sym1 = codec.ASCII_TO_SYM[seq1]
+    sym1[sym1 == codec.INVALID] = GAP
+    sym1[np.arange(sym1.shape[1]) >= len1[:, None]] = GAP
+    sym2 = codec.ASCII_TO_SYM[seq2]
+    sym2[sym2 == codec.INVALID] = GAP
+    sym2[np.arange(sym2.shape[1]) >= len2[:, None]] = GAP
+    rc2 = reverse_complement(sym2, len2)
+    rq2 = _gather(qual2, len2[:, None] - 1 - np.arange(qual2.shape[1]), len2, PHRED_OFFSET)
+    q1 = qual1.astype(np.int16) - PHRED_OFFSET
+    q2 = rq2.astype(np.int16) - PHRED_OFFSET
+
+    lo, hi = insert_range or (min_overlap, int((len1 + len2).max()) - min_overlap)
+    positions = np.arange(sym1.shape[1])
+    best_score = np.full(n, -1, dtype=np.int64)
+    best_insert = np.zeros(n, dtype=np.int64)
+    for insert in range(max(lo, 1), hi + 1):
+        # rc2 base aligned to every position of R1
+        aligned = _gather(rc2, positions - insert + len2[:, None], len2, GAP)
+        valid = (sym1 != GAP) & (aligned != GAP)
+        overlap = valid.sum(axis=1)
+        mismatches = (valid & (sym1 != aligned)).sum(axis=1)
+        score = overlap - 2 * mismatches
+        ok = (overlap >= min_overlap) & (mismatches <= max_mismatch * overlap) & (score > best_score)
+        best_score[ok] = score[ok]
+        best_insert[ok] = insert
+
+    merged = best_score >= 0
+    width = int(best_insert.max())
+    out_pos = np.arange(width)
+    base1 = _gather(sym1, np.broadcast_to(out_pos, (n, width)), len1, GAP)
+    qual_1 = _gather(q1, np.broadcast_to(out_pos, (n, width)), len1, 0)
+    index2 = out_pos - best_insert[:, None] + len2[:, None]
+    base2 = _gather(rc2, index2, len2, GAP)
+    qual_2 = _gather(q2, index2, len2, 0)
+    # quality aware consensus: agreeing bases add up their qualities, otherwise the better base wins
+    take2 = (base1 == GAP) | ((base2 != GAP) & (qual_2 > qual_1))
+    base = np.where(take2, base2, base1)
+    agree = (base1 == base2) & (base1 != GAP)
+    quality = np.where(agree, np.minimum(qual_1 + qual_2, MAX_QUALITY), np.abs(qual_1 - qual_2))
+    quality = np.where(base1 == GAP, qual_2, np.where(base2 == GAP, qual_1, quality))
+
+    text = codec.symbols_to_dna(np.where(base == GAP, 0, base).astype(np.uint8)) if width else [""] * n
+    gaps = base == GAP
+    quality = (quality + PHRED_OFFSET).astype(np.uint8)
+    result = []
+    for i in range(n):
+        if not merged[i]:
+            result.append(("", b""))
+            continue
+        length = int(best_insert[i])
+        seq = text[i][:length]
+        if gaps[i, :length].any():
+            seq = "".join("N" if g else c for c, g in zip(seq, gaps[i, :length]))
+        result.append((seq, quality[i, :length].tobytes()))
+    return result
+
+
+class MergedStream:
+    """
+    Streaming merger of the pairs of an R1 and an R2 FASTQ file (plain or gzip),
+    yielding the merged reads like ReadStream, with the same trimming and quality filtering.
+    """
+
+    def __init__(
+        self,
+        path1: str,
+        path2: str,
+        oligo_len: int = None,
+        min_quality: float = None,
+        batch_size: int = 1 << 14,
+        min_overlap: int = 10,
+        max_mismatch: float = 0.1,
+        insert_slack: int = None,
+    ):
+        """
+        path1, path2: R1 and R2 FASTQ files; type = str
+        oligo_len: number of nt to keep of every merged read, None to keep whole reads; type = int
+        min_quality: the lowest mean Phred quality of a kept merged read, None to keep all reads; type = float
+        batch_size: number of pairs merged at once; type = int
+        insert_slack: only try inserts within this many nt of oligo_len, None to try all of them; type = int
+        """
+        self.file1 = open_binary(path1)
+        self.file2 = open_binary(path2)
+        self.oligo_len = oligo_len
+        self.min_quality = min_quality
+        self.batch_size = batch_size
+        self.merge_args = dict(min_overlap=min_overlap, max_mismatch=max_mismatch)
+        if insert_slack is not None and oligo_len is not None:
+            self.merge_args["insert_range"] = (max(oligo_len - insert_slack, 1), oligo_len + insert_slack)
+        self.unmerged = 0
+        self.short = 0
+        self.low_quality = 0
+
+    def __iter__(self) -> Iterator[str]:
+        pairs = zip(fastq_records(self.file1), fastq_records(self.file2))
+        while True:
+            batch = list(itertools.islice(pairs, self.batch_size))
+            if not batch:
+                break
+            r1, r2 = zip(*batch)
+            for seq, qual in merge_batch(r1, r2, **self.merge_args):
+                if not seq:
+                    self.unmerged += 1
+                    continue
+                if self.oligo_len is not None:
+                    if len(seq) < self.oligo_len:
+                        self.short += 1
+                        continue
+                    seq, qual = seq[: self.oligo_len], qual[: self.oligo_len]
+                if self.min_quality is not None:
+                    if np.frombuffer(qual, dtype=np.uint8).mean() - PHRED_OFFSET < self.min_quality:
+                        self.low_quality += 1
+                        continue
+                yield seq
+        logging.info(
+            "{} pairs could not be merged. Dropped {} short and {} low quality merged reads.".format(
+                self.unmerged, self.short, self.low_quality
+            )
+        )
+
+    def close(self) -> None:
+        self.file1.close()
+        self.file2.close()
+
+    def __enter__(self) -> "MergedStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,273 @@
+import bisect
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Instrumentation is off until a session is started. Hot paths test this flag before
+# touching the registry, so a disabled run pays one attribute lookup per call site.
+ENABLED = False
+# prefix of every exported metric name
+NAMESPACE = "dna_fountain"
+# histogram bucket upper bounds: powers of two for sizes, decades for seconds
+SIZE_BUCKETS = tuple(float(1 << i) for i in range(21))
+TIME_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0, 100.0, 1000.0)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, object]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # counts[i] observations in (buckets[i - 1], buckets[i]], the last one above all buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Counters, gauges and histograms by name and labels. Updates come from the main thread,
+    the exporter thread only reads copies of the dicts, so no lock is taken.
+    """
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = dict()
+        self.gauges: Dict[Key, float] = dict()
+        self.histograms: Dict[Key, Histogram] = dict()
+        self.start = time.time()
+
+    def snapshot(self) -> Dict[str, list]:
+        def entries(items, value):
+            return [dict(name=name, labels=dict(labels), **value(v)) for (name, labels), v in items]
+
+        return dict(
+            elapsed=time.time() - self.start,
+            counters=entries(list(self.counters.items()), lambda v: dict(value=v)),
+            gauges=entries(list(self.gauges.items()), lambda v: dict(value=v)),
+            histograms=entries(
+                list(self.histograms.items()),
+                lambda h: dict(buckets=list(h.buckets), counts=list(h.counts), sum=h.sum, count=h.count),
+            ),
+        )
+
+
+registry = Registry()
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = _key(name, labels)
+    registry.counters[key] = registry.counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    registry.gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = SIZE_BUCKETS, **labels) -> None:
+    key = _key(name, labels)
+    histogram = registry.histograms.get(key)
+    if histogram is None:
+        histogram = registry.histograms[key] = Histogram(buckets)
+    histogram.observe(value)
+
+
+class _Timer:
+    def __init__(self, name: str, labels: Dict[str, object]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.name, time.perf_counter() - self.start, TIME_BUCKETS, **self.labels)
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def timer(name: str, **labels):
+    """
+    context manager recording the wall time of a stage in the histogram name (in seconds)
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def _labels(labels: Dict[str, str], extra: str = "") -> str:
+    parts = ['{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def to_json(snapshot: Dict[str, list]) -> str:
+    return json.dumps(snapshot, indent=1)
+
+
+def to_prometheus(snapshot: Dict[str, list]) -> str:
+    """
+    the snapshot in the Prometheus text exposition format
+    """
+    lines: List[str] = []
+    typed = set()
+
+    def header(name: str, kind: str) -> None:
+        if name not in typed:
+            typed.add(name)
+            lines.append("# TYPE {} {}".format(name, kind))
+
+    for kind in ("counters", "gauges"):
+        for entry in snapshot[kind]:
+            name = "{}_{}".format(NAMESPACE, entry["name"])
+            header(name, "counter" if kind == "counters" else "gauge")
+            lines.append("{}{} {}".format(name, _labels(entry["labels"]), entry["value"]))
+    for entry in snapshot["histograms"]:
+        name = "{}_{}".format(NAMESPACE, entry["name"])
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(entry["buckets"] + ["+Inf"], entry["counts"]):
+            cumulative += count
+            le = 'le="{}"'.format(bound if bound == "+Inf" else repr(float(bound)))
+            lines.append("{}_bucket{} {}".format(name, _labels(entry["labels"], le), cumulative))
+        lines.append("{}_sum{} {}".format(name, _labels(entry["labels"]), entry["sum"]))
+        lines.append("{}_count{} {}".format(name, _labels(entry["labels"]), entry["count"]))
+    return "\n".join(lines) + "\n"
+
+
+FORMATS = {"json": to_json, "prometheus": to_prometheus}
+
+
+def write(path: str, fmt: str = "json") -> None:
+    """
+    write the current metrics, replacing the file atomically so scrapers never see half a file
+    """
+    text = FORMATS[fmt](registry.snapshot())
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as file:
+        file.write(text)
+    os.replace(tmp, path)
+
+
+class _Periodic(threading.Thread):
+    """
+    daemon thread calling func every interval seconds until stopped
+    """
+
+    def __init__(self, interval: float, func: Callable[[], None]):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.func = func
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.func()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+class Sampler:
+    """
+    Sampling profiler: the stack of one thread is recorded every interval seconds from a daemon thread,
+    and counted as folded stacks ("file:function;file:function count", the input of flamegraph.pl).
+    hook: called with every sampled frame, to plug in another profiler; type = callable
+    """
+
+    def __init__(self, interval: float = 0.01, hook: Callable = None, thread_id: int = None):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.hook = hook
+        self.thread_id = threading.main_thread().ident if thread_id is None else thread_id
+        self.thread = _Periodic(interval, self.sample)
+
+    def sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        if self.hook is not None:
+            self.hook(frame)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+        # counted here, the main thread adds it to the registry
+        self.samples += 1
+
+    def start(self) -> "Sampler":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.thread.stop()
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write("{} {}\n".format(stack, count))
+
+
+@contextlib.contextmanager
+def session(
+    path: Optional[str],
+    fmt: str = "json",
+    interval: float = None,
+    profile_interval: float = None,
+    profile_hook: Callable = None,
+) -> Iterator[None]:
+    """
+    Collect metrics while the block runs and write them to path at its end, and every interval seconds
+    during it. With profile_interval the main thread is also sampled, the folded stacks go to path + ".folded".
+    Without a path nothing is collected.
+    :param
+    path: file the metrics are written to, None to disable instrumentation; type: str
+    fmt: "json" or "prometheus"; type: str
+    interval: seconds between two periodic writes, None to write only at the end; type: float
+    profile_interval: seconds between two profiler samples, None for no profiler; type: float
+    profile_hook: called with every sampled frame; type: callable
+    """
+    global ENABLED, registry
+    if path is None:
+        yield
+        return
+    if fmt not in FORMATS:
+        raise ValueError("unknown metrics format {}, expected one of {}".format(fmt, list(FORMATS)))
+    registry = Registry()
+    ENABLED = True
+    exporter = None if interval is None else _Periodic(interval, lambda: write(path, fmt))
+    sampler = None if profile_interval is None else Sampler(profile_interval, profile_hook)
+    for thread in (exporter, sampler):
+        if thread is not None:
+            thread.start()
+    try:
+        yield
+    finally:
+        for thread in (exporter, sampler):
+            if thread is not None:
+                thread.stop()
+        if sampler is not None:
+            inc("profiler_samples_total", sampler.samples)
+        ENABLED = False
+        write(path, fmt)
+        if sampler is not None:
+            sampler.write("{}.folded".format(path))
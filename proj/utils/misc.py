@@ -1,52 +1,82 @@
-import logging
-from typing import List, Tuple
-from PIL import Image, ImageChops
+import os
+from typing import Tuple
+import numpy as np
 
 
-def process_raw_input(input_file: str, chunk_size: int) -> Tuple[List[List[int]], int]:
+class ChunkStore:
     """
-    read in file and transform to matrix
-    :param
-    input_file: file name; type: str
-    chunk_size: number of information bytes per message; type: int
-
-    :return
-    data_array: data array; type: list.
-    len_data: file size after zero padding; type: int.
+    Read-only (num_chunks, chunk_size) uint8 view of a file, backed by a memory map.
+    Whole chunks are zero-copy rows of the map; the last, partial chunk is padded
+    with zeros virtually, so the file is never read into memory nor copied.
     """
 
-    with open(input_file, "rb") as file:
-        data = file.read()
+    def __init__(self, input_file: str, chunk_size: int):
+        file_len = os.path.getsize(input_file)
+        self.chunk_size = chunk_size
+        self.num_chunks = -(-file_len // chunk_size)
+        self.shape = (self.num_chunks, chunk_size)
+        # file size after zero padding
+        self.data_len = self.num_chunks * chunk_size
 
-    # 原始文件二进制长度
-    data_len = len(data)
+        num_full = file_len // chunk_size
+        if num_full > 0:
+            self.full = np.memmap(input_file, dtype=np.uint8, mode="r", shape=(num_full, chunk_size))
+        else:
+            self.full = np.zeros((0, chunk_size), dtype=np.uint8)
+        self.tail = None
+        if num_full < self.num_chunks:
+            with open(input_file, "rb") as file:
+                file.seek(num_full * chunk_size)
+                rest = file.read()
+            self.tail = np.zeros(chunk_size, dtype=np.uint8)
+            self.tail[: len(rest)] = np.frombuffer(rest, dtype=np.uint8)
 
-    # 文件大小补齐为 chunk_size 倍数
-    pad = -data_len % chunk_size
-    if pad > 0:
-        # Padded the file with zeros to have a round number of blocks of data
-        data += b"\x00" * pad
-        data_len = len(data)
+    def __len__(self) -> int:
+        return self.num_chunks
 
-    segments = data_len // chunk_size
+    def slice(self, start: int, stop: int) -> "ChunkStore":
+        """
+        zero-copy store of the chunks [start, stop)
+        """
+        store = ChunkStore.__new__(ChunkStore)
+        store.chunk_size = self.chunk_size
+        store.num_chunks = stop - start
+        store.shape = (store.num_chunks, self.chunk_size)
+        store.data_len = store.num_chunks * self.chunk_size
+        store.full = self.full[start:stop]
+        store.tail = self.tail if stop > len(self.full) else None
+        return store
 
-    data_array: List[List[int]] = [None] * (segments)
-    for num in range(segments):
-        start = chunk_size * num
-        end = chunk_size * (num + 1)
-        chunk_binary = data[start:end]
-        data_array[num] = [cb for cb in chunk_binary]
+    def __getitem__(self, index) -> np.ndarray:
+        """
+        chunk rows for an int or an array of chunk numbers
+        """
+        if self.tail is None:
+            return np.asarray(self.full[index])
+        index = np.asarray(index)
+        num_full = len(self.full)
+        if index.ndim == 0:
+            return self.tail.copy() if index == num_full else np.asarray(self.full[index])
+        out = np.empty(index.shape + (self.chunk_size,), dtype=np.uint8)
+        is_tail = index == num_full
+        if num_full > 0:
+            out[~is_tail] = self.full[index[~is_tail]]
+        out[is_tail] = self.tail
+        return out
 
-    return data_array, data_len
 
+def process_raw_input(input_file: str, chunk_size: int) -> Tuple[ChunkStore, int]:
+    """
+    map file as a matrix of chunks
+    :param
+    input_file: file name; type: str
+    chunk_size: number of information bytes per message; type: int
 
-def check_integrity(origin_file: str, decode_file: str) -> None:
-    origin_img = Image.open(origin_file)
-    decode_img = Image.open(decode_file)
+    :return
+    data_array: chunk store, indexable like a (num_chunks, chunk_size) uint8 array; type: ChunkStore.
+    len_data: file size after zero padding; type: int.
+    """
+    # 文件大小补齐为 chunk_size 倍数，补齐部分不占内存
+    store = ChunkStore(input_file, chunk_size)
+    return store, store.data_len
 
-    diff = ImageChops.difference(origin_img, decode_img)
-    logging.info("Checking integrity completed.")
-    if diff.getbbox() is None:
-        logging.info("No difference found between original image and decoded image!")
-    else:
-        logging.error("There are some differences between two images!")
@@ -0,0 +1,114 @@
+import itertools
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from .DNAFountain import DNAFountain
+from .glass import Glass
+from .archive import archive_fountains
+from .segmented import SegmentedGlass, block_fountains
+from . import LFSR, codec
+
+# per worker process state, set up once by the pool initializer
+_fountains: Dict[Optional[int], DNAFountain] = None
+_glass: Glass = None
+
+
+def init_encoder(
+    input_file: str,
+    fountain_args: Dict[str, Any],
+    block_chunks: int = None,
+    input_files: List[str] = None,
+) -> None:
+    global _fountains
+    # the chunk store is a read-only memory map, so all the workers share the page cache of the input file
+    if input_files is not None:
+        _fountains = {f.block: f for f in archive_fountains(input_files, fountain_args)}
+    elif block_chunks is None:
+        _fountains = {None: DNAFountain(input_file, **fountain_args)}
+    else:
+        fountains = block_fountains(input_file, block_chunks, fountain_args)
+        _fountains = {f.block: f for f in fountains}
+
+
+def encode_seeds(state: int, n: int, block: int = None) -> Tuple[List[Tuple[int, str]], np.ndarray]:
+    """
+    create and screen the droplets of the n seeds after an lfsr state of a block in a worker process,
+    the seeds are computed here rather than sent by the main process
+    :return
+    oligos: (seed, DNA) of the droplets that passed the screen, in seed order; type: list
+    reasons: rejection flags of every droplet, so the main process counts only the droplets it uses; type: np.ndarray
+    """
+    fountain = _fountains[block]
+    seeds = LFSR.LFSREngine(state).next_batch(n).tolist()
+    reasons, dna = fountain.screen_reasons(fountain.droplets_from_seeds(seeds))
+    passed = np.flatnonzero(reasons == 0).tolist()
+    oligos = [(seeds[i], oligo.translate(codec.DIGITS_TO_NT)) for i, oligo in zip(passed, dna)]
+    return oligos, reasons
+
+
+def init_decoder(glass_args: Dict[str, Any], block_chunks: int = None) -> None:
+    global _glass
+    # only the stateless part (parse_data) of this glass is used
+    if block_chunks is None:
+        _glass = Glass(**glass_args)
+    else:
+        _glass = SegmentedGlass(block_chunks=block_chunks, **glass_args)
+
+
+def decode_reads(batch) -> Tuple[np.ndarray, ...]:
+    """
+    parse, error correct and look up the neighbours of a batch of reads (or of packed pool records) in a worker process
+    :return
+    the records for Glass.add_record, packed by pack_records; type: tuple
+    """
+    return pack_records(_glass.parse_batch(codec.to_messages(batch)))
+
+
+def pack_records(records: List[Optional[tuple]]) -> Tuple[np.ndarray, ...]:
+    """
+    Records of Glass.parse_batch as a few flat arrays, which cross a process boundary far faster than
+    a tuple and a list of neighbours per read.
+    :return
+    parsed: whether every read gave a record (None entries do not); type: np.ndarray
+    heads: the ints in front of the payload of every record (seed, or block id and seed), one row per record; type: np.ndarray
+    payloads, payload_ends: the payloads one after the other, and where each ends; type: np.ndarray
+    neighbours, neighbour_ends: the neighbours one after the other, and where each list ends; type: np.ndarray
+    screened: whether every record passed the screen; type: np.ndarray
+    """
+    parsed = np.fromiter((record is not None for record in records), dtype=bool, count=len(records))
+    kept = [record for record in records if record is not None]
+    width = len(kept[0]) - 3 if kept else 1
+    heads = np.array([record[:-3] for record in kept], dtype=np.int64).reshape(len(kept), width)
+    payloads = np.frombuffer(b"".join(bytes(record[-3]) for record in kept), dtype=np.uint8)
+    payload_ends = np.cumsum([len(record[-3]) for record in kept], dtype=np.int64)
+    neighbour_ends = np.cumsum([len(record[-2]) for record in kept], dtype=np.int64)
+    neighbours = np.fromiter(
+        itertools.chain.from_iterable(record[-2] for record in kept),
+        dtype=np.int64,
+        count=int(neighbour_ends[-1]) if kept else 0,
+    )
+    screened = np.fromiter((record[-1] for record in kept), dtype=bool, count=len(kept))
+    return parsed, heads, payloads, payload_ends, neighbours, neighbour_ends, screened
+
+
+def unpack_records(packed: Tuple[np.ndarray, ...]) -> Iterator[Optional[tuple]]:
+    """
+    the records of pack_records, with the payload as bytes, or None for the reads without a record
+    """
+    parsed, heads, payloads, payload_ends, neighbours, neighbour_ends, screened = packed
+    # plain python values: indexing numpy arrays one element at a time is slower
+    heads, neighbours, screened = heads.tolist(), neighbours.tolist(), screened.tolist()
+    payloads = payloads.tobytes()
+    payload_ends, neighbour_ends = payload_ends.tolist(), neighbour_ends.tolist()
+    i = payload_start = neighbour_start = 0
+    for ok in parsed.tolist():
+        if not ok:
+            yield None
+            continue
+        yield (
+            *heads[i],
+            payloads[payload_start : payload_ends[i]],
+            neighbours[neighbour_start : neighbour_ends[i]],
+            screened[i],
+        )
+        payload_start, neighbour_start = payload_ends[i], neighbour_ends[i]
+        i += 1
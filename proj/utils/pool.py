@@ -0,0 +1,304 @@
+import os
+import struct
+from typing import Iterator, List, Optional, Sequence
+import numpy as np
+from . import codec
+from .reads import ReadStream
+
+# Binary oligo pool: a fixed size header, then one fixed-width record per oligo with
+# 4 nt packed per byte (the DNA message itself), then an optional sorted seed index.
+MAGIC = b"DNAPOOL1"
+# magic, chunk_size, rs, K, delta, c, lfsr_state, oligo length (nt), seed offset in a record (bytes),
+# number of records, byte offset of the seed index (0 without index)
+HEADER = struct.Struct("!8sIHIddIIHQQ")
+# records start at an aligned offset after the header
+HEADER_SIZE = 64
+# seed index: seeds in ascending order and the record number of each
+INDEX_DTYPE = np.dtype([("seed", "<u4"), ("record", "<u4")])
+
+
+def is_pool(path: str) -> bool:
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+class PoolHeader:
+    def __init__(
+        self,
+        chunk_size: int,
+        rs: int,
+        K: int,
+        delta: float,
+        c: float,
+        lfsr_state: int,
+        oligo_len: int,
+        seed_offset: int = 0,
+        num_records: int = 0,
+        index_offset: int = 0,
+    ):
+        """
+        chunk_size: number of bytes of the payload; type = int
+        rs: number of bytes of the RS symbols; type = int
+        K: number of chunks of the encoded file, of the manifest for an archive; type = int
+        delta, c: degree distribution parameters; type = float
+        lfsr_state: the last lfsr state of the encoder, for a top-up; type = int
+        oligo_len: number of nt of an oligo; type = int
+        seed_offset: number of bytes in front of the seed (the block id); type = int
+        """
+        self.chunk_size = chunk_size
+        self.rs = rs
+        self.K = K
+        self.delta = delta
+        self.c = c
+        self.lfsr_state = lfsr_state
+        self.oligo_len = oligo_len
+        self.seed_offset = seed_offset
+        self.num_records = num_records
+        self.index_offset = index_offset
+
+    @property
+    def record_size(self) -> int:
+        return -(-self.oligo_len // 4)
+
+    def pack(self) -> bytes:
+        return HEADER.pack(
+            MAGIC,
+            self.chunk_size,
+            self.rs,
+            self.K,
+            self.delta,
+            self.c,
+            self.lfsr_state,
+            self.oligo_len,
+            self.seed_offset,
+            self.num_records,
+            self.index_offset,
+        ).ljust(HEADER_SIZE, b"\0")
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "PoolHeader":
+        magic, *fields = HEADER.unpack(data[: HEADER.size])
+        if magic != MAGIC:
+            raise ValueError("not an oligo pool file")
+        return cls(*fields)
+
+
+class PoolWriter:
+    """
+    Write a pool record by record in bulk. The header is written again and the seed index appended on close.
+    """
+
+    def __init__(self, path: str, header: PoolHeader, append: bool = False):
+        """
+        append: add records to an existing pool (its index is rebuilt on close); type = bool
+        """
+        self.path = path
+        if append and os.path.exists(path):
+            self.file = open(path, "r+b")
+            self.header = PoolHeader.unpack(self.file.read(HEADER_SIZE))
+            if self.header.oligo_len != header.oligo_len:
+                raise ValueError("oligos of {} nt can not be added to a pool of {} nt".format(
+                    header.oligo_len, self.header.oligo_len
+                ))
+            # drop the old index, it is written again after the new records
+            self.file.seek(HEADER_SIZE + self.header.num_records * self.header.record_size)
+            self.file.truncate()
+        else:
+            self.file = open(path, "wb")
+            self.header = header
+            self.header.num_records = 0
+            self.file.write(self.header.pack())
+
+    def write(self, records: np.ndarray) -> None:
+        """
+        append a (n, record_size) uint8 matrix of packed oligos
+        """
+        records = np.ascontiguousarray(records, dtype=np.uint8)
+        if records.shape[1:] != (self.header.record_size,):
+            raise ValueError("records of {} bytes, expected {}".format(
+                records.shape[1:], self.header.record_size
+            ))
+        self.file.write(memoryview(records).cast("B"))
+        self.header.num_records += len(records)
+
+    def write_reads(self, reads: Sequence[str]) -> int:
+        """
+        pack and append DNA strings of the pool length, other reads are skipped
+        :return
+        number of reads written; type: int
+        """
+        reads = [dna for dna in reads if len(dna) == self.header.oligo_len]
+        if len(reads) == 0:
+            return 0
+        records, valid = codec.batch_dna_to_bytes(reads)
+        self.write(records[valid])
+        return int(np.count_nonzero(valid))
+
+    def close(self, lfsr_state: int = None, index: bool = True) -> None:
+        if lfsr_state is not None:
+            self.header.lfsr_state = lfsr_state
+        self.header.index_offset = 0
+        if index:
+            self.file.flush()
+            self.header.index_offset = self.file.tell()
+            self.file.write(memoryview(build_index(self.path, self.header)).cast("B"))
+        self.file.seek(0)
+        self.file.write(self.header.pack())
+        self.file.close()
+
+    def __enter__(self) -> "PoolWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if not self.file.closed:
+            self.close()
+
+
+def _records(path: str, header: PoolHeader) -> np.ndarray:
+    if header.num_records == 0:
+        return np.zeros((0, header.record_size), dtype=np.uint8)
+    return np.memmap(
+        path,
+        dtype=np.uint8,
+        mode="r",
+        offset=HEADER_SIZE,
+        shape=(header.num_records, header.record_size),
+    )
+
+
+def seeds_of(records: np.ndarray, seed_offset: int) -> np.ndarray:
+    """
+    the seeds (big endian) of a (n, record_size) matrix of records
+    """
+    seeds = np.ascontiguousarray(records[:, seed_offset : seed_offset + 4])
+    return seeds.view(">u4").reshape(-1).astype(np.uint32)
+
+
+def build_index(path: str, header: PoolHeader) -> np.ndarray:
+    index = np.empty(header.num_records, dtype=INDEX_DTYPE)
+    index["seed"] = seeds_of(_records(path, header), header.seed_offset)
+    index["record"] = np.arange(header.num_records)
+    return np.sort(index, order=("seed", "record"), kind="stable")
+
+
+class PoolReader:
+    """
+    Memory mapped, read-only view of a pool: records[i] is the packed oligo i.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self.header = PoolHeader.unpack(file.read(HEADER_SIZE))
+        self.records = _records(path, self.header)
+        self.index: Optional[np.ndarray] = None
+        if self.header.index_offset and self.header.num_records > 0:
+            self.index = np.memmap(
+                path,
+                dtype=INDEX_DTYPE,
+                mode="r",
+                offset=self.header.index_offset,
+                shape=(self.header.num_records,),
+            )
+
+    def __len__(self) -> int:
+        return self.header.num_records
+
+    def batches(self, batch_size: int, start: int = 0) -> Iterator[np.ndarray]:
+        """
+        the records from start on, batch_size at a time
+        """
+        for i in range(start, len(self), batch_size):
+            yield np.array(self.records[i : i + batch_size])
+
+    def reads(self, batch_size: int = 1 << 16) -> Iterator[str]:
+        full = self.header.oligo_len // 4 * 4
+        for batch in self.batches(batch_size):
+            symbols = codec.bytes_to_symbols(batch)
+            if full < self.header.oligo_len:
+                # a trailing group of less than 4 nt is packed into the low bits of the last byte
+                rest = self.header.oligo_len - full
+                symbols = np.concatenate([symbols[:, :full], symbols[:, -rest:]], axis=1)
+            yield from codec.symbols_to_dna(symbols)
+
+    def find(self, seed: int) -> List[int]:
+        """
+        record numbers of the oligos with a seed, by binary search in the index
+        """
+        if self.index is None:
+            return np.flatnonzero(seeds_of(self.records, self.header.seed_offset) == seed).tolist()
+        seeds = self.index["seed"]
+        lo = int(np.searchsorted(seeds, seed, side="left"))
+        hi = int(np.searchsorted(seeds, seed, side="right"))
+        return self.index["record"][lo:hi].tolist()
+
+    def close(self) -> None:
+        # the maps are released with the arrays
+        self.records = None
+        self.index = None
+
+    def __enter__(self) -> "PoolReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_text(path: str) -> Iterator[str]:
+    with open(path, "r") as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if len(line) == 0:
+                break
+            yield line
+
+
+def _reads_to_pool(reads: Iterator[str], pool_file: str, header: PoolHeader, index: bool) -> int:
+    written = 0
+    with PoolWriter(pool_file, header) as writer:
+        batch: List[str] = []
+        for dna in reads:
+            if header.oligo_len == 0:
+                # the first read sets the oligo length
+                header.oligo_len = len(dna)
+            batch.append(dna)
+            if len(batch) == 1 << 16:
+                written += writer.write_reads(batch)
+                batch = []
+        written += writer.write_reads(batch)
+        writer.close(index=index)
+    return written
+
+
+def text_to_pool(text_file: str, pool_file: str, header: PoolHeader, index: bool = True) -> int:
+    """
+    convert a file of one oligo per line to a pool. Reads that are not DNA or not oligo_len nt long are skipped,
+    oligo_len = 0 takes the length of the first read.
+    :return
+    number of oligos written; type: int
+    """
+    return _reads_to_pool(read_text(text_file), pool_file, header, index)
+
+
+def fasta_to_pool(fasta_file: str, pool_file: str, header: PoolHeader, index: bool = True) -> int:
+    """
+    text_to_pool for a FASTA (or FASTQ) file, plain or gzip
+    """
+    with ReadStream(fasta_file) as stream:
+        return _reads_to_pool(iter(stream), pool_file, header, index)
+
+
+def pool_to_text(pool_file: str, text_file: str) -> None:
+    with PoolReader(pool_file) as pool, open(text_file, "w") as out:
+        for dna in pool.reads():
+            out.write("{}\n".format(dna))
+
+
+def pool_to_fasta(pool_file: str, fasta_file: str) -> None:
+    """
+    write a pool as FASTA, every oligo named after its record number and seed
+    """
+    with PoolReader(pool_file) as pool, open(fasta_file, "w") as out:
+        seeds = seeds_of(pool.records, pool.header.seed_offset).tolist()
+        for i, (seed, dna) in enumerate(zip(seeds, pool.reads())):
+            out.write(">oligo_{}_seed_{}\n{}\n".format(i, seed, dna))
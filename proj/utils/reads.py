@@ -0,0 +1,153 @@
+import gzip
+import logging
+from typing import Iterator, Tuple
+import numpy as np
+
+# bytes read from the (decompressed) file at a time
+BLOCK_SIZE = 1 << 22
+GZIP_MAGIC = b"\x1f\x8b"
+# Phred+33 (Sanger / Illumina 1.8+) quality characters
+PHRED_OFFSET = 33
+
+
+def open_binary(path: str):
+    """
+    open a plain or gzip compressed file for reading bytes
+    """
+    with open(path, "rb") as file:
+        magic = file.read(len(GZIP_MAGIC))
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def detect_format(path: str) -> str:
+    """
+    "fastq", "fasta" or "text" (one read per line) from the first character of the (decompressed) file
+    """
+    with open_binary(path) as file:
+        first = file.read(1)
+    return {b"@": "fastq", b">": "fasta"}.get(first, "text")
+
+
+def is_sequencer_output(path: str) -> bool:
+    """
+    whether a file needs the ReadStream parser: FASTQ, FASTA or anything gzip compressed
+    """
+    with open(path, "rb") as file:
+        if file.read(len(GZIP_MAGIC)) == GZIP_MAGIC:
+            return True
+    return detect_format(path) != "text"
+
+
+def iter_lines(file, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    the lines of a binary file without their line ends, read block_size bytes at a time
+    """
+    rest = b""
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        lines = (rest + block).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if rest:
+        yield rest.rstrip(b"\r")
+
+
+def fastq_records(file) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    (sequence, quality) of every record of a FASTQ file opened in binary mode
+    """
+    lines = iter_lines(file)
+    # header, sequence, separator and quality lines of every record
+    for _, seq, _, qual in zip(lines, lines, lines, lines):
+        yield seq, qual
+
+
+class ReadStream:
+    """
+    Streaming reader of the sequences of a FASTQ, FASTA or one-read-per-line file, plain or gzip.
+    Reads are trimmed to oligo_len, shorter reads are dropped, and FASTQ reads with a mean
+    Phred quality below min_quality are dropped before they reach the RS decoder.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        oligo_len: int = None,
+        min_quality: float = None,
+        phred_offset: int = PHRED_OFFSET,
+    ):
+        """
+        path: FASTQ, FASTA or text file, optionally gzip compressed; type = str
+        oligo_len: number of nt to keep of every read, None to keep whole reads; type = int
+        min_quality: the lowest mean Phred quality of a kept FASTQ read, None to keep all reads; type = float
+        phred_offset: ascii code of quality 0; type = int
+        """
+        self.path = path
+        self.format = detect_format(path)
+        self.oligo_len = oligo_len
+        self.min_quality = min_quality
+        self.phred_offset = phred_offset
+        self.file = open_binary(path)
+        self.short = 0
+        self.low_quality = 0
+
+    def _fastq(self) -> Iterator[bytes]:
+        for seq, qual in fastq_records(self.file):
+            if self.oligo_len is not None:
+                if len(seq) < self.oligo_len:
+                    self.short += 1
+                    continue
+                seq, qual = seq[: self.oligo_len], qual[: self.oligo_len]
+            if self.min_quality is not None:
+                mean = np.frombuffer(qual, dtype=np.uint8).mean() - self.phred_offset
+                if mean < self.min_quality:
+                    self.low_quality += 1
+                    continue
+            yield seq
+
+    def _fasta(self) -> Iterator[bytes]:
+        parts = []
+        for line in iter_lines(self.file):
+            if line.startswith(b">"):
+                if parts:
+                    yield b"".join(parts)
+                parts = []
+            elif line:
+                parts.append(line)
+        if parts:
+            yield b"".join(parts)
+
+    def _text(self) -> Iterator[bytes]:
+        for line in iter_lines(self.file):
+            if len(line) == 0:
+                break
+            yield line
+
+    def __iter__(self) -> Iterator[str]:
+        sequences = {"fastq": self._fastq, "fasta": self._fasta, "text": self._text}[self.format]()
+        for seq in sequences:
+            if self.oligo_len is not None and self.format != "fastq":
+                if len(seq) < self.oligo_len:
+                    self.short += 1
+                    continue
+                seq = seq[: self.oligo_len]
+            yield seq.decode("ascii", "replace")
+        logging.info(
+            "Dropped {} reads shorter than the oligo and {} reads below the quality threshold.".format(
+                self.short, self.low_quality
+            )
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "ReadStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
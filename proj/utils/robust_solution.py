@@ -1,15 +1,68 @@
-import math, random, numpy
-from typing import Dict, Any, List, Tuple, Union
+import math, random, numpy, os, bisect
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+
+class NeighbourCache:
+    """
+    On-disk cache of seed -> (degree, chunk numbers), one file per degree distribution (K, delta, c).
+    """
+
+    def __init__(self, cache_dir: str, K: float, delta: float, c: float):
+        self.path = os.path.join(
+            cache_dir, "prng_K{}_delta{!r}_c{!r}.npz".format(int(K), delta, c)
+        )
+        self.table: Dict[int, List[int]] = dict()
+        self.dirty = False
+        if os.path.exists(self.path):
+            with numpy.load(self.path) as npz:
+                seeds, offsets, nums = npz["seeds"], npz["offsets"], npz["nums"]
+            nums = nums.tolist()
+            for seed, start, end in zip(seeds.tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+                self.table[seed] = nums[start:end]
+
+    def get(self, seed: int) -> Optional[List[int]]:
+        return self.table.get(seed)
+
+    def put(self, seed: int, nums: List[int]) -> None:
+        if seed not in self.table:
+            self.table[seed] = nums
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        seeds = numpy.fromiter(self.table, dtype=numpy.uint32, count=len(self.table))
+        offsets = numpy.zeros(len(self.table) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(nums) for nums in self.table.values()], out=offsets[1:])
+        nums = numpy.fromiter(
+            (n for nums in self.table.values() for n in nums), dtype=numpy.int32, count=offsets[-1]
+        )
+        # write to a temporary file first so an interrupted save never corrupts the cache
+        tmp = self.path + ".tmp.npz"
+        numpy.savez(tmp, seeds=seeds, offsets=offsets, nums=nums)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+# seeds whose degrees get_src_blocks_batch draws at once, each from its own generator
+BATCH_GENERATORS = 1024
 
 
 class PRNG:
-    def __init__(self, K: float, delta: float, c: float):
+    def __init__(self, K: float, delta: float, c: float, cache_dir: str = None):
         self.K = float(K)
         self.delta = delta
         self.c = c
         self.S = self.c * math.log(self.K / self.delta) * math.sqrt(self.K)
         self.cdf, self.Z = self._gen_rsd_cdf(K, self.S, self.delta)
+        self._cdf_list: List[float] = self.cdf.tolist()
         self.state: int = 1  # seed
+        # private generator, seeded exactly like random.seed() so the sequences match the global one
+        self._rng = random.Random()
+        # one generator per seed of a slice of get_src_blocks_batch, reseeded for every slice
+        self._rngs: List[random.Random] = []
+        self.cache = NeighbourCache(cache_dir, K, delta, c) if cache_dir else None
 
     def _gen_rsd_cdf(self, K, S, delta) -> Tuple[numpy.ndarray, int]:
         pivot = int(math.floor(K / S))
@@ -27,19 +80,58 @@ class PRNG:
         self.state = seed
 
     def get_src_blocks_wrap(self, seed: int = None) -> Tuple[int, List[int]]:
-        if seed:
+        if seed is not None:
             self.state = seed
-        random.seed(self.state)
-        p = random.random()
+        if self.cache is not None:
+            nums = self.cache.get(self.state)
+            if nums is not None:
+                return len(nums), nums
+        self._rng.seed(self.state)
+        p = self._rng.random()
         d = self._sample_d(p)
-        nums = random.sample(range(int(self.K)), d)
+        nums = self._rng.sample(range(int(self.K)), d)
+        if self.cache is not None:
+            self.cache.put(self.state, nums)
         return d, nums
 
+    def get_src_blocks_batch(self, seeds: Sequence[int]) -> Tuple[List[int], List[List[int]]]:
+        """
+        Degrees and chunk numbers for every seed, as get_src_blocks_wrap(seed) for each of them.
+        The degree of a seed is the first draw of a generator seeded with it, and its chunk numbers the next ones,
+        so every seed of a slice of BATCH_GENERATORS gets its own generator: the degrees of the whole slice are
+        then looked up in the cdf at once, before the chunk numbers are sampled from each generator.
+        """
+        degrees, samples = [], []
+        population = range(int(self.K))
+        for start in range(0, len(seeds), BATCH_GENERATORS):
+            part = seeds[start : start + BATCH_GENERATORS]
+            cached = [None] * len(part) if self.cache is None else [self.cache.get(seed) for seed in part]
+            new = [i for i, nums in enumerate(cached) if nums is None]
+            while len(self._rngs) < len(new):
+                self._rngs.append(random.Random())
+            ps = numpy.empty(len(new))
+            for j, i in enumerate(new):
+                rng = self._rngs[j]
+                rng.seed(part[i])
+                ps[j] = rng.random()
+            # _sample_d for all the draws
+            ds = numpy.minimum(numpy.searchsorted(self.cdf, ps, side="right"), len(self.cdf) - 1) + 1
+            for j, (i, d) in enumerate(zip(new, ds.tolist())):
+                cached[i] = self._rngs[j].sample(population, d)
+                if self.cache is not None:
+                    self.cache.put(part[i], cached[i])
+            degrees.extend(len(nums) for nums in cached)
+            samples.extend(cached)
+        return degrees, samples
+
     def _sample_d(self, p: float) -> int:
-        for ix, v in enumerate(self.cdf):
-            if v > p:
-                return ix + 1
-        return ix + 1
+        # index of the first cdf value > p, by binary search
+        ix = bisect.bisect_right(self._cdf_list, p)
+        return min(ix, len(self._cdf_list) - 1) + 1
+
+    def save_cache(self) -> None:
+        if self.cache is not None:
+            self.cache.save()
 
     def debug(self) -> Dict[str, Union[float, int]]:
         return {
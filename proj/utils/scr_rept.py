@@ -1,16 +1,98 @@
 from utils.droplet import Droplet
+import numpy as np
 
+# rejection reasons of the batch screen, combined as bit flags (0 means the oligo passed)
+HOMOPOLYMER = 1
+GC_CONTENT = 2
+REASONS = {HOMOPOLYMER: "homopolymer", GC_CONTENT: "gc"}
 
-def screen_repeat(drop: Droplet, max_homopolymer: int, gc_dev: float) -> bool:
+
+def screen_reason(drop: Droplet, max_homopolymer: int, gc_dev: float) -> int:
+    """
+    the REASONS flag of the first constraint the droplet violates, 0 if it passes
+    """
     As = "0" * (max_homopolymer + 1)
     Cs = "1" * (max_homopolymer + 1)
     Gs = "2" * (max_homopolymer + 1)
     Ts = "3" * (max_homopolymer + 1)
     dna = drop.to_dna()
     if As in dna or Cs in dna or Gs in dna or Ts in dna:
-        return False
+        return HOMOPOLYMER
     gc = dna.count("1") + dna.count("2")
     gc = gc / (len(dna) + 0.0)
     if (gc < 0.5 - gc_dev) or (gc > 0.5 + gc_dev):
-        return False
-    return True
+        return GC_CONTENT
+    return 0
+
+
+def screen_repeat(drop: Droplet, max_homopolymer: int, gc_dev: float) -> bool:
+    return screen_reason(drop, max_homopolymer, gc_dev) == 0
+
+
+def max_run_length(symbols: np.ndarray) -> np.ndarray:
+    """
+    length of the longest homopolymer in every row of a (n, L) matrix of 2-bit symbols
+    """
+    n, width = symbols.shape
+    starts = np.ones((n, width), dtype=bool)
+    starts[:, 1:] = symbols[:, 1:] != symbols[:, :-1]
+    # run starts in row major order, every row starts a new run
+    idx = np.flatnonzero(starts)
+    lengths = np.diff(np.append(idx, n * width))
+    first_run = np.searchsorted(idx, np.arange(n) * width)
+    return np.maximum.reduceat(lengths, first_run)
+
+
+def gc_count(symbols: np.ndarray) -> np.ndarray:
+    """
+    number of C (1) and G (2) in every row of a (n, L) matrix of 2-bit symbols
+    """
+    return np.count_nonzero((symbols == 1) | (symbols == 2), axis=1)
+
+
+def screen_batch(symbols: np.ndarray, max_homopolymer: int, gc_dev: float) -> np.ndarray:
+    """
+    screen a batch of oligos at once, with the same constraints as screen_repeat
+    :param
+    symbols: (n, L) matrix of 2-bit symbols; type: np.ndarray
+    max_homopolymer: the largest homopolymer allowed; type: int
+    gc_dev: the allowable range of gc +- 50%; type: float
+
+    :return
+    reasons: bit flags of the violated constraints, 0 for oligos that passed; type: np.ndarray
+    """
+    reasons = np.zeros(len(symbols), dtype=np.uint8)
+    if len(symbols) == 0:
+        return reasons
+    reasons[max_run_length(symbols) > max_homopolymer] |= HOMOPOLYMER
+    gc = gc_count(symbols) / (symbols.shape[1] + 0.0)
+    reasons[(gc < 0.5 - gc_dev) | (gc > 0.5 + gc_dev)] |= GC_CONTENT
+    return reasons
+
+
+def screen_prefix(
+    symbols: np.ndarray, length: int, max_homopolymer: int, gc_dev: float
+) -> np.ndarray:
+    """
+    early reject on the first symbols of the oligos (seed and payload), before the RS parity is computed.
+    Only rejections that hold whatever the remaining symbols are get reported:
+    a homopolymer inside the prefix, or a gc content that cannot get back in range.
+    :param
+    symbols: (n, P) matrix of the 2-bit symbols of the prefix; type: np.ndarray
+    length: the number of symbols of the whole oligo; type: int
+    max_homopolymer: the largest homopolymer allowed; type: int
+    gc_dev: the allowable range of gc +- 50%; type: float
+
+    :return
+    reasons: bit flags of the violated constraints, 0 for oligos that may still pass; type: np.ndarray
+    """
+    reasons = np.zeros(len(symbols), dtype=np.uint8)
+    if len(symbols) == 0:
+        return reasons
+    reasons[max_run_length(symbols) > max_homopolymer] |= HOMOPOLYMER
+    gc = gc_count(symbols)
+    rest = length - symbols.shape[1]
+    low = (gc + rest) / (length + 0.0) < 0.5 - gc_dev
+    high = gc / (length + 0.0) > 0.5 + gc_dev
+    reasons[low | high] |= GC_CONTENT
+    return reasons
@@ -0,0 +1,229 @@
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+from reedsolo import RSCodec
+import numpy as np
+from .DNAFountain import DNAFountain
+from .droplet import block_header
+from .glass import Glass, clean_flags, correct_message
+from .misc import process_raw_input
+from .robust_solution import PRNG
+from . import checkpoint, metrics
+
+# number of bytes of the block id in the header of every oligo, in front of the seed
+BLOCK_ID_SIZE = struct.calcsize("!H")
+
+
+def block_ranges(num_chunks: int, block_chunks: int) -> List[Tuple[int, int]]:
+    """
+    split num_chunks chunks into blocks of at most block_chunks chunks.
+    The blocks get sizes differing by at most one, so the last block is never tiny.
+    :return
+    ranges: [start, stop) chunk numbers of every block; type: list
+    """
+    num_blocks = max(1, -(-num_chunks // block_chunks))
+    if num_blocks > 1 << (8 * BLOCK_ID_SIZE):
+        raise ValueError("{} blocks do not fit in the block id".format(num_blocks))
+    bounds = [b * num_chunks // num_blocks for b in range(num_blocks + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def block_fountains(
+    input_file: str, block_chunks: int, fountain_args: Dict[str, Any]
+) -> List[DNAFountain]:
+    """
+    one DNAFountain per block of the file, all reading the same memory mapped chunk store.
+    A given final number of oligos is shared between the blocks in proportion to their size.
+    Every block starts from the same lfsr_state / seed_index: for a top-up, that of the furthest block (Encoder logs it).
+    """
+    store, _ = process_raw_input(input_file, fountain_args["chunk_size"])
+    final = fountain_args.get("final")
+    fountains = []
+    for block, (start, stop) in enumerate(block_ranges(len(store), block_chunks)):
+        args = dict(fountain_args)
+        if final is not None:
+            args["final"] = -(-final * (stop - start) // len(store))
+        fountains.append(
+            DNAFountain(None, data_array=store.slice(start, stop), block=block, **args)
+        )
+    return fountains
+
+
+class SegmentedGlass:
+    """
+    Decoder state of a block-segmented file. Every block is an independent fountain code with its own Glass,
+    created when its first read arrives. A finished block is written to the output file at its offset
+    and its Glass is released, so memory grows with the number of blocks being decoded, not with the file.
+    It has the same parse_batch/add_record interface as Glass, the records start with the block id.
+    """
+
+    def __init__(
+        self,
+        num_chunks: int,
+        block_chunks: int,
+        output_file: str = None,
+        header_size=4,
+        rs=0,
+        c_dist=0.1,
+        delta=0.05,
+        gc=0.2,
+        max_hamming=100,
+        max_homopolymer=4,
+        prng_cache: str = None,
+        chunk_size: int = None,
+    ):
+        """
+        num_chunks: the total number of chunks in the file; type = int
+        block_chunks: the maximal number of chunks of a block; type = int
+        output_file: file the finished blocks are written to, None to only parse reads (e.g. in worker processes); type = str
+        header_size: number of bytes of the seed after the block id; type = int
+        """
+        self.num_chunks = num_chunks
+        self.ranges = block_ranges(num_chunks, block_chunks)
+        self.output_file = output_file
+        self.header_size = header_size
+        self.max_hamming = max_hamming
+        self.RSCodec = RSCodec(rs)
+        self.prng_cache = prng_cache
+        self.glass_args = dict(
+            header_size=header_size,
+            rs=rs,
+            c_dist=c_dist,
+            delta=delta,
+            gc=gc,
+            max_hamming=max_hamming,
+            max_homopolymer=max_homopolymer,
+            chunk_size=chunk_size,
+        )
+        # blocks of the same size share their degree distribution
+        self.prngs: Dict[int, PRNG] = dict()
+        self.blocks: Dict[int, Glass] = dict()
+        self.done = np.zeros(len(self.ranges), dtype=bool)
+        self.num_solved = 0
+
+        if output_file is not None:
+            # blocks are written at their offsets as soon as they are done, the blocks
+            # already written by a resumed decode are kept
+            open(output_file, "ab").close()
+
+    def _glass(self, block: int) -> Glass:
+        if block not in self.blocks:
+            start, stop = self.ranges[block]
+            K = stop - start
+            if K not in self.prngs:
+                self.prngs[K] = PRNG(
+                    K=K,
+                    delta=self.glass_args["delta"],
+                    c=self.glass_args["c_dist"],
+                    cache_dir=self.prng_cache,
+                )
+            self.blocks[block] = Glass(K, prng=self.prngs[K], **self.glass_args)
+        return self.blocks[block]
+
+    def parse_data(self, data: List[int], clean: bool = None) -> Optional[tuple]:
+        """
+        Glass.parse_data for a read of any block.
+        :return
+        None if the read could not be corrected or belongs to no pending block,
+        else the block id followed by the record of Glass.parse_data; type: tuple
+        """
+        data_corrected = correct_message(self.RSCodec, data, self.max_hamming, clean)
+        if data_corrected is None:
+            return None
+        header = int.from_bytes(bytes(data_corrected[:BLOCK_ID_SIZE]), "big")
+        seed = int.from_bytes(bytes(data_corrected[BLOCK_ID_SIZE : BLOCK_ID_SIZE + self.header_size]), "big")
+        block = block_header(header, seed)
+        if block >= len(self.ranges) or self.done[block]:
+            if metrics.ENABLED:
+                metrics.inc("reads_rejected_total", reason="block_done")
+            return None
+        return (block,) + self._glass(block).parse_message(data_corrected[BLOCK_ID_SIZE:])
+
+    def parse_batch(self, messages: List[Optional[List[int]]]) -> List[Optional[tuple]]:
+        return [
+            None if data is None else self.parse_data(data, flag)
+            for data, flag in zip(messages, clean_flags(self.RSCodec, messages))
+        ]
+
+    def add_record(
+        self, block: int, seed: int, payload: List[int], neighbours: List[int], screened: bool
+    ) -> int:
+        if self.done[block]:
+            return -1
+        glass = self._glass(block)
+        before = glass.chunks_done()
+        seed = glass.add_record(seed, payload, neighbours, screened)
+        self.num_solved += glass.chunks_done() - before
+        if glass.is_done():
+            self._finish(block)
+        return seed
+
+    def _finish(self, block: int) -> None:
+        glass = self.blocks.pop(block)
+        glass.save_cache()
+        self.done[block] = True
+        if self.output_file is None:
+            return
+        start, _ = self.ranges[block]
+        chunk_size = glass.chunks.shape[1]
+        with open(self.output_file, "r+b") as file:
+            file.seek(start * chunk_size)
+            file.write(memoryview(glass.flatten_chunks()))
+            if self.is_done():
+                # drop anything left over from an earlier, longer output file
+                file.truncate(self.num_chunks * chunk_size)
+
+    def solve(self) -> int:
+        """
+        Glass.solve for every pending block
+        """
+        solved = 0
+        for block in list(self.blocks):
+            glass = self.blocks[block]
+            count = glass.solve()
+            self.num_solved += count
+            solved += count
+            if glass.is_done():
+                self._finish(block)
+        return solved
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        Glass.state of every pending block, with the names prefixed by the block id, and the finished blocks
+        """
+        arrays = dict(
+            num_chunks=np.array(self.num_chunks, dtype=np.int64),
+            num_solved=np.array(self.num_solved, dtype=np.int64),
+            done=self.done,
+        )
+        for block, glass in self.blocks.items():
+            for name, a in glass.state().items():
+                arrays["{}/{}".format(block, name)] = a
+        return arrays
+
+    def restore(self, state: Dict[str, np.ndarray]) -> None:
+        if int(state["num_chunks"]) != self.num_chunks or len(state["done"]) != len(self.ranges):
+            raise ValueError("state of another block layout")
+        self.done = state["done"].astype(bool)
+        self.num_solved = int(state["num_solved"])
+        blocks = {int(name.split("/")[0]) for name in state if "/" in name}
+        for block in sorted(blocks):
+            self._glass(block).restore(checkpoint.prefixed(state, "{}/".format(block)))
+
+    def save_cache(self) -> None:
+        for glass in self.blocks.values():
+            glass.save_cache()
+
+    def is_done(self) -> bool:
+        return bool(self.done.all())
+
+    def chunks_done(self) -> int:
+        return self.num_solved
+
+    def pending_droplets(self) -> int:
+        return sum(glass.pending_droplets() for glass in self.blocks.values())
+
+    def memory_bytes(self) -> int:
+        return sum(glass.memory_bytes() for glass in self.blocks.values())
+
+    def blocks_done(self) -> int:
+        return int(np.count_nonzero(self.done))
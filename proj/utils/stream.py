@@ -0,0 +1,68 @@
+import asyncio
+import itertools
+from collections.abc import AsyncIterable
+from typing import AsyncIterator, Iterable, Iterator, List, TypeVar, Union
+import numpy as np
+
+# file name standing for stdin (input) or stdout (output)
+STDIO = "-"
+
+T = TypeVar("T")
+
+
+def read_chunks(file, chunk_size: int) -> np.ndarray:
+    """
+    all the bytes of a binary file object that cannot be memory mapped (stdin, a pipe)
+    as a zero padded (num_chunks, chunk_size) chunk matrix
+    """
+    data = file.read()
+    num_chunks = -(-len(data) // chunk_size)
+    chunks = np.zeros((num_chunks, chunk_size), dtype=np.uint8)
+    chunks.reshape(-1)[: len(data)] = np.frombuffer(data, dtype=np.uint8)
+    return chunks
+
+
+def batches(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    lists of size consecutive items, the last one shorter
+    """
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+async def abatches(items: Union[Iterable[T], AsyncIterable], size: int) -> AsyncIterator[List[T]]:
+    """
+    lists of size consecutive items of an iterable or an async iterable, the last one shorter.
+    Items are only pulled from the source when the consumer asks for the next batch.
+    """
+    if not isinstance(items, AsyncIterable):
+        for batch in batches(items, size):
+            yield batch
+        return
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def offload(items: Iterator[T], size: int) -> AsyncIterator[T]:
+    """
+    The items of a CPU bound iterator, computed size at a time in a worker thread so the event loop keeps running.
+    The next batch is only computed when the consumer is done with the current one, a slow consumer holds the
+    producer back (backpressure) and at most one batch is buffered.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = await loop.run_in_executor(None, list, itertools.islice(items, size))
+        if not batch:
+            return
+        for item in batch:
+            yield item
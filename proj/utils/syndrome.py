@@ -0,0 +1,58 @@
+from functools import lru_cache
+from typing import Tuple
+import numpy as np
+from reedsolo import RSCodec
+
+
+@lru_cache(maxsize=None)
+def gf_tables(prim: int = 0x11D) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    exponent and logarithm tables of GF(2^8) for the given primitive polynomial,
+    the exponent table is doubled so sums of two logarithms need no modulo
+    """
+    gf_exp = np.zeros(510, dtype=np.uint8)
+    gf_log = np.zeros(256, dtype=np.int64)
+    x = 1
+    for i in range(255):
+        gf_exp[i] = x
+        gf_log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= prim
+    gf_exp[255:] = gf_exp[:255]
+    return gf_exp, gf_log
+
+
+def syndromes(messages: np.ndarray, rs_obj: RSCodec) -> np.ndarray:
+    """
+    RS syndromes of a batch of codewords, the same values as reedsolo.rs_calc_syndromes without the leading 0
+    :param
+    messages: (n, L) uint8 matrix of codewords of the same length; type: np.ndarray
+    rs_obj: the codec the codewords were encoded with; type: RSCodec
+
+    :return
+    synd: (n, nsym) uint8 matrix, all zero rows are valid codewords; type: np.ndarray
+    """
+    messages = np.asarray(messages, dtype=np.uint8)
+    gf_exp, gf_log = gf_tables(rs_obj.prim)
+    n, width = messages.shape
+    synd = np.zeros((n, rs_obj.nsym), dtype=np.uint8)
+    if n == 0 or width == 0:
+        return synd
+    zero = messages == 0
+    log_m = gf_log[messages]
+    # Horner's evaluation at x = generator^(i + fcr): sum of m_k * x^(L - 1 - k)
+    powers = np.arange(width - 1, -1, -1, dtype=np.int64)
+    for i in range(rs_obj.nsym):
+        log_x = gf_log[rs_obj.generator] * (i + rs_obj.fcr) % 255
+        terms = gf_exp[(log_m + log_x * powers % 255) % 255]
+        terms[zero] = 0
+        synd[:, i] = np.bitwise_xor.reduce(terms, axis=1)
+    return synd
+
+
+def is_clean(messages: np.ndarray, rs_obj: RSCodec) -> np.ndarray:
+    """
+    whether every codeword of a batch has all zero syndromes, i.e. needs no correction
+    """
+    return ~syndromes(messages, rs_obj).any(axis=1)
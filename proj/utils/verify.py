@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import zlib
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from .misc import process_raw_input
+
+# bytes hashed or compared at a time, so files of any size are verified in constant memory
+BLOCK_SIZE = 1 << 22
+# record of a checksum file: CRC32 of a decoded chunk, and whether the chunk is solved yet
+CHECKSUM_DTYPE = np.dtype([("crc", "<u4"), ("solved", "u1")])
+
+
+def file_hash(path: str, size: int = None, start: int = 0, algorithm: str = "sha256", block_size: int = BLOCK_SIZE):
+    """
+    hashlib object fed with the size bytes of a file from start (all of them when None), block_size bytes at a time,
+    so more bytes can be hashed after them
+    """
+    digest = hashlib.new(algorithm)
+    left = os.path.getsize(path) - start if size is None else size
+    with open(path, "rb") as file:
+        file.seek(start)
+        while left > 0:
+            block = file.read(min(block_size, left))
+            if not block:
+                break
+            digest.update(block)
+            left -= len(block)
+    return digest
+
+
+def file_digest(path: str, size: int = None, algorithm: str = "sha256", block_size: int = BLOCK_SIZE) -> str:
+    """
+    hex digest of the first size bytes of a file (all of it when None), read block_size bytes at a time
+    """
+    return file_hash(path, size, algorithm=algorithm, block_size=block_size).hexdigest()
+
+
+def _map(path: str) -> np.ndarray:
+    # an empty file cannot be memory mapped
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def _add_range(ranges: List[Tuple[int, int]], start: int, stop: int) -> None:
+    # ranges that touch across two blocks are merged
+    if ranges and ranges[-1][1] == start:
+        ranges[-1] = (ranges[-1][0], stop)
+    else:
+        ranges.append((start, stop))
+
+
+def diff_ranges(path_a: str, path_b: str, block_size: int = BLOCK_SIZE) -> List[Tuple[int, int]]:
+    """
+    The [start, stop) byte ranges where two files differ, compared block_size bytes at a time on memory maps.
+    The bytes past the end of the shorter file are one differing range.
+    """
+    a = _map(path_a)
+    b = _map(path_b)
+    common = min(len(a), len(b))
+    ranges: List[Tuple[int, int]] = []
+    for start in range(0, common, block_size):
+        stop = min(start + block_size, common)
+        diff = a[start:stop] != b[start:stop]
+        if not diff.any():
+            continue
+        # the runs of differing bytes start and end where diff flips
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], diff, [False])).astype(np.int8)))
+        for lo, hi in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+            _add_range(ranges, start + lo, start + hi)
+    if len(a) != len(b):
+        _add_range(ranges, common, max(len(a), len(b)))
+    return ranges
+
+
+def ranges_to_chunks(ranges: List[Tuple[int, int]], chunk_size: int) -> np.ndarray:
+    """
+    sorted numbers of the chunks the byte ranges fall in
+    """
+    if not ranges:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(
+        np.concatenate([np.arange(start // chunk_size, (stop - 1) // chunk_size + 1) for start, stop in ranges])
+    )
+
+
+def _zero_padding(path: str, size: int, chunk_size: int) -> bool:
+    """
+    whether the file is size bytes followed by the zeros padding them to whole chunks, as the decoder writes them
+    """
+    padded = -(-size // chunk_size) * chunk_size
+    if os.path.getsize(path) != padded or padded == size:
+        return False
+    with open(path, "rb") as file:
+        file.seek(size)
+        return not any(file.read())
+
+
+def verify(origin_file: str, decode_file: str, chunk_size: int = None, block_size: int = BLOCK_SIZE) -> Dict[str, Any]:
+    """
+    Compare a decoded file with the original one, for any file format. Both files are hashed as streams;
+    only if the hashes differ are they compared byte by byte, to report the differing ranges.
+    :param
+    chunk_size: the chunk size of the code, to map the differing ranges to chunk numbers and to accept
+    the zero padding of the last chunk; None to compare the files as they are; type: int
+    :return
+    same, the sizes and digests of the files, the differing byte ranges and chunk numbers; type: dict
+    """
+    size = os.path.getsize(origin_file)
+    decoded_size = os.path.getsize(decode_file)
+    # the decoder writes whole chunks, only the bytes of the original file are compared
+    compared = decoded_size
+    if chunk_size is not None and _zero_padding(decode_file, size, chunk_size):
+        compared = size
+    origin_digest = file_digest(origin_file, block_size=block_size)
+    decode_digest = file_digest(decode_file, compared, block_size=block_size)
+    result = dict(
+        same=origin_digest == decode_digest and compared == size,
+        origin_size=size,
+        decode_size=decoded_size,
+        origin_sha256=origin_digest,
+        decode_sha256=decode_digest,
+        ranges=[],
+        chunks=[],
+    )
+    if result["same"]:
+        logging.info("No difference found between %s and %s", origin_file, decode_file)
+        return result
+    ranges = diff_ranges(origin_file, decode_file, block_size)
+    if compared == size:
+        # the padding is not a difference
+        ranges = [(start, min(stop, size)) for start, stop in ranges if start < size]
+    result["ranges"] = ranges
+    if chunk_size is not None:
+        result["chunks"] = ranges_to_chunks(ranges, chunk_size).tolist()
+    logging.error(
+        "%s differs from %s in %d bytes, %d ranges, first ones %s. Wrong chunks: %s",
+        decode_file,
+        origin_file,
+        sum(stop - start for start, stop in ranges),
+        len(ranges),
+        ranges[:10],
+        result["chunks"][:20],
+    )
+    return result
+
+
+def chunk_crcs(chunks: np.ndarray) -> np.ndarray:
+    """
+    CRC32 of every row of a (n, chunk_size) chunk matrix
+    """
+    return np.fromiter((zlib.crc32(row) for row in chunks), dtype=np.uint32, count=len(chunks))
+
+
+class ChecksumWriter:
+    """
+    Per chunk CRC32 of a decode in progress, in a .npy file of CHECKSUM_DTYPE records updated in place as
+    chunks are solved, so verify_checksums can check the solved chunks against the original file before
+    the decode is over.
+    """
+
+    def __init__(self, path: str, num_chunks: int):
+        self.path = path
+        self.records = np.lib.format.open_memmap(path, mode="w+", dtype=CHECKSUM_DTYPE, shape=(num_chunks,))
+        # number of solved chunks at the last update
+        self.written = 0
+
+    def update(self, glass) -> None:
+        """
+        write the checksums of the chunks of the glass solved since the last update
+        """
+        if glass.num_solved == self.written:
+            return
+        new = np.flatnonzero(glass.solved & (self.records["solved"] == 0))
+        self.records["crc"][new] = chunk_crcs(glass.chunks[new])
+        self.records["solved"][new] = 1
+        self.records.flush()
+        self.written = glass.num_solved
+
+
+def verify_checksums(origin_file: str, checksum_file: str, chunk_size: int, block_chunks: int = 1 << 16) -> Dict[str, Any]:
+    """
+    Check the solved chunks of a checksum file (ChecksumWriter) against the chunks of the original file,
+    block_chunks chunks at a time.
+    :return
+    number of chunks, number of solved chunks, and the numbers of the solved chunks that are wrong; type: dict
+    """
+    records = np.load(checksum_file, mmap_mode="r")
+    store, _ = process_raw_input(origin_file, chunk_size)
+    if len(records) != len(store):
+        raise ValueError(
+            "{} has {} chunks, {} has {}".format(checksum_file, len(records), origin_file, len(store))
+        )
+    solved = 0
+    wrong: List[int] = []
+    for start in range(0, len(store), block_chunks):
+        block = records[start : start + block_chunks]
+        done = np.flatnonzero(block["solved"])
+        solved += len(done)
+        crcs = chunk_crcs(store[done + start])
+        wrong.extend((done[crcs != block["crc"][done]] + start).tolist())
+    if wrong:
+        logging.error("%d of %d solved chunks are wrong, first ones %s", len(wrong), solved, wrong[:20])
+    return dict(chunks=len(store), solved=solved, wrong=wrong)